@@ -0,0 +1,96 @@
+"""Compare query plans of the zakaah hot queries with and without the zakaah indexes.
+
+Usage:
+	bench --site <site> execute techstation_zakaah.benchmarks.query_plans.run
+	bench --site <site> execute techstation_zakaah.benchmarks.query_plans.run --kwargs "{'reset': True}"
+
+With reset=True the zakaah indexes are dropped first so the "before" plans
+show the unindexed access paths; they are recreated for the "after" plans.
+"""
+
+import json
+
+import frappe
+
+from techstation_zakaah.zakaah_management.indexes import add_zakaah_indexes, drop_zakaah_indexes
+
+# Query shapes used by zakaah_payments.py and zakaah_allocation_history.py
+QUERIES = {
+	"allocated_per_journal_entry": (
+		"""
+		SELECT journal_entry, SUM(allocated_amount)
+		FROM `tabZakaah Allocation History`
+		WHERE journal_entry IN %(journal_entries)s
+		AND docstatus = 1
+		GROUP BY journal_entry
+	""",
+		{"journal_entries": ["ACC-JV-0001"]},
+	),
+	"allocated_per_run": (
+		"""
+		SELECT SUM(allocated_amount)
+		FROM `tabZakaah Allocation History`
+		WHERE zakaah_calculation_run = %(run)s
+		AND docstatus != 2
+	""",
+		{"run": "ZCR-0001"},
+	),
+	"unreconciled_runs": (
+		"""
+		SELECT name, fiscal_year, total_zakaah, paid_zakaah, outstanding_zakaah, status
+		FROM `tabZakaah Calculation Run`
+		WHERE company = %(company)s
+		AND outstanding_zakaah >= 1
+	""",
+		{"company": "_Test Company"},
+	),
+	"gold_price_on_date": (
+		"""
+		SELECT price_per_gram_24k
+		FROM `tabGold Price`
+		WHERE price_date <= %(date)s
+		ORDER BY price_date DESC
+		LIMIT 1
+	""",
+		{"date": "2024-12-31"},
+	),
+	"assets_configuration": (
+		"""
+		SELECT name
+		FROM `tabZakaah Assets Configuration`
+		WHERE company = %(company)s
+		AND fiscal_year = %(fiscal_year)s
+	""",
+		{"company": "_Test Company", "fiscal_year": "2024"},
+	),
+	"payment_account_debit_per_journal_entry": (
+		"""
+		SELECT voucher_no, SUM(debit)
+		FROM `tabGL Entry`
+		WHERE voucher_no IN %(journal_entries)s
+		AND account IN %(accounts)s
+		AND is_cancelled = 0
+		GROUP BY voucher_no
+	""",
+		{"journal_entries": ["ACC-JV-0001"], "accounts": ["Zakaa Liability - _TC"]},
+	),
+}
+
+
+def explain_queries():
+	return {
+		name: frappe.db.sql(f"EXPLAIN {query}", values, as_dict=True)
+		for name, (query, values) in QUERIES.items()
+	}
+
+
+def run(reset=False):
+	if reset:
+		drop_zakaah_indexes()
+
+	plans = {"before": explain_queries()}
+	add_zakaah_indexes()
+	plans["after"] = explain_queries()
+
+	print(json.dumps(plans, indent=1, default=str))
+	return plans
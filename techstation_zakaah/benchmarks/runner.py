@@ -0,0 +1,165 @@
+"""Time the zakaah hot paths against the synthetic ledger.
+
+Usage:
+	bench --site <site> execute techstation_zakaah.benchmarks.runner.run
+	bench --site <site> execute techstation_zakaah.benchmarks.runner.run \
+		--kwargs "{'scale': 'medium', 'repeat': 10, 'output': '/tmp/zakaah-bench.json'}"
+
+Reports p50/p95 wall time, queries per call and peak Python memory for each
+benchmark as JSON, so results of two commits can be diffed. Every call is
+rolled back afterwards, including the commit allocate_payments makes, so
+all repeats see the same data.
+"""
+
+import json
+import time
+import tracemalloc
+
+import frappe
+
+from techstation_zakaah.benchmarks import synthetic
+
+
+def run(scale="small", seed=42, repeat=5, output=None, generate=True, **overrides):
+	if generate:
+		dataset = synthetic.generate(scale=scale, seed=seed, **overrides)
+	else:
+		settings = synthetic.get_scale(scale, **overrides)
+		dataset = {
+			"seed": seed,
+			"settings": settings,
+			"fiscal_year": synthetic.ensure_fiscal_year(2024)[0],
+			"companies": [
+				get_company_dataset(synthetic.ensure_company(index)[0]) for index in range(settings["companies"])
+			],
+		}
+
+	company = dataset["companies"][0]
+	results = {
+		"seed": seed,
+		"settings": dataset["settings"],
+		"repeat": repeat,
+		"benchmarks": {
+			name: measure(fn, repeat)
+			for name, fn in get_benchmarks(company, dataset["fiscal_year"]).items()
+		},
+	}
+
+	report = json.dumps(results, indent=1, default=str)
+	if output:
+		with open(output, "w") as f:
+			f.write(report)
+	print(report)
+	return results
+
+
+def get_company_dataset(company):
+	from_date, to_date = synthetic.ensure_fiscal_year(2024)[1:]
+	return {
+		"company": company,
+		"from_date": str(from_date),
+		"to_date": str(to_date),
+		"payment_accounts": frappe.get_all(
+			"Account", filters={"company": company, "account_name": "Zakaa Liability"}, pluck="name"
+		),
+		"runs": frappe.get_all(
+			"Zakaah Calculation Run",
+			filters={"company": company, "name": ("like", f"{synthetic.PREFIX}%")},
+			pluck="name",
+		),
+	}
+
+
+def get_benchmarks(company, fiscal_year):
+	from techstation_zakaah.zakaah_management.doctype.zakaah_calculation_run.zakaah_calculation_run import (
+		get_zakaah_assets_config,
+	)
+	from techstation_zakaah.zakaah_management.doctype.zakaah_payments import zakaah_payments
+
+	def calculate_assets():
+		doc = frappe.new_doc("Zakaah Calculation Run")
+		doc.update({"company": company["company"], "fiscal_year": fiscal_year, "to_date": company["to_date"]})
+		doc.calculate_assets(get_zakaah_assets_config(company["company"], fiscal_year), company["company"])
+
+	def import_journal_entries():
+		return zakaah_payments.import_journal_entries(
+			company["company"], company["from_date"], company["to_date"], company["payment_accounts"]
+		)
+
+	def allocate_payments():
+		entries = import_journal_entries()["journal_entry_records"]
+		runs = [
+			{"zakaah_calculation_run": run.name, "outstanding_zakaah": run.outstanding_zakaah}
+			for run in zakaah_payments.get_calculation_runs(company["company"])
+		]
+		result = zakaah_payments.allocate_payments(runs, entries)
+		if not result.get("success"):
+			frappe.throw(result.get("message") or "allocate_payments failed")
+
+	return {
+		"calculate_assets": calculate_assets,
+		"import_journal_entries": import_journal_entries,
+		"allocate_payments": allocate_payments,
+		"get_calculation_runs": lambda: zakaah_payments.get_calculation_runs(company["company"]),
+		"get_allocation_history": zakaah_payments.get_allocation_history,
+	}
+
+
+def measure(fn, repeat):
+	"""Run fn repeat times, each in a transaction that is rolled back"""
+	timings, queries, peaks = [], [], []
+
+	for _i in range(repeat):
+		counter = QueryCounter()
+		tracemalloc.start()
+		start = time.perf_counter()
+		try:
+			with counter:
+				fn()
+		finally:
+			elapsed = time.perf_counter() - start
+			peaks.append(tracemalloc.get_traced_memory()[1])
+			tracemalloc.stop()
+			frappe.db.rollback()
+
+		timings.append(elapsed * 1000)
+		queries.append(counter.count)
+
+	return {
+		"p50_ms": round(percentile(timings, 50), 3),
+		"p95_ms": round(percentile(timings, 95), 3),
+		"min_ms": round(min(timings), 3),
+		"max_ms": round(max(timings), 3),
+		"queries": max(queries),
+		"peak_memory_kb": round(max(peaks) / 1024, 1),
+	}
+
+
+def percentile(values, pct):
+	"""Nearest-rank percentile"""
+	values = sorted(values)
+	rank = max(1, -(-len(values) * pct // 100))
+	return values[int(rank) - 1]
+
+
+class QueryCounter:
+	"""Count frappe.db.sql calls and hold back commits while active"""
+
+	def __init__(self):
+		self.count = 0
+
+	def __enter__(self):
+		self.sql = frappe.db.sql
+		self.commit = frappe.db.commit
+
+		def sql(*args, **kwargs):
+			self.count += 1
+			return self.sql(*args, **kwargs)
+
+		frappe.db.sql = sql
+		frappe.db.commit = lambda *args, **kwargs: None
+		return self
+
+	def __exit__(self, *exc):
+		frappe.db.sql = self.sql
+		frappe.db.commit = self.commit
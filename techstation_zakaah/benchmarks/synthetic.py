@@ -0,0 +1,447 @@
+"""Deterministic synthetic ledger for the zakaah benchmarks.
+
+Usage:
+	bench --site <site> execute techstation_zakaah.benchmarks.synthetic.generate --kwargs "{'scale': 'small'}"
+
+Creates benchmark companies with a small account tree, then bulk inserts GL
+Entries, submitted payment Journal Entries, submitted Zakaah Calculation
+Runs and Allocation History for them. Every generated row is named with
+the ZBENCH- prefix and is replaced on the next run with the same company,
+so the same seed always produces the same ledger. Use a benchmark site,
+the rows are written directly and skip ERPNext's validations.
+"""
+
+import random
+
+import frappe
+from frappe.utils import add_days, flt, getdate, now
+
+PREFIX = "ZBENCH-"
+
+SCALES = {
+	"small": {
+		"companies": 1,
+		"accounts": 5,
+		"gl_entries": 10000,
+		"journal_entries": 500,
+		"allocations": 1000,
+		"runs": 3,
+	},
+	"medium": {
+		"companies": 2,
+		"accounts": 20,
+		"gl_entries": 100000,
+		"journal_entries": 5000,
+		"allocations": 10000,
+		"runs": 5,
+	},
+	"large": {
+		"companies": 4,
+		"accounts": 50,
+		"gl_entries": 1000000,
+		"journal_entries": 50000,
+		"allocations": 100000,
+		"runs": 10,
+	},
+}
+
+# Account categories created under each company: (key, account name, root type)
+ACCOUNT_CATEGORIES = (
+	("cash_accounts", "Bench Cash", "Asset"),
+	("inventory_accounts", "Bench Inventory", "Asset"),
+	("receivable_accounts", "Bench Receivable", "Asset"),
+	("liabilities_accounts", "Bench Payable", "Liability"),
+	("reserve_accounts", "Bench Reserve", "Equity"),
+)
+
+
+def get_scale(scale="small", **overrides):
+	"""Get the generator settings for a named scale, with any setting overridden"""
+	if isinstance(scale, dict):
+		settings = dict(scale)
+	else:
+		settings = dict(SCALES[scale])
+	settings.update({key: value for key, value in overrides.items() if value is not None})
+	return settings
+
+
+def generate(scale="small", seed=42, year=2024, **overrides):
+	"""Generate the synthetic ledger and return the benchmark dataset description.
+
+	overrides replace single settings of the scale, e.g. gl_entries=50000.
+	"""
+	settings = get_scale(scale, **overrides)
+	rng = random.Random(seed)
+	fiscal_year, from_date, to_date = ensure_fiscal_year(year)
+
+	dataset = {"seed": seed, "settings": settings, "fiscal_year": fiscal_year, "companies": []}
+
+	for index in range(settings["companies"]):
+		company, abbr = ensure_company(index)
+		accounts = ensure_accounts(company, abbr, settings["accounts"])
+
+		clear_company_data(company)
+		insert_gl_entries(rng, company, fiscal_year, from_date, accounts, settings["gl_entries"], index)
+		journal_entries = insert_payment_journal_entries(
+			rng, company, fiscal_year, from_date, accounts, settings["journal_entries"], index
+		)
+		runs = insert_calculation_runs(company, fiscal_year, from_date, to_date, journal_entries, settings["runs"], index)
+		insert_allocation_history(rng, journal_entries, runs, settings["allocations"], index)
+
+		# Snapshots of the previous dataset describe a ledger that no longer exists
+		frappe.db.delete("Zakaah Balance Snapshot", {"company": company})
+		ensure_assets_configuration(company, fiscal_year, accounts)
+		frappe.db.commit()
+
+		dataset["companies"].append(
+			{
+				"company": company,
+				"from_date": str(from_date),
+				"to_date": str(to_date),
+				"payment_accounts": [accounts["payment_account"]],
+				"runs": [run["name"] for run in runs],
+			}
+		)
+
+	return dataset
+
+
+def ensure_fiscal_year(year):
+	from_date, to_date = getdate(f"{year}-01-01"), getdate(f"{year}-12-31")
+	name = frappe.db.get_value("Fiscal Year", {"year_start_date": from_date, "year_end_date": to_date})
+	if not name:
+		name = (
+			frappe.get_doc(
+				{"doctype": "Fiscal Year", "year": str(year), "year_start_date": from_date, "year_end_date": to_date}
+			)
+			.insert(ignore_permissions=True)
+			.name
+		)
+	return name, from_date, to_date
+
+
+def ensure_company(index):
+	company_name = f"Zakaah Bench {index + 1}"
+	abbr = f"ZB{index + 1}"
+	if not frappe.db.exists("Company", company_name):
+		frappe.get_doc(
+			{
+				"doctype": "Company",
+				"company_name": company_name,
+				"abbr": abbr,
+				"default_currency": "EGP",
+				"country": "Egypt",
+				"chart_of_accounts": "Standard",
+			}
+		).insert(ignore_permissions=True)
+	return company_name, frappe.db.get_value("Company", company_name, "abbr")
+
+
+def ensure_accounts(company, abbr, count):
+	"""Create a group per category with count ledger accounts under it, plus the payment and offset accounts"""
+	accounts = {}
+	for key, account_name, root_type in ACCOUNT_CATEGORIES:
+		group = ensure_account(company, abbr, f"{account_name} Group", get_root_account(company, root_type), 1)
+		accounts[key] = [
+			ensure_account(company, abbr, f"{account_name} {n + 1}", group, 0) for n in range(count)
+		]
+
+	accounts["payment_account"] = ensure_account(
+		company, abbr, "Zakaa Liability", get_root_account(company, "Liability"), 0
+	)
+	accounts["offset_account"] = ensure_account(
+		company, abbr, "Bench Capital", get_root_account(company, "Equity"), 0
+	)
+	return accounts
+
+
+def get_root_account(company, root_type):
+	return frappe.db.get_value(
+		"Account",
+		{"company": company, "root_type": root_type, "is_group": 1, "parent_account": ("is", "not set")},
+		"name",
+	)
+
+
+def ensure_account(company, abbr, account_name, parent_account, is_group):
+	name = f"{account_name} - {abbr}"
+	if not frappe.db.exists("Account", name):
+		frappe.get_doc(
+			{
+				"doctype": "Account",
+				"account_name": account_name,
+				"company": company,
+				"parent_account": parent_account,
+				"is_group": is_group,
+			}
+		).insert(ignore_permissions=True)
+	return name
+
+
+def clear_company_data(company):
+	"""Delete the rows a previous generate() created for the company"""
+	like = f"{PREFIX}%"
+	journal_entries = frappe.get_all(
+		"Journal Entry", filters={"company": company, "name": ("like", like)}, pluck="name"
+	)
+	for start in range(0, len(journal_entries), 1000):
+		chunk = journal_entries[start : start + 1000]
+		frappe.db.delete("Zakaah Allocation History", {"journal_entry": ("in", chunk)})
+		frappe.db.delete("Zakaah Journal Entry Allocation", {"name": ("in", chunk)})
+		frappe.db.delete("Journal Entry Account", {"parent": ("in", chunk)})
+
+	frappe.db.delete("Journal Entry", {"company": company, "name": ("like", like)})
+	frappe.db.delete("GL Entry", {"company": company, "voucher_no": ("like", like)})
+	frappe.db.delete("Zakaah Calculation Run", {"company": company, "name": ("like", like)})
+
+
+def get_standard_values(name):
+	timestamp = now()
+	return [name, timestamp, timestamp, "Administrator", "Administrator", 1]
+
+
+STANDARD_FIELDS = ["name", "creation", "modified", "owner", "modified_by", "docstatus"]
+
+GL_FIELDS = [
+	*STANDARD_FIELDS,
+	"company",
+	"posting_date",
+	"fiscal_year",
+	"account",
+	"account_currency",
+	"debit",
+	"credit",
+	"debit_in_account_currency",
+	"credit_in_account_currency",
+	"voucher_type",
+	"voucher_no",
+	"is_cancelled",
+	"is_opening",
+]
+
+
+def gl_row(name, company, posting_date, fiscal_year, account, debit, credit, voucher_no):
+	return [
+		*get_standard_values(name),
+		company,
+		posting_date,
+		fiscal_year,
+		account,
+		"EGP",
+		debit,
+		credit,
+		debit,
+		credit,
+		"Journal Entry",
+		voucher_no,
+		0,
+		"No",
+	]
+
+
+def insert_gl_entries(rng, company, fiscal_year, from_date, accounts, count, index):
+	"""Insert count GL Entries as balanced pairs between the category accounts and the offset account"""
+	ledger_accounts = [account for key, _name, _root in ACCOUNT_CATEGORIES for account in accounts[key]]
+	rows = []
+	for n in range(count // 2):
+		voucher_no = f"{PREFIX}GL-{index}-{n:08d}"
+		posting_date = add_days(from_date, rng.randrange(365))
+		account = rng.choice(ledger_accounts)
+		amount = flt(rng.uniform(100, 100000), 2)
+		rows.append(gl_row(f"{voucher_no}-1", company, posting_date, fiscal_year, account, amount, 0, voucher_no))
+		rows.append(
+			gl_row(
+				f"{voucher_no}-2", company, posting_date, fiscal_year, accounts["offset_account"], 0, amount, voucher_no
+			)
+		)
+
+	frappe.db.bulk_insert("GL Entry", GL_FIELDS, rows)
+
+
+def insert_payment_journal_entries(rng, company, fiscal_year, from_date, accounts, count, index):
+	"""Insert submitted Journal Entries paying from cash into the Zakaa Liability account"""
+	journal_entries, je_rows, jea_rows, gl_rows = [], [], [], []
+	for n in range(count):
+		name = f"{PREFIX}JV-{index}-{n:07d}"
+		posting_date = add_days(from_date, rng.randrange(365))
+		amount = flt(rng.uniform(1000, 50000), 2)
+		cash_account = rng.choice(accounts["cash_accounts"])
+
+		journal_entries.append({"name": name, "posting_date": posting_date, "debit": amount})
+		je_rows.append(
+			[*get_standard_values(name), company, posting_date, "Journal Entry", name, "Zakaah payment", amount, amount]
+		)
+		for idx, (account, debit, credit) in enumerate(
+			((accounts["payment_account"], amount, 0), (cash_account, 0, amount)), start=1
+		):
+			jea_rows.append(
+				[
+					*get_standard_values(f"{name}-{idx}"),
+					name,
+					"Journal Entry",
+					"accounts",
+					idx,
+					account,
+					"EGP",
+					1,
+					debit,
+					credit,
+					debit,
+					credit,
+				]
+			)
+			gl_rows.append(gl_row(f"{name}-{idx}", company, posting_date, fiscal_year, account, debit, credit, name))
+
+	frappe.db.bulk_insert(
+		"Journal Entry",
+		[
+			*STANDARD_FIELDS,
+			"company",
+			"posting_date",
+			"voucher_type",
+			"title",
+			"user_remark",
+			"total_debit",
+			"total_credit",
+		],
+		je_rows,
+	)
+	frappe.db.bulk_insert(
+		"Journal Entry Account",
+		[
+			*STANDARD_FIELDS,
+			"parent",
+			"parenttype",
+			"parentfield",
+			"idx",
+			"account",
+			"account_currency",
+			"exchange_rate",
+			"debit",
+			"credit",
+			"debit_in_account_currency",
+			"credit_in_account_currency",
+		],
+		jea_rows,
+	)
+	frappe.db.bulk_insert("GL Entry", GL_FIELDS, gl_rows)
+
+	return journal_entries
+
+
+def insert_calculation_runs(company, fiscal_year, from_date, to_date, journal_entries, count, index):
+	"""Insert submitted runs whose zakaah adds up to more than the payments, so some stays outstanding"""
+	total_zakaah = flt(sum(je["debit"] for je in journal_entries) * 1.2 / max(count, 1), 2)
+	runs = []
+	for n in range(count):
+		runs.append({"name": f"{PREFIX}ZCR-{index}-{n:04d}", "total_zakaah": total_zakaah, "paid_zakaah": 0.0})
+
+	frappe.db.bulk_insert(
+		"Zakaah Calculation Run",
+		[
+			*STANDARD_FIELDS,
+			"company",
+			"calendar_type",
+			"fiscal_year",
+			"from_date",
+			"to_date",
+			"owners_count",
+			"zakaah_rate",
+			"total_zakaah",
+			"paid_zakaah",
+			"outstanding_zakaah",
+			"status",
+		],
+		[
+			[
+				*get_standard_values(run["name"]),
+				company,
+				"Gregorian",
+				fiscal_year,
+				from_date,
+				to_date,
+				1,
+				2.5,
+				total_zakaah,
+				0,
+				total_zakaah,
+				"Calculated",
+			]
+			for run in runs
+		],
+	)
+	return runs
+
+
+def insert_allocation_history(rng, journal_entries, runs, count, index):
+	"""Insert count submitted allocations, never above a journal entry's debit or a run's zakaah"""
+	from techstation_zakaah.zakaah_management.doctype.zakaah_journal_entry_allocation.zakaah_journal_entry_allocation import (
+		update_journal_entry_allocations,
+	)
+	from techstation_zakaah.zakaah_management.doctype.zakaah_payments.zakaah_payments import (
+		update_calculation_run_totals,
+	)
+
+	if not journal_entries or not runs:
+		return
+
+	allocated = {}
+	rows = []
+	for n in range(count):
+		journal_entry = journal_entries[n % len(journal_entries)]
+		run = rng.choice(runs)
+		amount = flt(
+			min(
+				journal_entry["debit"] * rng.uniform(0.05, 0.3),
+				journal_entry["debit"] - allocated.get(journal_entry["name"], 0),
+				run["total_zakaah"] - run["paid_zakaah"],
+			),
+			2,
+		)
+		if amount <= 0:
+			continue
+
+		allocated[journal_entry["name"]] = allocated.get(journal_entry["name"], 0) + amount
+		run["paid_zakaah"] += amount
+		rows.append(
+			[
+				*get_standard_values(f"{PREFIX}ZAH-{index}-{n:08d}"),
+				journal_entry["name"],
+				run["name"],
+				amount,
+				flt(journal_entry["debit"] - allocated[journal_entry["name"]], 2),
+				now(),
+				"Administrator",
+			]
+		)
+
+	frappe.db.bulk_insert(
+		"Zakaah Allocation History",
+		[
+			*STANDARD_FIELDS,
+			"journal_entry",
+			"zakaah_calculation_run",
+			"allocated_amount",
+			"unallocated_amount",
+			"allocation_date",
+			"allocated_by",
+		],
+		rows,
+	)
+
+	names = list(allocated)
+	for start in range(0, len(names), 1000):
+		update_journal_entry_allocations(names[start : start + 1000])
+	update_calculation_run_totals([run["name"] for run in runs])
+
+
+def ensure_assets_configuration(company, fiscal_year, accounts):
+	if frappe.db.exists("Zakaah Assets Configuration", {"company": company, "fiscal_year": fiscal_year}):
+		return
+
+	doc = frappe.get_doc({"doctype": "Zakaah Assets Configuration", "company": company, "fiscal_year": fiscal_year})
+	for key, _name, _root in ACCOUNT_CATEGORIES:
+		for account in accounts[key]:
+			doc.append(key, {"account": account})
+	doc.append("payment_accounts", {"account": accounts["payment_account"]})
+	doc.insert(ignore_permissions=True)
@@ -0,0 +1,40 @@
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("calculate-zakaah")
+@click.option("--company", "companies", multiple=True, help="Company to calculate, all companies if omitted")
+@click.option("--fiscal-year", "fiscal_years", multiple=True, required=True, help="Fiscal Year to calculate")
+@click.option("--workers", type=int, default=4, show_default=True, help="Number of worker processes")
+@pass_context
+def calculate_zakaah(context, companies, fiscal_years, workers):
+	"Create or recalculate Zakaah Calculation Runs for many companies and fiscal years in parallel"
+	import frappe
+
+	from techstation_zakaah.zakaah_management.batch import calculate_runs
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		results = calculate_runs(site, companies, fiscal_years, workers=workers)
+	finally:
+		frappe.destroy()
+
+	for result in results:
+		line = f"{result['status']:<10} {result['seconds']:>9.3f}s  {result['company']} / {result['fiscal_year']}"
+		if result["run"]:
+			line += f"  {result['run']}"
+		if result["error"]:
+			line += f"  ({result['error']})"
+		click.echo(line)
+
+	failed = [r for r in results if r["status"] == "Failed"]
+	click.echo(
+		f"{len(results)} runs, {len(failed)} failed, {sum(r['seconds'] for r in results):.3f}s total run time"
+	)
+	if failed:
+		raise SystemExit(1)
+
+
+commands = [calculate_zakaah]
@@ -83,7 +83,7 @@ app_license = "mit"
 # ------------
 
 # before_install = "techstation_zakaah.install.before_install"
-# after_install = "techstation_zakaah.install.after_install"
+after_install = "techstation_zakaah.install.after_install"
 
 # Uninstallation
 # ------------
@@ -137,17 +137,23 @@ app_license = "mit"
 # ---------------
 # Hook on document methods and events
 
-# doc_events = {
-# 	"*": {
-# 		"on_update": "method",
-# 		"on_cancel": "method",
-# 		"on_trash": "method"
-# 	}
-# }
+doc_events = {
+	"Journal Entry": {
+		"on_cancel": "techstation_zakaah.zakaah_management.doctype.zakaah_journal_entry_allocation.zakaah_journal_entry_allocation.refresh_journal_entry_allocation"
+	}
+}
 
 # Scheduled Tasks
 # ---------------
 
+scheduler_events = {
+	"daily": [
+		"techstation_zakaah.zakaah_management.logger.prune_error_logs",
+		"techstation_zakaah.zakaah_management.doctype.zakaah_balance_snapshot.zakaah_balance_snapshot.build_balance_snapshots",
+		"techstation_zakaah.zakaah_management.doctype.zakaah_year_summary.zakaah_year_summary.refresh_year_summaries"
+	]
+}
+
 # scheduler_events = {
 # 	"all": [
 # 		"techstation_zakaah.tasks.all"
@@ -197,12 +203,12 @@ app_license = "mit"
 # Request Events
 # ----------------
 # before_request = ["techstation_zakaah.utils.before_request"]
-# after_request = ["techstation_zakaah.utils.after_request"]
+after_request = ["techstation_zakaah.zakaah_management.logger.flush"]
 
 # Job Events
 # ----------
 # before_job = ["techstation_zakaah.utils.before_job"]
-# after_job = ["techstation_zakaah.utils.after_job"]
+after_job = ["techstation_zakaah.zakaah_management.logger.flush"]
 
 # User Data Protection
 # --------------------
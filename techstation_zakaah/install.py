@@ -0,0 +1,6 @@
+from techstation_zakaah.zakaah_management.indexes import add_zakaah_indexes
+
+
+def after_install():
+	# Patches are marked as completed on install, so create the indexes here too
+	add_zakaah_indexes()
@@ -0,0 +1,5 @@
+from techstation_zakaah.zakaah_management.indexes import add_zakaah_indexes
+
+
+def execute():
+	add_zakaah_indexes()
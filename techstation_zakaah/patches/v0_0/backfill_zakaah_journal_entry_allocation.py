@@ -0,0 +1,19 @@
+import frappe
+
+from techstation_zakaah.zakaah_management.doctype.zakaah_journal_entry_allocation.zakaah_journal_entry_allocation import (
+	update_journal_entry_allocations,
+)
+
+
+def execute():
+	"""Build the allocation summary for journal entries allocated before it existed"""
+	journal_entries = frappe.db.sql_list(
+		"""
+		SELECT DISTINCT journal_entry
+		FROM `tabZakaah Allocation History`
+		WHERE docstatus != 2
+	"""
+	)
+
+	for i in range(0, len(journal_entries), 1000):
+		update_journal_entry_allocations(journal_entries[i : i + 1000])
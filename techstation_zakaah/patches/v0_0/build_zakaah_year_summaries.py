@@ -0,0 +1,8 @@
+from techstation_zakaah.zakaah_management.doctype.zakaah_year_summary.zakaah_year_summary import (
+	refresh_year_summaries,
+)
+
+
+def execute():
+	"""Build the year summaries of runs created before they existed"""
+	refresh_year_summaries()
@@ -0,0 +1,193 @@
+import frappe
+from frappe.utils import flt, getdate, nowdate
+
+from techstation_zakaah.zakaah_management.doctype.zakaah_balance_snapshot.zakaah_balance_snapshot import (
+	get_valid_snapshot_date,
+)
+
+
+def get_account_balances(accounts, date, company=None):
+	"""Get balances of many accounts as of date with grouped GL Entry aggregates.
+
+	Mirrors ERPNext's get_balance_on for every account: group accounts are
+	resolved through their lft/rgt descendants, Profit and Loss accounts are
+	limited to the fiscal year of the date, and the balance is returned in
+	account currency unless the account is a group in company currency.
+
+	When a company is given, Balance Sheet accounts start from the nearest
+	Zakaah Balance Snapshot the ledger has not moved past, and only GL
+	Entries posted after it are read. Snapshots are built for closed periods
+	by a daily job, reading balances never writes them.
+
+	Returns a dict of account -> signed balance. Accounts without GL Entries
+	are returned with a zero balance.
+	"""
+	accounts = list(dict.fromkeys(a for a in accounts or [] if a))
+	if not accounts:
+		return {}
+
+	balances = dict.fromkeys(accounts, 0.0)
+
+	year_start_date = get_year_start_date(date, company)
+	if not year_start_date:
+		# Date is older than any fiscal year, get_balance_on treats it as zero
+		return balances
+
+	from erpnext.accounts.utils import get_currency_precision
+
+	precision = get_currency_precision()
+	date = getdate(date)
+
+	account_details = frappe.get_all(
+		"Account",
+		filters={"name": ("in", accounts)},
+		fields=["name", "is_group", "report_type", "account_currency", "company"],
+	)
+
+	snapshot_date = get_valid_snapshot_date(company, date) if company else None
+
+	totals = {}
+	direct_accounts = accounts
+	if snapshot_date:
+		# Profit and Loss accounts reset every fiscal year, so they are never
+		# served from cumulative snapshots
+		snapshot_accounts = [d.name for d in account_details if d.report_type != "Profit and Loss"]
+		direct_accounts = [d.name for d in account_details if d.report_type == "Profit and Loss"]
+
+		if snapshot_accounts:
+			add_totals(totals, get_snapshot_totals(snapshot_accounts, company, snapshot_date))
+			if snapshot_date < date:
+				add_totals(
+					totals,
+					get_gl_totals(
+						snapshot_accounts, date, company, year_start_date, precision, after_date=snapshot_date
+					),
+				)
+
+	if direct_accounts:
+		add_totals(totals, get_gl_totals(direct_accounts, date, company, year_start_date, precision))
+
+	for account in account_details:
+		row = totals.get(account.name)
+		if not row:
+			continue
+
+		# Same currency rule as get_balance_on: a group in company currency is
+		# always summed in company currency, everything else in account currency
+		in_account_currency = not (
+			account.is_group
+			and account.account_currency
+			== frappe.get_cached_value("Company", account.company, "default_currency")
+		)
+		if in_account_currency:
+			balances[account.name] = flt(row["debit_in_account_currency"] - row["credit_in_account_currency"])
+		else:
+			balances[account.name] = flt(row["debit"] - row["credit"])
+
+	return balances
+
+
+def get_balance_currencies(accounts):
+	"""Get the currency get_account_balances returns the balance of each account in.
+
+	That is the account currency, which a group in company currency shares,
+	or the company currency when the account has none.
+	"""
+	accounts = list(dict.fromkeys(a for a in accounts or [] if a))
+	if not accounts:
+		return {}
+
+	return {
+		account.name: account.account_currency
+		or frappe.get_cached_value("Company", account.company, "default_currency")
+		for account in frappe.get_all(
+			"Account", filters={"name": ("in", accounts)}, fields=["name", "account_currency", "company"]
+		)
+	}
+
+
+def get_gl_totals(accounts, date, company, year_start_date, precision, after_date=None):
+	"""Sum GL Entries for each account and its descendants up to date"""
+	conditions = ""
+	if company:
+		conditions += " AND gle.company = %(company)s"
+	if after_date:
+		conditions += " AND gle.posting_date > %(after_date)s"
+
+	return frappe.db.sql(
+		f"""
+		SELECT
+			cfg.name AS account,
+			SUM(ROUND(gle.debit, %(precision)s)) AS debit,
+			SUM(ROUND(gle.credit, %(precision)s)) AS credit,
+			SUM(ROUND(gle.debit_in_account_currency, %(precision)s)) AS debit_in_account_currency,
+			SUM(ROUND(gle.credit_in_account_currency, %(precision)s)) AS credit_in_account_currency
+		FROM `tabAccount` cfg
+		INNER JOIN `tabAccount` ac ON ac.lft >= cfg.lft AND ac.rgt <= cfg.rgt
+		INNER JOIN `tabGL Entry` gle ON gle.account = ac.name
+		WHERE cfg.name IN %(accounts)s
+			AND gle.is_cancelled = 0
+			AND gle.posting_date <= %(date)s
+			AND (
+				cfg.report_type != 'Profit and Loss'
+				OR (gle.posting_date >= %(year_start_date)s AND gle.voucher_type != 'Period Closing Voucher')
+			)
+			{conditions}
+		GROUP BY cfg.name
+	""",
+		{
+			"accounts": accounts,
+			"date": date,
+			"company": company,
+			"after_date": after_date,
+			"year_start_date": year_start_date,
+			"precision": precision,
+		},
+		as_dict=True,
+	)
+
+
+def get_snapshot_totals(accounts, company, snapshot_date):
+	"""Sum snapshot closing balances for each account and its descendants"""
+	return frappe.db.sql(
+		"""
+		SELECT
+			cfg.name AS account,
+			SUM(snap.debit) AS debit,
+			SUM(snap.credit) AS credit,
+			SUM(snap.debit_in_account_currency) AS debit_in_account_currency,
+			SUM(snap.credit_in_account_currency) AS credit_in_account_currency
+		FROM `tabAccount` cfg
+		INNER JOIN `tabAccount` ac ON ac.lft >= cfg.lft AND ac.rgt <= cfg.rgt
+		INNER JOIN `tabZakaah Balance Snapshot` snap ON snap.account = ac.name
+		WHERE cfg.name IN %(accounts)s
+			AND snap.company = %(company)s
+			AND snap.period_end = %(snapshot_date)s
+		GROUP BY cfg.name
+	""",
+		{"accounts": accounts, "company": company, "snapshot_date": snapshot_date},
+		as_dict=True,
+	)
+
+
+def add_totals(totals, rows):
+	for row in rows:
+		total = totals.setdefault(
+			row.account,
+			{"debit": 0.0, "credit": 0.0, "debit_in_account_currency": 0.0, "credit_in_account_currency": 0.0},
+		)
+		for key in total:
+			total[key] += flt(row.get(key))
+
+
+def get_year_start_date(date, company=None):
+	"""Get the start of the fiscal year containing date, like get_balance_on does"""
+	from erpnext.accounts.utils import FiscalYearError, get_fiscal_year
+
+	date = date or nowdate()
+	try:
+		return get_fiscal_year(date, company=company, verbose=0)[1]
+	except FiscalYearError:
+		if getdate(date) > getdate(nowdate()):
+			return get_fiscal_year(nowdate(), verbose=1)[1]
+		return None
@@ -0,0 +1,144 @@
+import time
+
+import frappe
+from frappe import _
+
+from techstation_zakaah.zakaah_management.instrumentation import instrument
+from techstation_zakaah.zakaah_management.utils import parse_list
+
+
+def calculate_runs(site, companies=None, fiscal_years=None, workers=4, sites_path=None):
+	"""Calculate the Zakaah Calculation Run of every company and fiscal year in a process pool.
+
+	Each worker process opens its own connection to site and calculates one
+	(company, fiscal year) at a time. Existing draft runs are recalculated,
+	submitted runs are skipped, so the batch is safe to run again.
+
+	Returns one result dict per (company, fiscal year) with the run name,
+	status (Calculated, Skipped or Failed), seconds taken and error message.
+	"""
+	import multiprocessing
+	from concurrent.futures import ProcessPoolExecutor, as_completed
+
+	pairs = get_batch_pairs(companies, fiscal_years)
+	if not pairs:
+		return []
+
+	results = []
+	# Spawned workers start without the parent's database connection
+	with ProcessPoolExecutor(
+		max_workers=max(1, min(workers or 1, len(pairs))),
+		mp_context=multiprocessing.get_context("spawn"),
+		initializer=init_worker,
+		initargs=(site, sites_path or frappe.local.sites_path),
+	) as executor:
+		futures = [executor.submit(calculate_run, company, fiscal_year) for company, fiscal_year in pairs]
+		for future in as_completed(futures):
+			results.append(future.result())
+
+	return sorted(results, key=lambda r: (r["company"], r["fiscal_year"]))
+
+
+def init_worker(site, sites_path):
+	frappe.init(site=site, sites_path=sites_path)
+	frappe.connect()
+
+
+def get_batch_pairs(companies=None, fiscal_years=None):
+	"""Get the (company, fiscal year) pairs to calculate, all companies if none are given"""
+	companies = parse_list(companies) or frappe.get_all("Company", pluck="name", order_by="name")
+	fiscal_years = parse_list(fiscal_years)
+
+	for fiscal_year in fiscal_years:
+		if not frappe.db.exists("Fiscal Year", fiscal_year):
+			frappe.throw(_("Fiscal Year {0} does not exist").format(fiscal_year))
+
+	return [(company, fiscal_year) for company in companies for fiscal_year in fiscal_years]
+
+
+def calculate_run(company, fiscal_year):
+	"""Create or refresh the run for company and fiscal_year and calculate it, committing the result"""
+	from techstation_zakaah.zakaah_management.doctype.zakaah_calculation_run.zakaah_calculation_run import (
+		calculate_and_save,
+	)
+
+	result = {
+		"company": company,
+		"fiscal_year": fiscal_year,
+		"run": None,
+		"status": "Calculated",
+		"seconds": 0,
+		"error": None,
+	}
+	start = time.monotonic()
+
+	try:
+		doc = get_or_create_run(company, fiscal_year)
+		if doc.docstatus != 0:
+			result.update(run=doc.name, status="Skipped", error=_("Run is already submitted"))
+		else:
+			result["run"] = doc.name
+			calculate_and_save(doc)
+		frappe.db.commit()
+	except Exception as e:
+		frappe.db.rollback()
+		frappe.log_error(
+			title="Zakaah Batch Calculation",
+			message=f"Company: {company}\nFiscal Year: {fiscal_year}\n\n{frappe.get_traceback()}",
+		)
+		result.update(status="Failed", error=str(e))
+
+	result["seconds"] = round(time.monotonic() - start, 3)
+	return result
+
+
+def get_or_create_run(company, fiscal_year):
+	"""Get the latest non-cancelled run for company and fiscal_year, creating a draft if there is none"""
+	name = frappe.db.get_value(
+		"Zakaah Calculation Run",
+		{"company": company, "fiscal_year": fiscal_year, "docstatus": ("<", 2)},
+		"name",
+		order_by="docstatus desc, creation desc",
+	)
+	if name:
+		return frappe.get_doc("Zakaah Calculation Run", name)
+
+	doc = frappe.get_doc({"doctype": "Zakaah Calculation Run", "company": company, "fiscal_year": fiscal_year})
+	# Calculated right away by the batch, not by a queued job
+	doc.flags.in_zakaah_calculation = True
+	doc.insert()
+	return doc
+
+
+@frappe.whitelist()
+@instrument
+def enqueue_batch_calculation(companies=None, fiscal_years=None):
+	"""Queue one background calculation per company and fiscal year.
+
+	Results are published to the calling user as zakaah_batch_calculation
+	realtime events, one per run.
+	"""
+	frappe.has_permission("Zakaah Calculation Run", "create", throw=True)
+
+	job_ids = []
+	for company, fiscal_year in get_batch_pairs(companies, fiscal_years):
+		job_id = f"zakaah_batch_calculation::{company}::{fiscal_year}"
+		frappe.enqueue(
+			"techstation_zakaah.zakaah_management.batch.run_batch_calculation_job",
+			queue="long",
+			timeout=3600,
+			job_id=job_id,
+			deduplicate=True,
+			company=company,
+			fiscal_year=fiscal_year,
+			user=frappe.session.user,
+		)
+		job_ids.append(job_id)
+
+	return {"job_ids": job_ids}
+
+
+def run_batch_calculation_job(company, fiscal_year, user=None):
+	result = calculate_run(company, fiscal_year)
+	frappe.publish_realtime("zakaah_batch_calculation", result, user=user)
+	return result
@@ -0,0 +1,86 @@
+"""Asset categories of the zakaah calculation.
+
+Each category maps an account table of Zakaah Assets Configuration to the
+total it feeds on Zakaah Calculation Run. sign is 1 for assets and -1 for
+amounts deducted from them. Adding a category takes a new entry here, its
+account table on the configuration, its balance field on the run and its
+label in the asset_category options of Zakaah Calculation Run Item. Its
+accounts are then resolved in the same balance query as all the others.
+"""
+
+import frappe
+from frappe.utils import flt
+
+ASSET_CATEGORIES = (
+	frappe._dict(key="cash", table="cash_accounts", sign=1, label="Cash", field="cash_balance"),
+	frappe._dict(
+		key="inventory", table="inventory_accounts", sign=1, label="Inventory", field="inventory_balance"
+	),
+	frappe._dict(
+		key="receivables", table="receivable_accounts", sign=1, label="Receivables", field="receivables"
+	),
+	frappe._dict(
+		key="liabilities", table="liabilities_accounts", sign=-1, label="Liabilities", field="liabilities"
+	),
+	frappe._dict(key="reserves", table="reserve_accounts", sign=1, label="Reserves", field="reserves"),
+)
+
+BALANCE_TABLES = tuple(category.table for category in ASSET_CATEGORIES)
+
+
+def get_category_accounts(config):
+	"""Get the distinct accounts of every category table of a configuration dict or document"""
+	return list(
+		dict.fromkeys(
+			row.get("account") for table in BALANCE_TABLES for row in config.get(table) or [] if row.get("account")
+		)
+	)
+
+
+def get_category_totals(config, balances, currencies=None, rates=None, progress=None):
+	"""Total the balances of every category and build the run items of accounts with a balance.
+
+	balances maps account -> absolute balance in the currency given for the
+	account by currencies, and rates maps each currency to its rate into the
+	company currency. Balances without a currency or rate are taken as
+	company currency. Returns (totals, items): totals are in company currency
+	and hold one entry per category key and total_in_egp, the signed sum of
+	all categories. progress is called with each category once it is
+	totalled.
+	"""
+	currencies = currencies or {}
+	rates = rates or {}
+
+	totals = {category.key: 0 for category in ASSET_CATEGORIES}
+	items = []
+
+	for category in ASSET_CATEGORIES:
+		for row in config.get(category.table) or []:
+			account = row.get("account")
+			if not account:
+				continue
+
+			balance = flt(balances.get(account))
+			currency = currencies.get(account)
+			exchange_rate = flt(rates.get(currency, 1))
+			sub_total = flt(balance * exchange_rate)
+			totals[category.key] += sub_total
+
+			if balance > 0:
+				items.append(
+					{
+						"asset_category": category.label,
+						"account": account,
+						"balance": balance,
+						"currency": currency,
+						"exchange_rate": exchange_rate,
+						"sub_total": sub_total,
+					}
+				)
+
+		if progress:
+			progress(category)
+
+	totals["total_in_egp"] = sum(category.sign * totals[category.key] for category in ASSET_CATEGORIES)
+
+	return totals, items
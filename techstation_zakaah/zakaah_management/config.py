@@ -0,0 +1,110 @@
+import frappe
+
+from techstation_zakaah.zakaah_management.categories import BALANCE_TABLES
+
+CONFIG_CACHE_KEY = "zakaah_assets_config"
+PAYMENT_ACCOUNTS_CACHE_KEY = "zakaah_payment_accounts"
+
+ACCOUNT_TABLES = (*BALANCE_TABLES, "payment_accounts")
+
+ACCOUNT_FIELDS = (
+	"account",
+	"account_name",
+	"balance",
+	"debit",
+	"calculation_method",
+	"debt_type",
+	"include_deposits",
+	"deduct_from_assets",
+)
+
+
+def get_resolved_config(company, fiscal_year=None):
+	"""Get the Zakaah Assets Configuration that applies to company and fiscal_year.
+
+	Falls back to a configuration of the company without the fiscal year, then
+	to any configuration. The result is a plain dict with the configuration
+	name, how it was resolved (resolved_by is "fiscal_year", "company",
+	"default" or None when nothing matched) and one list of account dicts per
+	account table.
+
+	Results are kept in the redis cache until any configuration changes, and
+	frappe.cache.hget memoises them for the rest of the request, so repeated
+	lookups make no queries. Treat the returned dict as read-only.
+	"""
+	return frappe.cache.hget(
+		CONFIG_CACHE_KEY,
+		f"{company}::{fiscal_year or ''}",
+		generator=lambda: _resolve_config(company, fiscal_year),
+	)
+
+
+def _resolve_config(company, fiscal_year=None):
+	name, resolved_by = None, None
+	if fiscal_year:
+		name = frappe.db.get_value("Zakaah Assets Configuration", {"company": company, "fiscal_year": fiscal_year})
+		resolved_by = "fiscal_year"
+	if not name:
+		name = frappe.db.get_value("Zakaah Assets Configuration", {"company": company})
+		resolved_by = "company"
+	if not name:
+		name = frappe.db.get_value("Zakaah Assets Configuration", {})
+		resolved_by = "default"
+	if not name:
+		return {"name": None, "resolved_by": None, **{table: [] for table in ACCOUNT_TABLES}}
+
+	doc = frappe.get_doc("Zakaah Assets Configuration", name)
+	config = {
+		"name": doc.name,
+		"company": doc.company,
+		"fiscal_year": doc.fiscal_year,
+		"resolved_by": resolved_by,
+	}
+	for table in ACCOUNT_TABLES:
+		config[table] = [
+			frappe._dict({field: row.get(field) for field in ACCOUNT_FIELDS})
+			for row in doc.get(table) or []
+		]
+
+	return config
+
+
+def get_payment_accounts(company):
+	"""Get the distinct payment accounts of every configuration of the company, cached per company"""
+	return frappe.cache.hget(
+		PAYMENT_ACCOUNTS_CACHE_KEY,
+		company,
+		generator=lambda: _get_payment_accounts(company),
+	)
+
+
+def _get_payment_accounts(company):
+	rows = frappe.db.sql("""
+		SELECT
+			pa.account,
+			COALESCE(NULLIF(pa.account_name, ''), acc.account_name) AS account_name
+		FROM `tabZakaah Account Configuration` pa
+		INNER JOIN `tabZakaah Assets Configuration` cfg ON cfg.name = pa.parent
+		LEFT JOIN `tabAccount` acc ON acc.name = pa.account
+		WHERE pa.parenttype = 'Zakaah Assets Configuration'
+			AND pa.parentfield = 'payment_accounts'
+			AND cfg.company = %s
+			AND IFNULL(pa.account, '') != ''
+		ORDER BY cfg.modified DESC, pa.idx
+	""", company, as_dict=True)
+
+	accounts = {}
+	for row in rows:
+		accounts.setdefault(row.account, {"account": row.account, "account_name": row.account_name})
+
+	return list(accounts.values())
+
+
+def clear_config_cache():
+	"""Drop every cached configuration.
+
+	Configurations of one company can be the fallback of another, so the whole
+	cache is cleared whenever any configuration changes.
+	"""
+	frappe.cache.delete_key(CONFIG_CACHE_KEY)
+	frappe.cache.delete_key(PAYMENT_ACCOUNTS_CACHE_KEY)
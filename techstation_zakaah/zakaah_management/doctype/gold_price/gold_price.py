@@ -2,6 +2,8 @@
 from __future__ import unicode_literals
 from frappe.model.document import Document
 import frappe
+from techstation_zakaah.zakaah_management.gold_prices import clear_gold_price_cache, get_gold_price
+from techstation_zakaah.zakaah_management.instrumentation import instrument
 
 class GoldPrice(Document):
     def validate(self):
@@ -12,17 +14,22 @@ class GoldPrice(Document):
         # Ensure price is manually entered
         if not self.price_per_gram_24k:
             frappe.throw("Please enter the gold price manually")
+    
+    def on_update(self):
+        clear_gold_price_cache()
+    
+    def on_trash(self):
+        clear_gold_price_cache()
 
 @frappe.whitelist()
+@instrument
 def get_gold_price_for_date(date):
     """Get gold price for a specific date from database only (manual entry)
     
     Returns None if price not found in database
     """
-    # Check if exists in DB
-    existing = frappe.db.exists("Gold Price", {"price_date": date})
-    if existing:
-        return frappe.db.get_value("Gold Price", existing, "price_per_gram_24k")
+    # Exact date only, from the cached gold price series
+    price_date, price = get_gold_price(date, exact=True)
     
     # Return None if not found (no automatic fetching)
-    return None
+    return price
@@ -0,0 +1,27 @@
+frappe.listview_settings['Gold Price'] = {
+    onload: function(listview) {
+        // Bulk import of daily prices from a CSV with price_date and price_per_gram_24k columns
+        listview.page.add_inner_button(__('Import Prices from CSV'), function() {
+            new frappe.ui.FileUploader({
+                restrictions: { allowed_file_types: ['.csv'] },
+                on_success: function(file) {
+                    frappe.call({
+                        method: 'techstation_zakaah.zakaah_management.gold_prices.import_gold_prices',
+                        args: { file_url: file.file_url },
+                        freeze: true,
+                        freeze_message: __('Importing gold prices...'),
+                        callback: function(r) {
+                            if (r.message) {
+                                frappe.show_alert({
+                                    message: __('Imported {0} gold prices', [r.message.imported]),
+                                    indicator: 'green'
+                                }, 5);
+                                listview.refresh();
+                            }
+                        }
+                    });
+                }
+            });
+        });
+    }
+};
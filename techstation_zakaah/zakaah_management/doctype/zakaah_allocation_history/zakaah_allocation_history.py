@@ -4,6 +4,13 @@ from frappe.model.document import Document
 import frappe
 from frappe import _
 from frappe.utils import flt
+from techstation_zakaah.zakaah_management.doctype.zakaah_journal_entry_allocation.zakaah_journal_entry_allocation import (
+	get_journal_entry_allocation,
+	update_journal_entry_allocations
+)
+from techstation_zakaah.zakaah_management.doctype.zakaah_payments.zakaah_payments import update_calculation_run_totals
+from techstation_zakaah.zakaah_management.doctype.zakaah_year_summary.zakaah_year_summary import refresh_year_summaries
+from techstation_zakaah.zakaah_management.instrumentation import instrument
 
 class ZakaahAllocationHistory(Document):
 	def before_insert(self):
@@ -40,30 +47,17 @@ class ZakaahAllocationHistory(Document):
 		if not self.journal_entry:
 			return
 
-		# Get total journal entry amount from GL Entry
-		je_amount = frappe.db.sql("""
-			SELECT SUM(debit) as total_debit
-			FROM `tabJournal Entry Account` jea
-			WHERE jea.parent = %s
-		""", self.journal_entry, as_dict=True)
-
-		total_je_amount = je_amount[0].total_debit if je_amount and je_amount[0].total_debit else 0
-
-		# Get total already allocated (excluding this record if updating)
-		allocated_query = """
-			SELECT SUM(allocated_amount) as total_allocated
-			FROM `tabZakaah Allocation History`
-			WHERE journal_entry = %s
-			AND docstatus != 2
-		"""
-
-		params = [self.journal_entry]
+		# Get journal entry amount and draft and submitted allocations from the
+		# allocation summary, which already counts this record once it is saved
+		summary = get_journal_entry_allocation(self.journal_entry)
+		total_je_amount = summary.total_debit
+		total_allocated = summary.total_allocated
 		if not self.is_new():
-			allocated_query += " AND name != %s"
-			params.append(self.name)
-
-		already_allocated = frappe.db.sql(allocated_query, params, as_dict=True)
-		total_allocated = already_allocated[0].total_allocated if already_allocated and already_allocated[0].total_allocated else 0
+			total_allocated -= flt(frappe.db.get_value(
+				"Zakaah Allocation History",
+				{"name": self.name, "journal_entry": self.journal_entry, "docstatus": ("<", 2)},
+				"allocated_amount"
+			))
 
 		# Check if new allocation would exceed journal entry amount
 		if flt(total_allocated) + flt(self.allocated_amount) > flt(total_je_amount):
@@ -77,83 +71,47 @@ class ZakaahAllocationHistory(Document):
 				self.allocated_amount
 			))
 
+	def on_update(self):
+		"""Count draft allocations in the journal entry summary and the run totals"""
+		update_journal_entry_allocations([self.journal_entry])
+		update_calculation_run_totals([self.zakaah_calculation_run])
+
+	def after_delete(self):
+		update_journal_entry_allocations([self.journal_entry])
+		update_calculation_run_totals([self.zakaah_calculation_run])
+
 	def on_submit(self):
 		"""Update calculation run outstanding amount when submitted"""
-		self.update_calculation_run_status()
+		update_journal_entry_allocations([self.journal_entry])
+		update_calculation_run_totals([self.zakaah_calculation_run])
+		refresh_year_summaries([self.zakaah_calculation_run])
 
 	def on_cancel(self):
 		"""Reverse calculation run updates when cancelled"""
-		self.update_calculation_run_status(reverse=True)
-
-	def update_calculation_run_status(self, reverse=False):
-		"""Update the Zakaah Calculation Run's paid and outstanding amounts"""
-		if not self.zakaah_calculation_run:
-			return
-
-		try:
-			calc_run = frappe.get_doc("Zakaah Calculation Run", self.zakaah_calculation_run)
-
-			# Get total allocated for this calculation run
-			total_allocated = frappe.db.sql("""
-				SELECT SUM(allocated_amount) as total
-				FROM `tabZakaah Allocation History`
-				WHERE zakaah_calculation_run = %s
-				AND docstatus = 1
-			""", self.zakaah_calculation_run, as_dict=True)
-
-			total_paid = total_allocated[0].total if total_allocated and total_allocated[0].total else 0
-
-			# Update calculation run
-			calc_run.db_set('paid_zakaah', total_paid)
-			calc_run.db_set('outstanding_zakaah', flt(calc_run.total_zakaah) - flt(total_paid))
-
-			# Update status
-			if flt(calc_run.outstanding_zakaah) <= 0:
-				calc_run.db_set('status', 'Paid')
-			elif flt(calc_run.paid_zakaah) > 0:
-				calc_run.db_set('status', 'Partially Paid')
-			else:
-				calc_run.db_set('status', 'Calculated')
-
-		except Exception as e:
-			frappe.log_error(f"Error updating calculation run status: {str(e)}", "Allocation History Update Error")
+		update_journal_entry_allocations([self.journal_entry])
+		update_calculation_run_totals([self.zakaah_calculation_run])
+		refresh_year_summaries([self.zakaah_calculation_run])
 
 
 @frappe.whitelist()
+@instrument
 def get_journal_entry_unallocated(journal_entry, exclude_allocation=None):
 	"""Get unallocated amount for a journal entry"""
-	from frappe.utils import flt
-
-	# Get total journal entry amount
-	je_amount = frappe.db.sql("""
-		SELECT SUM(debit) as total_debit
-		FROM `tabJournal Entry Account`
-		WHERE parent = %s
-	""", journal_entry, as_dict=True)
-
-	total_amount = flt(je_amount[0].total_debit) if je_amount and je_amount[0].total_debit else 0
-
-	# Get already allocated amount
-	allocated_query = """
-		SELECT SUM(allocated_amount) as total_allocated
-		FROM `tabZakaah Allocation History`
-		WHERE journal_entry = %s
-		AND docstatus != 2
-	"""
-
-	params = [journal_entry]
-	if exclude_allocation:
-		allocated_query += " AND name != %s"
-		params.append(exclude_allocation)
+	summary = get_journal_entry_allocation(journal_entry)
+	total_amount = summary.total_debit
+	already_allocated = summary.total_allocated
 
-	allocated = frappe.db.sql(allocated_query, params, as_dict=True)
-	already_allocated = flt(allocated[0].total_allocated) if allocated and allocated[0].total_allocated else 0
+	# The summary holds draft and submitted allocations
+	if exclude_allocation:
+		excluded = frappe.db.get_value(
+			"Zakaah Allocation History",
+			{"name": exclude_allocation, "journal_entry": journal_entry, "docstatus": ("<", 2)},
+			"allocated_amount"
+		)
+		already_allocated -= flt(excluded)
 
 	return {
 		'total_amount': total_amount,
 		'already_allocated': already_allocated,
 		'unallocated': flt(total_amount) - flt(already_allocated)
 	}
-
-
-
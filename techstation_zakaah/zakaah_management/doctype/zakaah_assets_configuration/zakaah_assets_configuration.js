@@ -33,14 +33,24 @@ frappe.ui.form.on("Zakaah Assets Configuration", {
 	}
 });
 
-// Cash Accounts Child Table
+const ACCOUNT_TABLES = ['cash_accounts', 'inventory_accounts', 'receivable_accounts',
+	'liabilities_accounts', 'reserve_accounts', 'payment_accounts'];
+
+// Account Child Tables
 frappe.ui.form.on("Zakaah Account Configuration", {
 	account: function(frm, cdt, cdn) {
 		let row = locals[cdt][cdn];
 
-		// Auto-calculate balance when account is selected
-		if (row.account && row.parentfield === 'cash_accounts') {
-			calculate_account_balance(frm, row);
+		// Auto-calculate balance (or debit for payment accounts) when account is selected
+		if (row.account && ACCOUNT_TABLES.includes(row.parentfield)) {
+			calculate_balances(frm, [row], function() {
+				frappe.show_alert({
+					message: row.parentfield === 'payment_accounts'
+						? __("Debit amount updated: {0}", [format_currency(row.debit)])
+						: __("Balance updated: {0}", [format_currency(row.balance)]),
+					indicator: "green"
+				}, 3);
+			});
 		}
 	},
 
@@ -52,194 +62,38 @@ frappe.ui.form.on("Zakaah Account Configuration", {
 	}
 });
 
-// Inventory Accounts Child Table
-frappe.ui.form.on("Zakaah Account Configuration", {
-	account: function(frm, cdt, cdn) {
-		let row = locals[cdt][cdn];
-
-		if (row.account && row.parentfield === 'inventory_accounts') {
-			calculate_account_balance(frm, row);
-		}
-	}
-});
-
-// Receivable Accounts Child Table
-frappe.ui.form.on("Zakaah Account Configuration", {
-	account: function(frm, cdt, cdn) {
-		let row = locals[cdt][cdn];
-
-		if (row.account && row.parentfield === 'receivable_accounts') {
-			calculate_account_balance(frm, row);
-		}
-	}
-});
-
-// Liability Accounts Child Table
-frappe.ui.form.on("Zakaah Account Configuration", {
-	account: function(frm, cdt, cdn) {
-		let row = locals[cdt][cdn];
-
-		if (row.account && row.parentfield === 'liability_accounts') {
-			calculate_account_balance(frm, row);
-		}
-	}
-});
-
-// Reserve Accounts Child Table
-frappe.ui.form.on("Zakaah Account Configuration", {
-	account: function(frm, cdt, cdn) {
-		let row = locals[cdt][cdn];
-
-		if (row.account && row.parentfield === 'reserve_accounts') {
-			calculate_account_balance(frm, row);
-		}
-	}
-});
-
-// Payment Accounts Child Table
-frappe.ui.form.on("Zakaah Account Configuration", {
-	account: function(frm, cdt, cdn) {
-		let row = locals[cdt][cdn];
-
-		if (row.account && row.parentfield === 'payment_accounts') {
-			// If fiscal year is selected, use its date range
-			if (frm.doc.fiscal_year) {
-				frappe.call({
-					method: 'frappe.client.get_value',
-					args: {
-						doctype: 'Fiscal Year',
-						filters: { name: frm.doc.fiscal_year },
-						fieldname: ['year_start_date', 'year_end_date']
-					},
-					callback: function(r) {
-						if (r.message && r.message.year_end_date) {
-							// Use fiscal year range (BETWEEN start and end)
-							calculate_payment_account_debit_for_fy_range(frm, row, r.message.year_start_date, r.message.year_end_date);
-						} else {
-							calculate_payment_account_debit(frm, row);
-						}
-					}
-				});
-			} else {
-				calculate_payment_account_debit(frm, row);
-			}
-		}
-	}
-});
-
 // Helper Functions
 
-function calculate_account_balance(frm, row) {
-	if (!row.account) return;
+function calculate_balances(frm, rows, callback) {
+	// Balances and payment account debits of all rows come from one call,
+	// as of the fiscal year end (or today without a fiscal year)
+	rows = rows.filter(row => row.account);
+	if (!rows.length) return;
 
-	frappe.call({
-		method: 'erpnext.accounts.utils.get_balance_on',
-		args: {
-			account: row.account,
-			date: frappe.datetime.get_today()
-		},
-		callback: function(r) {
-			if (r.message) {
-				frappe.model.set_value(row.doctype, row.name, 'balance', r.message);
-				frappe.show_alert({
-					message: __("Balance updated: {0}", [format_currency(r.message)]),
-					indicator: "green"
-				}, 3);
-			}
-		}
+	let accounts = {};
+	rows.forEach(row => {
+		(accounts[row.parentfield] = accounts[row.parentfield] || []).push(row.account);
 	});
-}
-
-function calculate_account_balance_for_date(frm, row, date) {
-	if (!row.account) return;
 
 	frappe.call({
-		method: 'erpnext.accounts.utils.get_balance_on',
+		method: 'techstation_zakaah.zakaah_management.doctype.zakaah_assets_configuration.zakaah_assets_configuration.get_configuration_balances',
 		args: {
-			account: row.account,
-			date: date
+			company: frm.doc.company,
+			fiscal_year: frm.doc.fiscal_year,
+			accounts: accounts
 		},
 		callback: function(r) {
-			if (r.message) {
-				frappe.model.set_value(row.doctype, row.name, 'balance', r.message);
-			}
-		}
-	});
-}
-
-function calculate_payment_account_debit(frm, row) {
-	if (!row.account) return;
+			if (!r.message) return;
 
-	// For payment accounts, we need GL Entry debit, not balance
-	frappe.call({
-		method: 'frappe.client.get_list',
-		args: {
-			doctype: 'GL Entry',
-			filters: {
-				account: row.account,
-				company: frm.doc.company
-			},
-			fields: ['sum(debit) as total_debit'],
-		},
-		callback: function(r) {
-			if (r.message && r.message.length > 0) {
-				let debit = r.message[0].total_debit || 0;
-				frappe.model.set_value(row.doctype, row.name, 'debit', debit);
-				frappe.show_alert({
-					message: __("Debit amount updated: {0}", [format_currency(debit)]),
-					indicator: "green"
-				}, 3);
-			}
-		}
-	});
-}
-
-function calculate_payment_account_debit_for_date(frm, row, date) {
-	if (!row.account) return;
-
-	// For payment accounts, we need GL Entry debit up to the date, not balance
-	frappe.call({
-		method: 'frappe.client.get_list',
-		args: {
-			doctype: 'GL Entry',
-			filters: {
-				account: row.account,
-				company: frm.doc.company,
-				posting_date: ['<=', date]
-			},
-			fields: ['sum(debit) as total_debit'],
-		},
-		callback: function(r) {
-			if (r.message && r.message.length > 0) {
-				let debit = r.message[0].total_debit || 0;
-				frappe.model.set_value(row.doctype, row.name, 'debit', debit);
-			}
-		}
-	});
-}
-
-function calculate_payment_account_debit_for_fy_range(frm, row, from_date, to_date) {
-	if (!row.account) return;
+			rows.forEach(row => {
+				if (row.parentfield === 'payment_accounts') {
+					frappe.model.set_value(row.doctype, row.name, 'debit', r.message.debits[row.account] || 0);
+				} else {
+					frappe.model.set_value(row.doctype, row.name, 'balance', r.message.balances[row.account] || 0);
+				}
+			});
 
-	// For payment accounts, sum debits WITHIN the fiscal year range (BETWEEN)
-	// This matches the Python logic: BETWEEN from_date AND to_date
-	frappe.call({
-		method: 'frappe.client.get_list',
-		args: {
-			doctype: 'GL Entry',
-			filters: {
-				account: row.account,
-				company: frm.doc.company,
-				posting_date: ['between', [from_date, to_date]],
-				is_cancelled: 0
-			},
-			fields: ['sum(debit) as total_debit'],
-		},
-		callback: function(r) {
-			if (r.message && r.message.length > 0) {
-				let debit = r.message[0].total_debit || 0;
-				frappe.model.set_value(row.doctype, row.name, 'debit', debit);
-			}
+			if (callback) callback(r.message);
 		}
 	});
 }
@@ -256,113 +110,26 @@ function calculate_all_balances(frm) {
 		return;
 	}
 
-	// Get the fiscal year's start and end dates
-	frappe.call({
-		method: 'frappe.client.get_value',
-		args: {
-			doctype: 'Fiscal Year',
-			filters: { name: frm.doc.fiscal_year },
-			fieldname: ['year_start_date', 'year_end_date']
-		},
-		callback: function(r) {
-			if (r.message && r.message.year_end_date) {
-				let fiscal_year_start = r.message.year_start_date;
-				let fiscal_year_end = r.message.year_end_date;
-				frappe.show_alert({
-					message: __("Calculating balances for {0} to {1}...", [
-						frappe.datetime.str_to_user(fiscal_year_start),
-						frappe.datetime.str_to_user(fiscal_year_end)
-					]),
-					indicator: "blue"
-				});
-				calculate_balances_for_date(frm, fiscal_year_start, fiscal_year_end);
-			} else {
-				frappe.msgprint(__("Could not get fiscal year dates"));
-			}
-		}
+	let rows = [];
+	ACCOUNT_TABLES.forEach(table => {
+		(frm.doc[table] || []).forEach(row => rows.push(row));
 	});
-}
-
-function calculate_balances_for_date(frm, fiscal_year_start, fiscal_year_end) {
-	let calculated = 0;
-	let total = 0;
+	let total = rows.length;
+	let calculated = rows.filter(row => row.account).length;
 
-	// Count total accounts
-	['cash_accounts', 'inventory_accounts', 'receivable_accounts',
-	 'liability_accounts', 'reserve_accounts', 'payment_accounts'].forEach(table => {
-		if (frm.doc[table]) {
-			total += frm.doc[table].length;
-		}
+	frappe.show_alert({
+		message: __("Calculating balances for fiscal year {0}...", [frm.doc.fiscal_year]),
+		indicator: "blue"
 	});
 
-	// Calculate cash accounts
-	if (frm.doc.cash_accounts) {
-		frm.doc.cash_accounts.forEach(row => {
-			if (row.account) {
-				calculate_account_balance_for_date(frm, row, fiscal_year_end);
-				calculated++;
-			}
-		});
-	}
-
-	// Calculate inventory accounts
-	if (frm.doc.inventory_accounts) {
-		frm.doc.inventory_accounts.forEach(row => {
-			if (row.account) {
-				calculate_account_balance_for_date(frm, row, fiscal_year_end);
-				calculated++;
-			}
-		});
-	}
-
-	// Calculate receivable accounts
-	if (frm.doc.receivable_accounts) {
-		frm.doc.receivable_accounts.forEach(row => {
-			if (row.account) {
-				calculate_account_balance_for_date(frm, row, fiscal_year_end);
-				calculated++;
-			}
-		});
-	}
-
-	// Calculate liability accounts
-	if (frm.doc.liability_accounts) {
-		frm.doc.liability_accounts.forEach(row => {
-			if (row.account) {
-				calculate_account_balance_for_date(frm, row, fiscal_year_end);
-				calculated++;
-			}
-		});
-	}
-
-	// Calculate reserve accounts
-	if (frm.doc.reserve_accounts) {
-		frm.doc.reserve_accounts.forEach(row => {
-			if (row.account) {
-				calculate_account_balance_for_date(frm, row, fiscal_year_end);
-				calculated++;
-			}
-		});
-	}
-
-	// Calculate payment accounts (debit) - use fiscal year RANGE
-	if (frm.doc.payment_accounts) {
-		frm.doc.payment_accounts.forEach(row => {
-			if (row.account) {
-				calculate_payment_account_debit_for_fy_range(frm, row, fiscal_year_start, fiscal_year_end);
-				calculated++;
-			}
-		});
-	}
-
-	setTimeout(() => {
+	calculate_balances(frm, rows, function() {
 		frappe.show_alert({
 			message: __("Calculated balances for {0} of {1} accounts", [calculated, total]),
 			indicator: "green"
 		}, 5);
 
 		frm.refresh_fields();
-	}, 1000);
+	});
 }
 
 function validate_configuration(frm) {
@@ -376,8 +143,7 @@ function validate_configuration(frm) {
 
 	// Check if at least one account is configured
 	let has_accounts = false;
-	['cash_accounts', 'inventory_accounts', 'receivable_accounts',
-	 'liability_accounts', 'reserve_accounts', 'payment_accounts'].forEach(table => {
+	ACCOUNT_TABLES.forEach(table => {
 		if (frm.doc[table] && frm.doc[table].length > 0) {
 			has_accounts = true;
 		}
@@ -389,8 +155,7 @@ function validate_configuration(frm) {
 
 	// Check for duplicate accounts across tables
 	let all_accounts = [];
-	['cash_accounts', 'inventory_accounts', 'receivable_accounts',
-	 'liability_accounts', 'reserve_accounts', 'payment_accounts'].forEach(table => {
+	ACCOUNT_TABLES.forEach(table => {
 		if (frm.doc[table]) {
 			frm.doc[table].forEach(row => {
 				if (row.account) {
@@ -1,8 +1,13 @@
 
 from __future__ import unicode_literals
+import json
 from frappe.model.document import Document
 import frappe
-from frappe.utils import getdate
+from frappe.utils import flt, getdate, nowdate
+from techstation_zakaah.zakaah_management import logger as zakaah_log
+from techstation_zakaah.zakaah_management.categories import BALANCE_TABLES, get_category_accounts
+from techstation_zakaah.zakaah_management.config import clear_config_cache
+from techstation_zakaah.zakaah_management.instrumentation import instrument
 
 class ZakaahAssetsConfiguration(Document):
     def validate(self):
@@ -17,134 +22,160 @@ class ZakaahAssetsConfiguration(Document):
             # Calculate balances for all child tables
             self._calculate_balances(balance_date, fiscal_year_start, fiscal_year_end)
     
+    def on_update(self):
+        """Drop cached configurations so calculations pick up the change"""
+        clear_config_cache()
+    
+    def on_trash(self):
+        clear_config_cache()
+    
     def _calculate_balances(self, balance_date, fiscal_year_start, fiscal_year_end):
         """Calculate account balances as of given date"""
         
-        # Calculate balances for all account tables
-        account_tables = [
-            'cash_accounts',
-            'inventory_accounts',
-            'receivable_accounts',
-            'liabilities_accounts',
-            'reserve_accounts',
-            'payment_accounts'
-        ]
+        # Resolve the accounts of every asset category together so they share
+        # one GL pass
+        balances = get_absolute_balances(get_category_accounts(self), balance_date, self.company)
         
-        for table_name in account_tables:
-            if hasattr(self, table_name):
-                for row in getattr(self, table_name):
-                    if row.account:
-                        if table_name == 'payment_accounts':
-                            # For payment accounts, calculate Debit from GL Entry
-                            # Don't calculate balance - it should not appear
-                            debit = self._get_payment_account_debit(
-                                row.account, 
-                                fiscal_year_start, 
-                                fiscal_year_end
-                            )
-                            row.debit = debit
-                            # Don't set balance at all for payment accounts
-                        else:
-                            # For other accounts, calculate Balance using Trial Balance logic
-                            balance = self._get_account_balance(row.account, balance_date)
-                            row.balance = balance
-    
-    def _get_account_balance(self, account, date):
-        """Get account balance as of date - using Trial Balance logic"""
-        try:
-            from erpnext.accounts.utils import get_balance_on
-            
-            # Get balance using ERPNext's built-in function (same as Trial Balance)
-            # This respects fiscal year, company, and all ERPNext rules
-            balance = get_balance_on(
-                account=account,
-                date=date,
-                company=self.company
-            )
-            
-            # Return absolute value for summation
-            return abs(balance or 0)
-            
-        except Exception as e:
-            frappe.log_error(f"Error getting balance for {account}: {str(e)}", "Balance Calculation")
-            return 0.0
-    
-    def _get_payment_account_debit(self, account, from_date, to_date):
-        """Get total Debit from GL Entry for payment accounts according to Fiscal Year"""
-        try:
-            from frappe.utils import flt, getdate
-            
-            # Ensure dates are date objects
-            from_date = getdate(from_date)
-            to_date = getdate(to_date)
-            
-            # Sum all debit amounts from GL Entry for the fiscal year period
-            # Payment accounts are always debit side (money paid out)
-            debit_result = frappe.db.sql("""
-                SELECT 
-                    SUM(gle.debit) as total_debit,
-                    COUNT(*) as entry_count
-                FROM `tabGL Entry` gle
-                WHERE gle.account = %(account)s
-                    AND gle.company = %(company)s
-                    AND gle.posting_date BETWEEN %(from_date)s AND %(to_date)s
-                    AND gle.is_cancelled = 0
-            """, {
-                'account': account,
-                'company': self.company,
-                'from_date': from_date,
-                'to_date': to_date
-            }, as_dict=True)
-            
-            total_debit = flt(debit_result[0].total_debit) if debit_result and debit_result[0] and debit_result[0].total_debit else 0.0
-            entry_count = debit_result[0].entry_count if debit_result and debit_result[0] and debit_result[0].entry_count else 0
-            
-            # If no debit found in date range, check all dates to see what's available
-            if total_debit == 0:
-                date_range_check = frappe.db.sql("""
-                    SELECT 
-                        MIN(gle.posting_date) as min_date,
-                        MAX(gle.posting_date) as max_date,
-                        SUM(gle.debit) as total_all_debit,
-                        SUM(ABS(gle.debit - gle.credit)) as net_debit
-                    FROM `tabGL Entry` gle
-                    WHERE gle.account = %(account)s
-                        AND gle.company = %(company)s
-                        AND gle.is_cancelled = 0
-                """, {
-                    'account': account,
-                    'company': self.company
-                }, as_dict=True)
-                
-                if date_range_check and date_range_check[0] and date_range_check[0].total_all_debit:
-                    # Use short title and detailed message
-                    message = (
-                        f"Account: {account}\n"
-                        f"Company: {self.company}\n"
-                        f"Requested: {from_date} to {to_date}\n"
-                        f"Available: {date_range_check[0].min_date} to {date_range_check[0].max_date}\n"
-                        f"Total Debit (all dates): {date_range_check[0].total_all_debit}\n"
-                        f"Net Movement: {date_range_check[0].net_debit}"
-                    )
-                    frappe.log_error(
-                        message,
-                        "Payment Account Debit - Date Range Mismatch"
-                    )
-            
-            # Only log for debugging if there's an issue or if needed
-            # Removed automatic logging to avoid truncation errors
-            
-            return total_debit
-            
-        except Exception as e:
-            # Use short title and detailed message
-            message = (
-                f"Error getting debit for payment account: {account}\n"
-                f"Company: {getattr(self, 'company', 'N/A')}\n"
-                f"Date Range: {from_date} to {to_date}\n"
-                f"Error: {str(e)}"
-            )
-            frappe.log_error(message, "Payment Account Debit Error")
-            return 0.0
+        for table_name in BALANCE_TABLES:
+            for row in self.get(table_name) or []:
+                if row.account:
+                    # Balance using Trial Balance logic
+                    row.balance = balances.get(row.account, 0.0)
+        
+        # For payment accounts, calculate Debit from GL Entry
+        # Don't calculate balance - it should not appear
+        payment_rows = [row for row in self.get('payment_accounts') or [] if row.account]
+        debits = get_payment_account_debits(
+            [row.account for row in payment_rows],
+            self.company,
+            fiscal_year_start,
+            fiscal_year_end
+        )
+        for row in payment_rows:
+            row.debit = debits.get(row.account, 0.0)
+
+
+@frappe.whitelist()
+@instrument
+def get_configuration_balances(company, accounts, fiscal_year=None, date=None):
+    """Get the balances and payment account debits of a whole configuration in one call
+
+    accounts maps each account table to its account names. With a fiscal
+    year, balances are as of its end and debits are summed over it, the same
+    as on save. Without one, balances are as of date (default today) and
+    debits are summed up to it.
+    """
+    frappe.has_permission("Zakaah Assets Configuration", "read", throw=True)
+
+    if isinstance(accounts, str):
+        accounts = json.loads(accounts)
+
+    from_date, to_date = None, getdate(date or nowdate())
+    if fiscal_year:
+        from_date, to_date = frappe.db.get_value(
+            "Fiscal Year", fiscal_year, ["year_start_date", "year_end_date"]
+        ) or (None, to_date)
+
+    balance_accounts = [account for table in BALANCE_TABLES for account in accounts.get(table) or []]
+
+    return {
+        "balances": get_absolute_balances(balance_accounts, to_date, company),
+        "debits": get_payment_account_debits(accounts.get('payment_accounts'), company, from_date, to_date),
+        "from_date": from_date,
+        "to_date": to_date
+    }
+
+
+def get_absolute_balances(accounts, date, company):
+    """Get absolute balances of many accounts as of date - using Trial Balance logic"""
+    try:
+        from techstation_zakaah.zakaah_management.balances import get_account_balances
+        
+        balances = get_account_balances(accounts, date, company)
+        
+        # Return absolute values for summation
+        return {account: abs(balance or 0) for account, balance in balances.items()}
+        
+    except Exception:
+        frappe.log_error(title="Balance Calculation", message=frappe.get_traceback())
+        return {}
+
+
+def get_payment_account_debits(accounts, company, from_date, to_date):
+    """Get total Debit from GL Entry of many payment accounts in one grouped query
+
+    Debits are summed between from_date and to_date, or up to to_date when
+    from_date is not given. Payment accounts are always debit side (money
+    paid out).
+    """
+    accounts = list(dict.fromkeys(account for account in accounts or [] if account))
+    if not accounts:
+        return {}
+
+    try:
+        conditions = "AND gle.posting_date >= %(from_date)s" if from_date else ""
+        debits = dict.fromkeys(accounts, 0.0)
+        for account, total_debit in frappe.db.sql(f"""
+            SELECT gle.account, SUM(gle.debit)
+            FROM `tabGL Entry` gle
+            WHERE gle.account IN %(accounts)s
+                AND gle.company = %(company)s
+                AND gle.posting_date <= %(to_date)s
+                AND gle.is_cancelled = 0
+                {conditions}
+            GROUP BY gle.account
+        """, {
+            'accounts': accounts,
+            'company': company,
+            'from_date': getdate(from_date) if from_date else None,
+            'to_date': getdate(to_date)
+        }):
+            debits[account] = flt(total_debit)
+
+        # If no debit found in date range, check all dates to see what's available
+        empty_accounts = [account for account, debit in debits.items() if not debit]
+        if empty_accounts and from_date:
+            log_debit_date_range_mismatch(empty_accounts, company, from_date, to_date)
+
+        return debits
+
+    except Exception:
+        # Use short title and detailed message
+        message = (
+            f"Error getting debit for payment accounts: {', '.join(accounts)}\n"
+            f"Company: {company}\n"
+            f"Date Range: {from_date} to {to_date}\n\n"
+            f"{frappe.get_traceback()}"
+        )
+        frappe.log_error(title="Payment Account Debit Error", message=message)
+        return {}
 
 
+def log_debit_date_range_mismatch(accounts, company, from_date, to_date):
+    """Log payment accounts that have debits, but none between from_date and to_date"""
+    for row in frappe.db.sql("""
+        SELECT 
+            gle.account,
+            MIN(gle.posting_date) as min_date,
+            MAX(gle.posting_date) as max_date,
+            SUM(gle.debit) as total_all_debit,
+            SUM(ABS(gle.debit - gle.credit)) as net_debit
+        FROM `tabGL Entry` gle
+        WHERE gle.account IN %(accounts)s
+            AND gle.company = %(company)s
+            AND gle.is_cancelled = 0
+        GROUP BY gle.account
+        HAVING SUM(gle.debit) > 0
+    """, {
+        'accounts': accounts,
+        'company': company
+    }, as_dict=True):
+        zakaah_log.warning(
+            "Payment Account Debit - Date Range Mismatch",
+            account=row.account,
+            company=company,
+            requested=f"{from_date} to {to_date}",
+            available=f"{row.min_date} to {row.max_date}",
+            total_debit_all_dates=row.total_all_debit,
+            net_movement=row.net_debit
+        )
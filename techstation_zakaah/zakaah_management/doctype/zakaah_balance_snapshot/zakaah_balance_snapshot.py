@@ -0,0 +1,231 @@
+from __future__ import unicode_literals
+from frappe.model.document import Document
+import frappe
+from frappe.utils import add_to_date, getdate, now, now_datetime
+
+class ZakaahBalanceSnapshot(Document):
+	pass
+
+
+def on_doctype_update():
+	# One closing balance per account and period end
+	frappe.db.add_unique(
+		"Zakaah Balance Snapshot",
+		["company", "account", "period_end"],
+		constraint_name="unique_company_account_period_end"
+	)
+
+
+# Watermarks are set this far before a build starts, so entries of
+# transactions still open during the build are newer than the watermark
+SNAPSHOT_WATERMARK_LAG_HOURS = 2
+
+
+def get_valid_snapshot_date(company, date):
+	"""Get the latest snapshot period end on or before date that still matches the ledger.
+
+	Snapshots are never written here, they are built by the daily
+	build_balance_snapshots job only.
+	"""
+	for snapshot in get_snapshot_periods(company, date, limit=3):
+		if is_snapshot_valid(company, snapshot):
+			return getdate(snapshot.period_end)
+
+	return None
+
+
+def get_snapshot_periods(company, date=None, limit=None):
+	"""Get the period ends of the company's snapshots, latest first, with their oldest watermark"""
+	return frappe.db.sql("""
+		SELECT
+			period_end,
+			MIN(ledger_watermark) AS ledger_watermark,
+			COUNT(ledger_watermark) = COUNT(*) AS complete
+		FROM `tabZakaah Balance Snapshot`
+		WHERE company = %(company)s
+		{date_condition}
+		GROUP BY period_end
+		ORDER BY period_end DESC
+		{limit}
+	""".format(
+		date_condition="AND period_end <= %(date)s" if date else "",
+		limit=f"LIMIT {int(limit)}" if limit else ""
+	), {"company": company, "date": getdate(date) if date else None}, as_dict=True)
+
+
+def is_snapshot_valid(company, snapshot):
+	# Rows without a watermark predate watermarks and are never trusted
+	return bool(snapshot.complete) and is_ledger_unchanged(company, snapshot.period_end, snapshot.ledger_watermark)
+
+
+def is_ledger_unchanged(company, period_end, watermark):
+	"""Check no GL Entry on or before period_end was posted, cancelled or reversed after watermark.
+
+	Cancelling sets modified on the original entries and reversals are new
+	entries on the original posting date, so both show up here.
+
+	The query reads the GL Entry (company, modified, posting_date) index from
+	the watermark onwards and never the table. The daily job moves every valid
+	snapshot's watermark up to the current ledger, so at most a day of the
+	company's postings is read, however large the ledger or old the snapshot.
+	"""
+	if not watermark:
+		return False
+
+	return not frappe.db.sql("""
+		SELECT name
+		FROM `tabGL Entry`
+		WHERE modified > %s
+		AND company = %s
+		AND posting_date <= %s
+		LIMIT 1
+	""", (watermark, company, getdate(period_end)))
+
+
+def get_closed_date(company):
+	"""Get the date up to which the company's books are closed to new postings.
+
+	That is the later of its last Period Closing Voucher and the accounts
+	frozen date, or None when neither is set.
+	"""
+	dates = [
+		frappe.db.get_value(
+			"Period Closing Voucher", {"company": company, "docstatus": 1}, "max(period_end_date)"
+		),
+		frappe.db.get_single_value("Accounts Settings", "acc_frozen_upto"),
+	]
+	dates = [getdate(d) for d in dates if d]
+	return max(dates) if dates else None
+
+
+def build_balance_snapshots():
+	"""Drop snapshots the ledger has moved past and snapshot every company at its closed date, run daily"""
+	from erpnext.accounts.utils import get_currency_precision
+
+	precision = get_currency_precision()
+
+	for company in frappe.get_all("Company", pluck="name"):
+		refresh_snapshot_watermarks(company)
+
+		closed_date = get_closed_date(company)
+		if closed_date:
+			base_date = get_valid_snapshot_date(company, closed_date)
+			if base_date != closed_date:
+				create_balance_snapshot(company, closed_date, precision, base_date=base_date)
+
+		frappe.db.commit()
+
+
+def refresh_snapshot_watermarks(company):
+	"""Delete the company's stale snapshots and move the watermark of the others up to now.
+
+	A snapshot still valid against every entry modified up to now stays valid
+	from now on, so later checks only read entries modified after today's run.
+	"""
+	watermark = add_to_date(now_datetime(), hours=-SNAPSHOT_WATERMARK_LAG_HOURS)
+
+	stale, current = [], []
+	for snapshot in get_snapshot_periods(company):
+		if not is_snapshot_valid(company, snapshot):
+			stale.append(snapshot.period_end)
+		elif snapshot.ledger_watermark < watermark:
+			current.append(snapshot.period_end)
+
+	if stale:
+		frappe.db.delete("Zakaah Balance Snapshot", {"company": company, "period_end": ("in", stale)})
+
+	if current:
+		frappe.db.sql("""
+			UPDATE `tabZakaah Balance Snapshot`
+			SET ledger_watermark = %(watermark)s
+			WHERE company = %(company)s
+			AND period_end IN %(period_ends)s
+		""", {"watermark": watermark, "company": company, "period_ends": current})
+
+
+def create_balance_snapshot(company, period_end, precision, base_date=None):
+	"""Persist the closing balance of every ledger account of the company as of period_end.
+
+	With a base_date, the snapshot is rolled forward from the snapshot at
+	base_date so only GL Entries posted after it are read. Any earlier rows
+	for period_end are replaced. The rows carry a ledger watermark taken
+	before reading, which get_valid_snapshot_date checks on every use and
+	the daily job moves forward while the snapshot stays valid.
+
+	Returns True if any snapshot rows exist for period_end afterwards.
+	"""
+	watermark = add_to_date(now_datetime(), hours=-SNAPSHOT_WATERMARK_LAG_HOURS)
+	values = {
+		"company": company,
+		"period_end": getdate(period_end),
+		"base_date": getdate(base_date) if base_date else None,
+		"precision": precision
+	}
+
+	if base_date:
+		rows = frappe.db.sql("""
+			SELECT
+				account,
+				SUM(debit) AS debit,
+				SUM(credit) AS credit,
+				SUM(debit_in_account_currency) AS debit_in_account_currency,
+				SUM(credit_in_account_currency) AS credit_in_account_currency
+			FROM (
+				SELECT account, debit, credit, debit_in_account_currency, credit_in_account_currency
+				FROM `tabZakaah Balance Snapshot`
+				WHERE company = %(company)s
+				AND period_end = %(base_date)s
+				UNION ALL
+				SELECT
+					account,
+					ROUND(debit, %(precision)s),
+					ROUND(credit, %(precision)s),
+					ROUND(debit_in_account_currency, %(precision)s),
+					ROUND(credit_in_account_currency, %(precision)s)
+				FROM `tabGL Entry`
+				WHERE company = %(company)s
+				AND posting_date > %(base_date)s
+				AND posting_date <= %(period_end)s
+				AND is_cancelled = 0
+			) movements
+			GROUP BY account
+		""", values, as_dict=True)
+	else:
+		rows = frappe.db.sql("""
+			SELECT
+				account,
+				SUM(ROUND(debit, %(precision)s)) AS debit,
+				SUM(ROUND(credit, %(precision)s)) AS credit,
+				SUM(ROUND(debit_in_account_currency, %(precision)s)) AS debit_in_account_currency,
+				SUM(ROUND(credit_in_account_currency, %(precision)s)) AS credit_in_account_currency
+			FROM `tabGL Entry`
+			WHERE company = %(company)s
+			AND posting_date <= %(period_end)s
+			AND is_cancelled = 0
+			GROUP BY account
+		""", values, as_dict=True)
+
+	frappe.db.delete("Zakaah Balance Snapshot", {"company": company, "period_end": getdate(period_end)})
+	if not rows:
+		return False
+
+	timestamp = now()
+	user = frappe.session.user
+	fields = [
+		"name", "creation", "modified", "owner", "modified_by", "docstatus",
+		"company", "account", "period_end",
+		"debit", "credit", "debit_in_account_currency", "credit_in_account_currency", "ledger_watermark"
+	]
+	values = [
+		(
+			frappe.generate_hash(length=10), timestamp, timestamp, user, user, 0,
+			company, row.account, getdate(period_end),
+			row.debit or 0, row.credit or 0,
+			row.debit_in_account_currency or 0, row.credit_in_account_currency or 0, watermark
+		)
+		for row in rows
+	]
+
+	frappe.db.bulk_insert("Zakaah Balance Snapshot", fields, values, ignore_duplicates=True)
+
+	return True
@@ -1,40 +1,25 @@
 frappe.ui.form.on('Zakaah Calculation Run', {
     
+    onload: function(frm) {
+        // Follow background calculation progress for this run
+        frappe.realtime.off('zakaah_calculation_progress');
+        frappe.realtime.on('zakaah_calculation_progress', function(data) {
+            if (data.name !== frm.doc.name) return;
+            show_calculation_progress(frm, data);
+        });
+    },
+    
     fiscal_year: function(frm) {
         if (frm.doc.fiscal_year) {
-            // Fetch fiscal year dates
-            frappe.call({
-                method: 'frappe.client.get',
-                args: {
-                    doctype: 'Fiscal Year',
-                    name: frm.doc.fiscal_year
-                },
-                callback: function(r) {
-                    if (r.message && r.message.year_start_date && r.message.year_end_date) {
-                        // Only update if dates are not manually set
-                        if (!frm.doc.from_date) {
-                            frm.set_value('from_date', r.message.year_start_date);
-                        }
-                        if (!frm.doc.to_date) {
-                            frm.set_value('to_date', r.message.year_end_date);
-                        }
-                        
-                        // Auto-set gold price date to end of fiscal year
-                        // User can change it if needed for historical dates
-                        if (!frm.doc.gold_price_date && r.message.year_end_date) {
-                            frm.set_value('gold_price_date', r.message.year_end_date);
-                            // Manual entry required - don't fetch automatically
-                        }
-                    }
-                }
-            });
+            // Fiscal year dates, payment accounts and gold price in one call
+            load_run_context(frm, true);
         }
     },
     
     gold_price_date: function(frm) {
         if (frm.doc.gold_price_date) {
-            // Manual entry required - check if exists in DB only
-            fetch_gold_price_for_date(frm, frm.doc.gold_price_date);
+            // Manual entry required - only load an existing price
+            load_run_context(frm, true);
         }
         // Auto-calculate nisab when dates change
         calculate_nisab(frm);
@@ -55,18 +40,16 @@ frappe.ui.form.on('Zakaah Calculation Run', {
         if (frm.doc.status === 'Draft' && frm.doc.company && frm.doc.to_date) {
             frm.add_custom_button(__('Calculate Zakaah'), function() {
                 frm.call({
-                    method: 'techstation_zakaah.zakaah_management.doctype.zakaah_calculation_run.zakaah_calculation_run.calculate_zakaah_for_run',
+                    method: 'techstation_zakaah.zakaah_management.doctype.zakaah_calculation_run.zakaah_calculation_run.enqueue_calculation',
                     args: {
                         name: frm.doc.name
                     },
                     callback: function(r) {
                         if (r.message) {
-                            frappe.model.set_value(frm.doctype, frm.doc.name, r.message);
-                            frm.reload_doc();
                             frappe.show_alert({
-                                message: __('Zakaah calculation completed!'),
-                                indicator: 'green'
-                            }, 5);
+                                message: __('Zakaah calculation queued'),
+                                indicator: 'blue'
+                            }, 3);
                         }
                     },
                     error: function() {
@@ -155,85 +138,30 @@ frappe.ui.form.on('Zakaah Calculation Run', {
             }, __('Actions'));
         }
         
-        // Auto-fill dates if fiscal year is set and dates are empty
-        if (frm.doc.fiscal_year && (!frm.doc.from_date || !frm.doc.to_date)) {
-            frappe.call({
-                method: 'frappe.client.get',
-                args: {
-                    doctype: 'Fiscal Year',
-                    name: frm.doc.fiscal_year
-                },
-                callback: function(r) {
-                    if (r.message && r.message.year_start_date && r.message.year_end_date) {
-                        if (!frm.doc.from_date) {
-                            frm.set_value('from_date', r.message.year_start_date);
-                        }
-                        if (!frm.doc.to_date) {
-                            frm.set_value('to_date', r.message.year_end_date);
-                        }
-                    }
-                }
-            });
-        }
-        
-        // Auto-set gold price date to to_date if not set
-        if (!frm.doc.gold_price_date && frm.doc.to_date) {
-            frm.set_value('gold_price_date', frm.doc.to_date);
-            // Manual entry required - don't fetch automatically
+        // Auto-fill dates, gold price date and payment accounts if empty,
+        // and show the previous run
+        if (frm.doc.company) {
+            load_run_context(frm, false);
         }
     }
 });
 
-function load_payment_accounts(frm) {
-    // Load payment accounts from Zakaah Assets Configuration
-    // IMPORTANT: Payment accounts are the Payable Accounts from configuration
-    if (!frm.doc.company) return;
+function show_calculation_progress(frm, data) {
+    if (data.status === 'Running') {
+        frappe.show_progress(__('Calculating Zakaah'), data.progress, 100, __(data.stage));
+        return;
+    }
     
-    frappe.call({
-        method: 'frappe.client.get_list',
-        args: {
-            doctype: 'Zakaah Assets Configuration',
-            filters: {
-                company: frm.doc.company
-            },
-            fields: ['name'],
-            limit_page_length: 1
-        },
-        callback: function(r) {
-            if (r.message && r.message.length > 0) {
-                // Get the configuration document
-                frappe.call({
-                    method: 'frappe.client.get',
-                    args: {
-                        doctype: 'Zakaah Assets Configuration',
-                        name: r.message[0].name
-                    },
-                    callback: function(config) {
-                        if (config.message) {
-                            // Clear existing payment accounts
-                            frm.clear_table('payment_accounts');
-                            
-                            // Add payable accounts from configuration (these are the payment accounts for Zakaah)
-                            if (config.message.liabilities_accounts && config.message.liabilities_accounts.length > 0) {
-                                config.message.liabilities_accounts.forEach(function(acc) {
-                                    let row = frm.add_child('payment_accounts');
-                                    row.account = acc.account;
-                                });
-                            }
-                            
-                            if (frm.doc.payment_accounts.length > 0) {
-                                frm.refresh_field('payment_accounts');
-                                frappe.show_alert({
-                                    message: __('Loaded {0} payment accounts (Payable Accounts) from configuration', [frm.doc.payment_accounts.length]),
-                                    indicator: 'green'
-                                }, 3);
-                            }
-                        }
-                    }
-                });
-            }
-        }
-    });
+    frappe.hide_progress();
+    if (data.status === 'Completed') {
+        frm.reload_doc();
+        frappe.show_alert({
+            message: __('Zakaah calculation completed!'),
+            indicator: 'green'
+        }, 5);
+    } else {
+        frappe.msgprint(__('Error calculating zakaah: {0}', [data.message || '']));
+    }
 }
 
 function calculate_nisab(frm) {
@@ -244,59 +172,114 @@ function calculate_nisab(frm) {
     }
 }
 
-function fetch_gold_price_for_date(frm, date) {
-    frappe.show_alert({
-        message: __('Checking for gold price for ' + date + '...'),
-        indicator: 'blue'
-    }, 3);
+function get_run_context_key(frm, gold_price_date) {
+    return [frm.doc.company, frm.doc.fiscal_year, gold_price_date || frm.doc.gold_price_date].join('::');
+}
+
+function load_run_context(frm, update_gold_price) {
+    // Reuse the context of the same company, fiscal year and gold price date
+    let key = get_run_context_key(frm);
+    if (frm.run_context && frm.run_context_key === key) {
+        apply_run_context(frm, frm.run_context, update_gold_price);
+        return;
+    }
     
     frappe.call({
-        method: 'frappe.client.get_list',
+        method: 'techstation_zakaah.zakaah_management.doctype.zakaah_calculation_run.zakaah_calculation_run.get_run_context',
         args: {
-            doctype: 'Gold Price',
-            filters: {'price_date': date},
-            fields: ['name', 'price_date', 'price_per_gram_24k'],
-            limit_page_length: 1
+            company: frm.doc.company,
+            fiscal_year: frm.doc.fiscal_year,
+            gold_price_date: frm.doc.gold_price_date
         },
         callback: function(r) {
-            // Debug: show what we got
-            frappe.log_error('Gold price query result for date ' + date + ': ' + JSON.stringify(r.message), 'Gold Price Debug');
-            
-            if (r.message && r.message.length > 0) {
-                // Gold price exists for this date
-                const gold_price = r.message[0];
-                frm.set_value('gold_price_per_gram_24k', gold_price.price_per_gram_24k);
-                frappe.show_alert({
-                    message: __('Gold price loaded: ' + gold_price.price_per_gram_24k + ' EGP'),
-                    indicator: 'green'
-                }, 3);
-                // Auto-calculate nisab
-                calculate_nisab(frm);
-            } else {
-                // Check if there are any gold prices at all
-                frappe.call({
-                    method: 'frappe.client.get_list',
-                    args: {
-                        doctype: 'Gold Price',
-                        fields: ['name', 'price_date'],
-                        limit_page_length: 10,
-                        order_by: 'price_date DESC'
-                    },
-                    callback: function(all_prices) {
-                        let message = 'Gold price not found for date: ' + date + '.\n\n';
-                        if (all_prices.message && all_prices.message.length > 0) {
-                            message += 'Available dates: ';
-                            all_prices.message.forEach(p => {
-                                message += p.price_date + ', ';
-                            });
-                        } else {
-                            message += 'No gold prices exist in the system.';
-                        }
-                        message += '\n\nPlease enter it manually in Gold Price doctype.';
-                        frappe.msgprint(message);
-                    }
-                });
+            if (r.message) {
+                frm.run_context_key = key;
+                frm.run_context = r.message;
+                apply_run_context(frm, r.message, update_gold_price);
             }
         }
     });
 }
+
+function apply_run_context(frm, context, update_gold_price) {
+    show_previous_runs(frm, context.previous_runs);
+    
+    if (frm.doc.docstatus !== 0) return;
+    
+    // Only update if dates are not manually set
+    if (!frm.doc.from_date && context.from_date) {
+        frm.set_value('from_date', context.from_date);
+    }
+    if (!frm.doc.to_date && context.to_date) {
+        frm.set_value('to_date', context.to_date);
+    }
+    
+    // Payment accounts from configuration, as loaded on save
+    if (!(frm.doc.payment_accounts || []).length && context.payment_accounts.length) {
+        context.payment_accounts.forEach(function(acc) {
+            let row = frm.add_child('payment_accounts');
+            row.account = acc.account;
+            row.debit = acc.debit;
+        });
+        frm.refresh_field('payment_accounts');
+        frappe.show_alert({
+            message: __('Loaded {0} payment accounts from configuration', [context.payment_accounts.length]),
+            indicator: 'green'
+        }, 3);
+    }
+    
+    let gold_price = context.gold_price;
+    if (!gold_price) return;
+    
+    // Auto-set gold price date to end of fiscal year
+    // User can change it if needed for historical dates
+    if (!frm.doc.gold_price_date) {
+        // The context already holds the price of this date, the
+        // gold_price_date trigger applies it without another call
+        frm.run_context_key = get_run_context_key(frm, gold_price.date);
+        frm.set_value('gold_price_date', gold_price.date);
+        return;
+    }
+    
+    if (!update_gold_price) return;
+    
+    if (gold_price.price) {
+        if (frm.doc.gold_price_per_gram_24k !== gold_price.price) {
+            frm.set_value('gold_price_per_gram_24k', gold_price.price);
+        }
+        frappe.show_alert({
+            message: gold_price.exact
+                ? __('Gold price loaded: {0}', [format_currency(gold_price.price)])
+                : __('No gold price for {0}. Using the price of {1}: {2}', [
+                    frappe.datetime.str_to_user(gold_price.date),
+                    frappe.datetime.str_to_user(gold_price.price_date),
+                    format_currency(gold_price.price)
+                ]),
+            indicator: gold_price.exact ? 'green' : 'orange'
+        }, 5);
+        // Auto-calculate nisab
+        calculate_nisab(frm);
+    } else {
+        let message = __('Gold price not found on or before {0}.', [frappe.datetime.str_to_user(gold_price.date)]) + '<br><br>';
+        if (gold_price.latest_dates.length) {
+            message += __('Available dates: {0}', [gold_price.latest_dates.map(d => frappe.datetime.str_to_user(d)).join(', ')]);
+        } else {
+            message += __('No gold prices exist in the system.');
+        }
+        message += '<br><br>' + __('Please enter it manually in Gold Price doctype.');
+        frappe.msgprint(message);
+    }
+}
+
+function show_previous_runs(frm, runs) {
+    let previous = (runs || []).filter(run => run.name !== frm.doc.name);
+    if (!previous.length) return;
+    
+    let run = previous[0];
+    frm.dashboard.set_headline(__('Previous run {0} ({1}): Zakaah {2}, Outstanding {3}', [
+        `<a href="/app/zakaah-calculation-run/${encodeURIComponent(run.name)}">${frappe.utils.escape_html(run.name)}</a>`,
+        run.fiscal_year || frappe.datetime.str_to_user(run.to_date),
+        format_currency(run.total_zakaah),
+        format_currency(run.outstanding_zakaah)
+    ]));
+}
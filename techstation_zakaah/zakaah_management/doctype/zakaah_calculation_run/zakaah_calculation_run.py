@@ -1,9 +1,23 @@
 
 from __future__ import unicode_literals
+import hashlib
+import json
 from frappe.model.document import Document
 import frappe
 from frappe import _
-from frappe.utils import flt
+from frappe.utils import flt, formatdate, getdate
+from techstation_zakaah.zakaah_management import logger as zakaah_log
+from techstation_zakaah.zakaah_management.categories import (
+    ASSET_CATEGORIES,
+    BALANCE_TABLES,
+    get_category_accounts,
+    get_category_totals
+)
+from techstation_zakaah.zakaah_management.doctype.zakaah_year_summary.zakaah_year_summary import refresh_year_summaries
+from techstation_zakaah.zakaah_management.instrumentation import instrument
+
+# Gold price per gram used when there is no Gold Price on or before the date
+DEFAULT_GOLD_PRICE = 6171
 
 class ZakaahCalculationRun(Document):
     def validate(self):
@@ -39,69 +53,81 @@ class ZakaahCalculationRun(Document):
     def _load_payment_accounts(self):
         """Load payment accounts from Zakaah Assets Configuration"""
         try:
+            from techstation_zakaah.zakaah_management.config import get_resolved_config
+
             # Get configuration for this company and fiscal year
-            config = frappe.db.get_value("Zakaah Assets Configuration", 
-                                        {"company": self.company, "fiscal_year": self.fiscal_year}, 
-                                        "name")
-            if not config:
+            config = get_resolved_config(self.company, self.fiscal_year)
+            if config["resolved_by"] != "fiscal_year":
                 return
             
-            # Get the configuration document
-            config_doc = frappe.get_doc("Zakaah Assets Configuration", config)
-            
             # Load payment accounts (these are the liabilities accounts)
-            if config_doc.payment_accounts:
+            if config["payment_accounts"]:
                 self.payment_accounts = []
-                for acc in config_doc.payment_accounts:
+                for acc in config["payment_accounts"]:
                     self.append("payment_accounts", {
                         "account": acc.account,
-                        "debit": acc.debit if hasattr(acc, 'debit') else 0
+                        "debit": acc.debit or 0
                     })
-        except Exception as e:
-            frappe.log_error(f"Error loading payment accounts: {str(e)}", "Load Payment Accounts Error")
+        except Exception:
+            frappe.log_error(title="Load Payment Accounts Error", message=frappe.get_traceback())
     
     def _load_journal_entries(self):
-        """Load journal entries based on payment accounts"""
+        """Load journal entries posted to the payment accounts or their descendants
+
+        Only reloads when the payment accounts or dates changed since the
+        last load, tracked by journal_entries_fingerprint.
+        """
         try:
-            # Skip if already loaded (to avoid reloading)
-            if self.journal_entries and len(self.journal_entries) > 0:
-                return
-            
             # Get payment account names
-            payment_accounts = [row.account for row in self.payment_accounts if row.account]
+            payment_accounts = sorted({row.account for row in self.payment_accounts if row.account})
             
             if not payment_accounts:
                 return
             
-            # Query Journal Entries - include child accounts too
-            journal_entries = frappe.db.sql("""
-                SELECT DISTINCT
-                    je.name as journal_entry,
-                    je.posting_date,
-                    jea.account,
-                    SUM(jea.debit) as total_debit
-                FROM `tabJournal Entry` je
-                INNER JOIN `tabJournal Entry Account` jea ON jea.parent = je.name
-                INNER JOIN `tabAccount` acc ON acc.name = jea.account
-                WHERE je.docstatus = 1
-                    AND je.posting_date BETWEEN %(from_date)s AND %(to_date)s
-                    AND (
-                        jea.account IN %(accounts)s
-                        OR acc.parent_account LIKE %(parent_like)s
-                        OR REPLACE(acc.parent_account, ' - ', '-') LIKE %(parent_like2)s
-                    )
-                GROUP BY je.name, je.posting_date, jea.account
-                HAVING SUM(jea.debit) > 0
-                ORDER BY je.posting_date DESC
-            """, {
-                'accounts': payment_accounts,
-                'from_date': self.from_date,
-                'to_date': self.to_date,
-                'parent_like': f"%/{payment_accounts[0]}",
-                'parent_like2': f"%%{payment_accounts[0]}%%"
-            }, as_dict=True)
+            fingerprint = hashlib.md5(
+                json.dumps([payment_accounts, str(self.from_date), str(self.to_date)]).encode()
+            ).hexdigest()
+            
+            # Skip if already loaded for the same accounts and dates
+            if fingerprint == self.journal_entries_fingerprint:
+                return
+            
+            # Resolve the payment accounts to their ledger descendants through
+            # the nested set, GL Entries are only posted to ledger accounts
+            ledger_accounts = frappe.db.sql_list("""
+                SELECT DISTINCT acc.name
+                FROM `tabAccount` parent
+                INNER JOIN `tabAccount` acc ON acc.lft >= parent.lft AND acc.rgt <= parent.rgt
+                WHERE parent.name IN %(accounts)s
+                    AND acc.is_group = 0
+            """, {'accounts': payment_accounts})
             
-            # Add journal entries to child table
+            journal_entries = []
+            if ledger_accounts:
+                journal_entries = frappe.db.sql("""
+                    SELECT
+                        voucher_no as journal_entry,
+                        posting_date,
+                        account,
+                        SUM(debit) as total_debit
+                    FROM `tabGL Entry`
+                    WHERE account IN %(accounts)s
+                        AND voucher_type = 'Journal Entry'
+                        AND company = %(company)s
+                        AND posting_date BETWEEN %(from_date)s AND %(to_date)s
+                        AND is_cancelled = 0
+                    GROUP BY voucher_no, posting_date, account
+                    HAVING SUM(debit) > 0
+                    ORDER BY posting_date DESC
+                """, {
+                    'accounts': ledger_accounts,
+                    'company': self.company,
+                    'from_date': self.from_date,
+                    'to_date': self.to_date
+                }, as_dict=True)
+            
+            # Replace the child table with the entries for the current inputs
+            self.journal_entries = []
             for entry in journal_entries:
                 self.append("journal_entries", {
                     "journal_entry": entry.journal_entry,
@@ -109,27 +135,43 @@ class ZakaahCalculationRun(Document):
                     "account": entry.account,
                     "total_debit": entry.total_debit or 0
                 })
+            
+            self.journal_entries_fingerprint = fingerprint
                 
-        except Exception as e:
-            frappe.log_error(f"Error loading journal entries: {str(e)}", "Load Journal Entries Error")
+        except Exception:
+            frappe.log_error(title="Load Journal Entries Error", message=frappe.get_traceback())
     
-    def before_save(self):
-        """Calculate Zakaah before saving if status is Draft"""
+    def on_update(self):
+        """Queue the Zakaah calculation in the background if status is Draft"""
+        if self.flags.in_zakaah_calculation:
+            return
+
         if self.status == "Draft" and self.company and self.to_date:
             try:
-                self.calculate_zakaah()
-            except Exception as e:
+                enqueue_calculation_job(self.name, enqueue_after_commit=True)
+            except Exception:
                 # Don't throw error, just log it
-                frappe.log_error(f"Error calculating zakaah: {str(e)}")
+                frappe.log_error(title="Zakaah Calculation Queue Error", message=frappe.get_traceback())
     
-    def on_submit(self):
-        """Calculate Zakaah when submitted"""
+    def before_submit(self):
+        """Calculate Zakaah when submitted without a prior calculation"""
         if self.status == "Draft":
             self.calculate_zakaah()
     
-    def calculate_zakaah(self):
-        """Main calculation method"""
+    def on_submit(self):
+        refresh_year_summaries([self.name])
+    
+    def on_cancel(self):
+        refresh_year_summaries([self.name])
+    
+    def calculate_zakaah(self, progress=None):
+        """Main calculation method
+
+        progress is an optional callback receiving (stage, percent) as each
+        step of the calculation completes.
+        """
         frappe.msgprint(_("Calculating Zakaah... This may take a few moments."))
+        progress = progress or (lambda stage, percent: None)
         
         try:
             # Check if dates are set
@@ -138,12 +180,13 @@ class ZakaahCalculationRun(Document):
             
             # Get assets configuration for company and fiscal year
             config = get_zakaah_assets_config(self.company, self.fiscal_year)
+            progress("Configuration", 10)
             
             # Clear existing items
             self.items = []
             
             # Calculate all assets AND populate items table
-            assets = self.calculate_assets(config, self.company)
+            assets = self.calculate_assets(config, self.company, progress=progress)
             
             # Show warning if assets are 0
             if assets['total_in_egp'] == 0:
@@ -151,6 +194,7 @@ class ZakaahCalculationRun(Document):
             
             # Get gold price
             gold_info = self.get_gold_price_info()
+            progress("Gold Price", 85)
             
             # Calculate Nisab and Zakaah
             zakaah_info = self.calculate_nisab_and_zakaah(assets['total_in_egp'], gold_info['price'])
@@ -169,150 +213,67 @@ class ZakaahCalculationRun(Document):
             frappe.msgprint(f"Calculation error: {str(e)}", indicator='red')
             raise
     
-    def calculate_assets(self, config, company=None):
-        """Calculate all assets based on configuration"""
-        assets = {
-            'cash': 0,
-            'inventory': 0,
-            'receivables': 0,
-            'liabilities': 0,
-            'reserves': 0
-        }
-        
-        # frappe.log_error(f"Dates: {self.to_date}, Company: {company}", "Zakaah Calc")  # Debug logging removed
+    def calculate_assets(self, config, company=None, progress=None):
+        """Calculate all assets based on configuration
 
-        # Cash accounts
-        for idx, row in enumerate(config.get('cash_accounts', [])):
-            # Now row should be a dict, access with .get()
-            account_name = row.get('account') if isinstance(row, dict) else None
-            # frappe.log_error(f"Cash row {idx}: account={account_name}", "Zakaah Config")  # Debug logging removed
-            if account_name:
-                balance = get_account_balance(account_name, self.to_date, company)
-                # frappe.log_error(f"Cash: {account_name} = {balance:.0f}", "Zakaah Calc")  # Debug logging removed
-                assets['cash'] += balance
-                
-                # Add to items table
-                if balance > 0:
-                    self.append("items", {
-                        "asset_category": "Cash",
-                        "account": account_name,
-                        "balance": balance,
-                        "currency": "EGP",
-                        "exchange_rate": 1,
-                        "sub_total": balance
-                    })
-            # else:
-                # frappe.log_error(f"Err: No account in row {idx}", "Zakaah Calc")  # Debug logging removed
+        Every asset category of ASSET_CATEGORIES is totalled from a single
+        balance query and its accounts with a balance are added to items.
+        Balances are read in account currency and converted to the company
+        currency at the rates of the gold price date.
+        """
+        progress = progress or (lambda stage, percent: None)
 
-        # Inventory accounts
-        for idx, row in enumerate(config.get('inventory_accounts', [])):
-            account_name = row.get('account') if isinstance(row, dict) else None
-            if account_name:
-                balance = get_account_balance(account_name, self.to_date, company)
-                # frappe.log_error(f"Inv: {account_name} = {balance:.0f}", "Zakaah Calc")  # Debug logging removed
-                assets['inventory'] += balance
-                
-                if balance > 0:
-                    self.append("items", {
-                        "asset_category": "Inventory",
-                        "account": account_name,
-                        "balance": balance,
-                        "currency": "EGP",
-                        "exchange_rate": 1,
-                        "sub_total": balance
-                    })
-        
-        # Receivables
-        for idx, row in enumerate(config.get('receivable_accounts', [])):
-            account_name = row.get('account') if isinstance(row, dict) else None
-            if account_name:
-                balance = get_account_balance(account_name, self.to_date, company)
-                # frappe.log_error(f"Recv: {account_name} = {balance:.0f}", "Zakaah Calc")  # Debug logging removed
-                assets['receivables'] += balance
-                
-                if balance > 0:
-                    self.append("items", {
-                        "asset_category": "Receivables",
-                        "account": account_name,
-                        "balance": balance,
-                        "currency": "EGP",
-                        "exchange_rate": 1,
-                        "sub_total": balance
-                    })
-        
-        # Payables (subtract from assets)
-        for idx, row in enumerate(config.get('liabilities_accounts', [])):
-            account_name = row.get('account') if isinstance(row, dict) else None
-            if account_name:
-                balance = get_account_balance(account_name, self.to_date, company)
-                # frappe.log_error(f"Pay: {account_name} = {balance:.0f}", "Zakaah Calc")  # Debug logging removed
-                # Liabilities, add to deduct from assets
-                assets['liabilities'] += balance
-                
-                if balance > 0:
-                    self.append("items", {
-                        "asset_category": "Liabilities",
-                        "account": account_name,
-                        "balance": balance,
-                        "currency": "EGP",
-                        "exchange_rate": 1,
-                        "sub_total": balance
-                    })
-        
-        # Reserves
-        for idx, row in enumerate(config.get('reserve_accounts', [])):
-            account_name = row.get('account') if isinstance(row, dict) else None
-            if account_name:
-                balance = get_account_balance(account_name, self.to_date, company)
-                # frappe.log_error(f"Resv: {account_name} = {balance:.0f}", "Zakaah Calc")  # Debug logging removed
-                assets['reserves'] += balance
-                
-                if balance > 0:
-                    self.append("items", {
-                        "asset_category": "Reserves",
-                        "account": account_name,
-                        "balance": balance,
-                        "currency": "EGP",
-                        "exchange_rate": 1,
-                        "sub_total": balance
-                    })
-        
-        # Calculate total
-        assets['total_in_egp'] = (
-            assets['cash'] +
-            assets['inventory'] +
-            assets['receivables'] -
-            assets['liabilities'] +
-            assets['reserves']
-        )
+        # Resolve the balances of every configured account in one GL Entry pass
+        balances = get_config_balances(config, self.to_date, company)
+        currencies, rates = self.get_exchange_rates(balances, company)
+        progress("Balances", 30)
+
+        # One progress stage per asset category, from 30 to 80 percent
+        def category_progress(category):
+            done = ASSET_CATEGORIES.index(category) + 1
+            progress(category.label, 30 + 50 * done // len(ASSET_CATEGORIES))
+
+        assets, items = get_category_totals(config, balances, currencies, rates, progress=category_progress)
+        for item in items:
+            self.append("items", item)
 
-        # Log summary (Debug logging removed)
-        # frappe.log_error(f"Total: c={assets['cash']:.0f} i={assets['inventory']:.0f} tot={assets['total_in_egp']:.0f}", "Zakaah Calc")
+        zakaah_log.debug("Zakaah Calc", run=self.name, company=company, to_date=self.to_date, **assets)
 
         return assets
     
+    def get_exchange_rates(self, balances, company=None):
+        """Get the currency of every balance and one rate table converting them to company currency"""
+        from techstation_zakaah.zakaah_management.balances import get_balance_currencies
+        from techstation_zakaah.zakaah_management.exchange_rates import get_exchange_rates
+
+        # Accounts without a balance need no rate
+        currencies = get_balance_currencies([account for account, balance in balances.items() if balance])
+        company_currency = frappe.get_cached_value("Company", company or self.company, "default_currency")
+        rates = get_exchange_rates(currencies.values(), company_currency, self.gold_price_date or self.to_date)
+
+        return currencies, rates
+    
     def get_gold_price_info(self):
         """Get gold price for calculation date"""
         # Use the selected gold price date, or fall back to to_date
         price_date = self.gold_price_date or self.to_date
         
-        price = frappe.db.get_value("Gold Price", 
-                                   {"price_date": price_date}, 
-                                   "price_per_gram_24k")
-        
-        # If not found, try to fetch it from the website
+        from techstation_zakaah.zakaah_management.gold_prices import get_gold_price
+
+        # Latest price on or before the date, from the cached gold price series
+        found_date, price = get_gold_price(price_date)
+
+        if price and found_date != getdate(price_date):
+            frappe.msgprint(_("No gold price found for {0}. Using the price of {1}.").format(
+                formatdate(price_date), formatdate(found_date)), indicator='orange')
+
+        # If there is no earlier price at all, use default
         if not price:
-            try:
-                # Import the whitelist function to fetch price
-                from techstation_zakaah.zakaah_management.doctype.gold_price.gold_price import get_gold_price_for_date
-                price = get_gold_price_for_date(price_date)
-                
-                # If still not found, use default
-                if not price:
-                    price = 6171
-            except Exception as e:
-                frappe.log_error(f"Error fetching gold price: {str(e)}")
-                price = 6171
+            frappe.msgprint(_("No gold price found on or before {0}. Using the default price of {1} per gram.").format(
+                formatdate(price_date), DEFAULT_GOLD_PRICE), indicator='orange')
+            zakaah_log.warning("Zakaah Gold Price", message="No gold price on or before date",
+                               price_date=price_date, default_price=DEFAULT_GOLD_PRICE)
+            price = DEFAULT_GOLD_PRICE
         
         return {
             'date': price_date,
@@ -324,19 +285,15 @@ class ZakaahCalculationRun(Document):
         # Get number of owners (default to 1 if not set)
         owners_count = self.owners_count or 1
         
-        # Calculate nisab: owners_count * 85 * gold_price
-        nisab_grams = owners_count * 85
-        nisab_value = nisab_grams * gold_price
-        
-        assets_in_gold = total_assets / gold_price
-        meets_nisab = assets_in_gold >= nisab_grams
-        
-        if meets_nisab:
-            zakaah_amount = total_assets * 0.025
-            status = "Calculated"
-        else:
-            zakaah_amount = 0
-            status = "Not Due"
+        from techstation_zakaah.zakaah_management.scenarios import evaluate_nisab_and_zakaah
+
+        # Calculate nisab: owners_count * 85 * gold_price, as a single scenario
+        result = evaluate_nisab_and_zakaah(total_assets, gold_price, owners_count)
+        nisab_value = result['nisab_value'][0]
+        assets_in_gold = result['assets_in_gold_grams'][0]
+        meets_nisab = result['meets_nisab'][0]
+        zakaah_amount = result['zakaah_amount'][0]
+        status = "Calculated" if meets_nisab else "Not Due"
         
         return {
             'nisab_value': nisab_value,
@@ -347,11 +304,9 @@ class ZakaahCalculationRun(Document):
         }
     
     def update_asset_fields(self, assets):
-        self.cash_balance = assets['cash']
-        self.inventory_balance = assets['inventory']
-        self.receivables = assets['receivables']
-        self.liabilities = assets['liabilities']
-        self.reserves = assets.get('reserves', 0)
+        for category in ASSET_CATEGORIES:
+            self.set(category.field, assets.get(category.key, 0))
+        # total_in_egp is in company currency, whatever the company's currency is
         self.total_assets = assets['total_in_egp']
     
     def update_gold_fields(self, gold_info, zakaah_info):
@@ -368,107 +323,194 @@ class ZakaahCalculationRun(Document):
 
 # Helper functions
 def get_zakaah_assets_config(company, fiscal_year=None):
-    """Get assets configuration for company and fiscal year"""
+    """Get assets configuration for company and fiscal year
+
+    The resolved configuration comes from the configuration cache, see
+    techstation_zakaah.zakaah_management.config.get_resolved_config.
+    """
+    from techstation_zakaah.zakaah_management.config import get_resolved_config
+
     try:
-        filters = {"company": company}
-        if fiscal_year:
-            filters["fiscal_year"] = fiscal_year
-        
-        # Try to find config by company and fiscal year
-        config_list = frappe.get_all("Zakaah Assets Configuration", 
-                                     filters=filters, 
-                                     limit=1)
-        
-        if not config_list and fiscal_year:
-            # If not found with fiscal year, try without fiscal year
-            config_list = frappe.get_all("Zakaah Assets Configuration", 
-                                        filters={"company": company}, 
-                                        limit=1)
-            if config_list:
-                frappe.msgprint(_("Warning: No Zakaah Assets Configuration found for company {0} and fiscal year {1}. Using configuration without fiscal year.").format(company, fiscal_year), indicator='orange')
-        
-        if not config_list:
-            # Try to get any default config
-            config_list = frappe.get_all("Zakaah Assets Configuration", limit=1)
-            if config_list:
-                frappe.msgprint(_("Warning: No Zakaah Assets Configuration found for company {0}. Using default configuration.").format(company), indicator='orange')
-        
-        if not config_list:
+        config = get_resolved_config(company, fiscal_year)
+
+        if config["resolved_by"] == "company" and fiscal_year:
+            frappe.msgprint(_("Warning: No Zakaah Assets Configuration found for company {0} and fiscal year {1}. Using configuration without fiscal year.").format(company, fiscal_year), indicator='orange')
+        elif config["resolved_by"] == "default":
+            frappe.msgprint(_("Warning: No Zakaah Assets Configuration found for company {0}. Using default configuration.").format(company), indicator='orange')
+
+        if not config["name"]:
             frappe.throw(_("No Zakaah Assets Configuration found. Please create one in Zakaah Assets Configuration DocType."))
-        
-        config_doc = frappe.get_doc("Zakaah Assets Configuration", config_list[0].name)
-        
-        # Get child tables as dicts for easier access
-        cash_accounts = []
-        for row in (config_doc.cash_accounts or []):
-            if isinstance(row, dict):
-                cash_accounts.append(row)
-            else:
-                # Convert child doc to dict
-                cash_accounts.append(row.as_dict())
-        
-        inventory_accounts = []
-        for row in (config_doc.inventory_accounts or []):
-            if isinstance(row, dict):
-                inventory_accounts.append(row)
-            else:
-                inventory_accounts.append(row.as_dict())
-        
-        receivable_accounts = []
-        for row in (config_doc.receivable_accounts or []):
-            if isinstance(row, dict):
-                receivable_accounts.append(row)
-            else:
-                receivable_accounts.append(row.as_dict())
-        
-        payable_accounts = []
-        for row in (config_doc.liabilities_accounts or []):
-            if isinstance(row, dict):
-                payable_accounts.append(row)
-            else:
-                payable_accounts.append(row.as_dict())
-        
-        reserve_accounts = []
-        for row in (config_doc.reserve_accounts or []):
-            if isinstance(row, dict):
-                reserve_accounts.append(row)
-            else:
-                reserve_accounts.append(row.as_dict())
-        
-        # Log actual account names (Debug logging removed)
-        # cash_names = [row.get('account') for row in cash_accounts if row.get('account')]
-        # inventory_names = [row.get('account') for row in inventory_accounts if row.get('account')]
-        # frappe.log_error(f"Cash accounts configured: {cash_names}", "Zakaah Config")
-        # frappe.log_error(f"Inventory accounts configured: {inventory_names}", "Zakaah Config")
 
         # Check if any accounts are configured
-        total_accounts = (len(cash_accounts) + len(inventory_accounts) + 
-                         len(receivable_accounts) + len(payable_accounts) + 
-                         len(reserve_accounts))
-        
-        if total_accounts == 0:
+        if not any(config[table] for table in BALANCE_TABLES):
             frappe.throw(_("No accounts configured in Zakaah Assets Configuration. Please add accounts in the configuration document."))
         
-        return {
-            'cash_accounts': cash_accounts,
-            'inventory_accounts': inventory_accounts,
-            'receivable_accounts': receivable_accounts,
-            'liabilities_accounts': payable_accounts,
-            'reserve_accounts': reserve_accounts
-        }
+        return {table: config[table] for table in BALANCE_TABLES}
     except Exception as e:
-        frappe.log_error(f"Error getting config", "Zakaah Config")
+        frappe.log_error(title="Zakaah Config", message=frappe.get_traceback())
         frappe.throw(_("Error getting Zakaah Assets Configuration: {0}").format(str(e)))
 
 @frappe.whitelist()
+@instrument
+def get_run_context(company=None, fiscal_year=None, gold_price_date=None):
+    """Get what the run form needs when it opens or its dates change, in one response
+
+    Returns the fiscal year dates, the payment accounts the run loads on save,
+    the gold price for gold_price_date (default the fiscal year end) with the
+    nearest earlier price as fallback, and summaries of the company's latest
+    runs. Fiscal year, configuration and gold prices all come from their
+    caches, so only the run summaries are read from the database.
+    """
+    from techstation_zakaah.zakaah_management.config import get_resolved_config
+    from techstation_zakaah.zakaah_management.gold_prices import get_gold_price, get_gold_price_series
+
+    frappe.has_permission("Zakaah Calculation Run", "read", throw=True)
+
+    context = {
+        "from_date": None,
+        "to_date": None,
+        "payment_accounts": [],
+        "gold_price": None,
+        "previous_runs": []
+    }
+
+    if fiscal_year:
+        context["from_date"], context["to_date"] = frappe.get_cached_value(
+            "Fiscal Year", fiscal_year, ["year_start_date", "year_end_date"]
+        ) or (None, None)
+
+    # Same rule as ZakaahCalculationRun._load_payment_accounts
+    if company and fiscal_year:
+        config = get_resolved_config(company, fiscal_year)
+        if config["resolved_by"] == "fiscal_year":
+            context["payment_accounts"] = [
+                {"account": acc.account, "debit": acc.debit or 0}
+                for acc in config["payment_accounts"]
+            ]
+
+    gold_price_date = gold_price_date or context["to_date"]
+    if gold_price_date:
+        gold_price_date = getdate(gold_price_date)
+        price_date, price = get_gold_price(gold_price_date)
+        context["gold_price"] = {
+            "date": gold_price_date,
+            "price_date": price_date,
+            "price": price,
+            "exact": price_date == gold_price_date,
+            # Shown when there is no price on or before the date at all
+            "latest_dates": [] if price else get_gold_price_series()[0][-10:][::-1]
+        }
+
+    if company:
+        context["previous_runs"] = frappe.get_all(
+            "Zakaah Calculation Run",
+            filters={"company": company, "docstatus": ("<", 2)},
+            fields=["name", "fiscal_year", "to_date", "total_assets", "total_zakaah",
+                    "paid_zakaah", "outstanding_zakaah", "status"],
+            order_by="to_date desc, creation desc",
+            limit=5
+        )
+
+    return context
+
+@frappe.whitelist()
+@instrument
 def calculate_zakaah_for_run(name):
     """Calculate zakaah for a specific run"""
     doc = frappe.get_doc("Zakaah Calculation Run", name)
-    doc.calculate_zakaah()
-    doc.save()
+    # Flags the save as a calculation so on_update does not queue another one
+    calculate_and_save(doc)
     return doc
 
 @frappe.whitelist()
+@instrument
+def enqueue_calculation(name):
+    """Queue the zakaah calculation for a run as a background job"""
+    from frappe.utils.background_jobs import is_job_enqueued
+
+    doc = frappe.get_doc("Zakaah Calculation Run", name)
+    doc.check_permission("write")
+
+    if doc.docstatus != 0:
+        frappe.throw(_("Only draft Zakaah Calculation Runs can be recalculated"))
+
+    if doc.is_locked or is_job_enqueued(get_calculation_job_id(name)):
+        frappe.throw(_("Zakaah calculation is already running for {0}").format(name))
+
+    enqueue_calculation_job(name)
+    return {"job_id": get_calculation_job_id(name)}
+
+def enqueue_calculation_job(name, enqueue_after_commit=False):
+    frappe.enqueue(
+        "techstation_zakaah.zakaah_management.doctype.zakaah_calculation_run.zakaah_calculation_run.run_calculation_job",
+        queue="long",
+        timeout=3600,
+        job_id=get_calculation_job_id(name),
+        deduplicate=True,
+        enqueue_after_commit=enqueue_after_commit,
+        run_name=name
+    )
+
+def get_calculation_job_id(name):
+    return f"zakaah_calculation::{name}"
+
+def run_calculation_job(run_name):
+    """Calculate a run in the background and write the results back in one save.
+
+    The run is locked while the calculation is in progress so that a second
+    job for the same run exits instead of computing twice.
+    """
+    doc = frappe.get_doc("Zakaah Calculation Run", run_name)
+
+    try:
+        calculate_and_save(doc, progress=lambda stage, percent: publish_calculation_progress(run_name, stage, percent))
+        frappe.db.commit()
+
+        publish_calculation_progress(run_name, "Completed", 100, status="Completed")
+    except frappe.DocumentLockedError:
+        publish_calculation_progress(run_name, "Locked", 0, status="Failed",
+                                     message=_("Zakaah calculation is already running for {0}").format(run_name))
+    except Exception as e:
+        frappe.db.rollback()
+        doc.log_error("Zakaah Calculation Job Error")
+        publish_calculation_progress(run_name, "Failed", 100, status="Failed", message=str(e))
+
+def calculate_and_save(doc, progress=None):
+    """Calculate a run under its document lock and save the results.
+
+    Raises frappe.DocumentLockedError if another process is calculating the
+    same run. The caller commits.
+    """
+    doc.lock()
+
+    try:
+        doc.calculate_zakaah(progress=progress)
+        if progress:
+            progress("Saving", 95)
+
+        # Release the lock before saving, a locked document cannot be saved
+        doc.unlock()
+        doc.flags.in_zakaah_calculation = True
+        doc.save()
+    finally:
+        doc.unlock()
+
+def publish_calculation_progress(run_name, stage, percent, status="Running", message=None):
+    frappe.publish_realtime(
+        "zakaah_calculation_progress",
+        {
+            "name": run_name,
+            "stage": stage,
+            "progress": percent,
+            "status": status,
+            "message": message
+        },
+        doctype="Zakaah Calculation Run",
+        docname=run_name
+    )
+
+@frappe.whitelist()
+@instrument
 def get_journal_entries_for_calculation_run(calculation_run_name):
     """Get Journal Entries that involve Zakaah payment accounts"""
     try:
@@ -508,11 +550,12 @@ def get_journal_entries_for_calculation_run(calculation_run_name):
         
         return journal_entries
         
-    except Exception as e:
-        frappe.log_error(f"Error getting journal entries: {str(e)}", "Journal Entries Error")
+    except Exception:
+        frappe.log_error(title="Journal Entries Error", message=frappe.get_traceback())
         return []
 
 @frappe.whitelist()
+@instrument
 def debug_all_config_accounts(company, fiscal_year, to_date):
     """Debug function to check all configured accounts"""
     try:
@@ -534,11 +577,13 @@ def debug_all_config_accounts(company, fiscal_year, to_date):
                 'to': str(fy_doc.year_end_date)
             }
         
+        balances = get_config_balances(config, to_date, company)
+
         # Check ALL cash accounts
         for row in config.get('cash_accounts', []):
             account_name = row.get('account') if isinstance(row, dict) else None
             if account_name:
-                balance = get_account_balance(account_name, to_date, company)
+                balance = balances.get(account_name, 0)
                 results['cash_accounts'].append({
                     'account': account_name,
                     'balance': balance
@@ -549,7 +594,7 @@ def debug_all_config_accounts(company, fiscal_year, to_date):
         for row in config.get('inventory_accounts', []):
             account_name = row.get('account') if isinstance(row, dict) else None
             if account_name:
-                balance = get_account_balance(account_name, to_date, company)
+                balance = balances.get(account_name, 0)
                 results['inventory_accounts'].append({
                     'account': account_name,
                     'balance': balance
@@ -560,6 +605,24 @@ def debug_all_config_accounts(company, fiscal_year, to_date):
     except Exception as e:
         return {"error": str(e)}
 
+def get_config_balances(config, date, company=None):
+    """Get balances of all accounts in a resolved configuration in one query.
+
+    Returns a dict of account -> absolute balance, matching get_account_balance
+    for each account.
+    """
+    from techstation_zakaah.zakaah_management.balances import get_account_balances
+
+    accounts = get_category_accounts(config)
+
+    try:
+        balances = get_account_balances(accounts, date, company)
+    except Exception:
+        frappe.log_error(title="Account Balance", message=frappe.get_traceback())
+        return {}
+
+    return {account: flt(abs(balance or 0)) for account, balance in balances.items()}
+
 def get_account_balance(account, date, company=None):
     """Get account balance as of date using ERPNext's get_balance_on.
 
@@ -585,8 +648,8 @@ def get_account_balance(account, date, company=None):
 
         return flt(balance_value)
 
-    except Exception as e:
-        frappe.log_error(f"Error getting balance for {account}: {str(e)[:100]}", "Account Balance")
+    except Exception:
+        frappe.log_error(title="Account Balance", message=f"Account: {account}\n\n{frappe.get_traceback()}")
         return 0
 
 
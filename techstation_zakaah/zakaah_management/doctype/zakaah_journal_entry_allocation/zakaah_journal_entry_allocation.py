@@ -0,0 +1,112 @@
+from __future__ import unicode_literals
+from frappe.model.document import Document
+import frappe
+from frappe.utils import flt, now
+
+class ZakaahJournalEntryAllocation(Document):
+	pass
+
+
+def update_journal_entry_allocations(journal_entries):
+	"""Rebuild the allocation summary rows of the given journal entries.
+
+	Totals are recomputed from the journal entry and its draft and submitted
+	Zakaah Allocation History rows, so the call is idempotent and only reads
+	the history of the journal entries involved. A journal entry that is no
+	longer submitted has no debit left to allocate. Runs inside the caller's
+	transaction.
+	"""
+	journal_entries = list(set(je for je in journal_entries or [] if je))
+	if not journal_entries:
+		return
+
+	timestamp = now()
+	frappe.db.sql("""
+		INSERT INTO `tabZakaah Journal Entry Allocation`
+			(name, journal_entry, total_debit, total_allocated, unallocated_amount,
+			creation, modified, owner, modified_by, docstatus)
+		SELECT
+			jea.parent,
+			jea.parent,
+			SUM(IF(je.docstatus = 1, jea.debit, 0)),
+			COALESCE(alloc.total_allocated, 0),
+			SUM(IF(je.docstatus = 1, jea.debit, 0)) - COALESCE(alloc.total_allocated, 0),
+			%(timestamp)s, %(timestamp)s, %(user)s, %(user)s, 0
+		FROM `tabJournal Entry Account` jea
+		INNER JOIN `tabJournal Entry` je ON je.name = jea.parent
+		LEFT JOIN (
+			SELECT journal_entry, SUM(allocated_amount) AS total_allocated
+			FROM `tabZakaah Allocation History`
+			WHERE journal_entry IN %(journal_entries)s
+			AND docstatus != 2
+			GROUP BY journal_entry
+		) alloc ON alloc.journal_entry = jea.parent
+		WHERE jea.parent IN %(journal_entries)s
+		GROUP BY jea.parent, alloc.total_allocated
+		ON DUPLICATE KEY UPDATE
+			total_debit = VALUES(total_debit),
+			total_allocated = VALUES(total_allocated),
+			unallocated_amount = VALUES(unallocated_amount),
+			modified = VALUES(modified),
+			modified_by = VALUES(modified_by)
+	""", {
+		"journal_entries": journal_entries,
+		"timestamp": timestamp,
+		"user": frappe.session.user
+	})
+
+
+def refresh_journal_entry_allocation(doc, method=None):
+	"""Refresh the allocation summary of a Journal Entry when it is cancelled, if it has one"""
+	if frappe.db.exists("Zakaah Journal Entry Allocation", doc.name):
+		update_journal_entry_allocations([doc.name])
+
+
+def lock_allocated_amounts(journal_entries):
+	"""Lock the allocation summary rows of the given journal entries and get their totals.
+
+	Only submitted journal entries are locked and returned, the others cannot
+	be allocated. Rows are locked in name order, together with the Journal
+	Entry rows since a summary row does not exist before the first
+	allocation. A concurrent allocation of the same journal entries waits
+	until this transaction ends and then reads the totals it committed.
+	"""
+	journal_entries = sorted(set(je for je in journal_entries or [] if je))
+	if not journal_entries:
+		return {}
+
+	return {
+		row.name: flt(row.total_allocated)
+		for row in frappe.db.sql("""
+			SELECT je.name, jea.total_allocated
+			FROM `tabJournal Entry` je
+			LEFT JOIN `tabZakaah Journal Entry Allocation` jea ON jea.name = je.name
+			WHERE je.name IN %(journal_entries)s
+			AND je.docstatus = 1
+			ORDER BY je.name
+			FOR UPDATE
+		""", {"journal_entries": journal_entries}, as_dict=True)
+	}
+
+
+def get_journal_entry_allocation(journal_entry):
+	"""Get total debit and allocated amount of one journal entry"""
+	summary = frappe.db.get_value(
+		"Zakaah Journal Entry Allocation",
+		journal_entry,
+		["total_debit", "total_allocated"],
+		as_dict=True
+	)
+	if summary:
+		return frappe._dict(total_debit=flt(summary.total_debit), total_allocated=flt(summary.total_allocated))
+
+	# Not allocated yet, only the journal entry amount is needed
+	je_amount = frappe.db.sql("""
+		SELECT SUM(jea.debit)
+		FROM `tabJournal Entry Account` jea
+		INNER JOIN `tabJournal Entry` je ON je.name = jea.parent
+		WHERE jea.parent = %s
+		AND je.docstatus = 1
+	""", journal_entry)
+
+	return frappe._dict(total_debit=flt(je_amount[0][0]) if je_amount else 0, total_allocated=0)
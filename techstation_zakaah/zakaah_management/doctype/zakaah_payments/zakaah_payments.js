@@ -54,12 +54,28 @@ frappe.ui.form.on("Zakaah Payments", {
 			}).addClass('btn-primary');
 		}
 
+		// Next page of journal entries, shown while the last import has more
+		if (frm.doc.docstatus === 0 && frm.journal_entry_cursor) {
+			frm.add_custom_button(__("Load More Entries"), function() {
+				frm.trigger("load_journal_entries");
+			});
+		} else {
+			frm.remove_custom_button(__("Load More Entries"));
+		}
+
 		// Right side - Actions dropdown
 		// View Allocation History under Actions
 		frm.add_custom_button(__("View Allocation History"), function() {
 			frm.trigger("load_allocation_history");
 		}, __("Actions"));
 
+		// Next page of allocation history, shown while the last load has more
+		if (frm.allocation_history_cursor) {
+			frm.add_custom_button(__("Load More History"), function() {
+				frm.events.fetch_allocation_history(frm);
+			}, __("Actions"));
+		}
+
 		// Add Clear button under Actions
 		if (frm.doc.docstatus === 0) {
 			frm.add_custom_button(__("Clear All Entries"), function() {
@@ -70,6 +86,9 @@ frappe.ui.form.on("Zakaah Payments", {
 						frm.clear_table('calculation_runs');
 						frm.clear_table('payment_entries');
 						frm.clear_table('allocation_history');
+						frm.journal_entry_cursor = null;
+						frm.allocation_history_cursor = null;
+						frm.remove_custom_button(__("Load More History"), __("Actions"));
 						frm.refresh_fields();
 						frappe.show_alert({
 							message: __('All entries cleared'),
@@ -236,72 +255,89 @@ frappe.ui.form.on("Zakaah Payments", {
 				// Load calculation runs (unreconciled only)
 				frm.trigger('load_calculation_runs');
 				
-				// Load journal entries (unreconciled only)
-				frappe.call({
-					method: 'techstation_zakaah.zakaah_management.doctype.zakaah_payments.zakaah_payments.import_journal_entries',
-					args: {
-						company: frm.doc.company,
-						from_date: frm.doc.from_date,
-						to_date: frm.doc.to_date,
-						selected_accounts: selected_accounts
-					},
-					callback: function(r) {
-						if (r.message) {
-							let journal_entry_records = r.message.journal_entry_records || [];
-							let skipped_count = r.message.skipped_count || 0;
-							
-							// Remove placeholder rows before clearing
-							if (frm.doc.payment_entries) {
-								frm.doc.payment_entries.forEach((row, idx) => {
-									if (row._placeholder) {
-										frm.get_field('payment_entries').grid.grid_rows[idx].remove();
-									}
-								});
-							}
-							
-							frm.clear_table('payment_entries');
-
-							let total_unreconciled = 0;
-							if (journal_entry_records && journal_entry_records.length > 0) {
-								journal_entry_records.forEach(function(record) {
-									let row = frm.add_child('payment_entries');
-									row.posting_date = record.posting_date;
-									row.journal_entry = record.journal_entry;
-									row.debit = record.debit;
-									row.credit = record.credit;
-									row.balance = record.balance;
-									row.remarks = record.remarks || '';
-									row.allocated_amount = record.allocated_amount || 0;
-									row.unallocated_amount = record.unallocated_amount || record.debit || 0;
-
-									// Add to total unreconciled
-									total_unreconciled += (row.unallocated_amount || 0);
-								});
-							} else {
-								// If no records, add placeholder to keep table visible
-								let placeholder = frm.add_child('payment_entries');
-								placeholder.journal_entry = '';
-								placeholder._placeholder = true;
+				// Load journal entries (unreconciled only), first page
+				frm.doc.payment_accounts = selected_accounts;
+				frm.journal_entry_cursor = null;
+				frm.journal_entry_skipped_count = 0;
+				frm.trigger('load_journal_entries');
+			}
+		});
+	},
+
+	load_journal_entries(frm) {
+		// Appends the next page of unreconciled entries; a new load starts
+		// with no cursor and clears the table first
+		let is_first_page = !frm.journal_entry_cursor;
+
+		frappe.call({
+			method: 'techstation_zakaah.zakaah_management.doctype.zakaah_payments.zakaah_payments.import_journal_entries',
+			args: {
+				company: frm.doc.company,
+				from_date: frm.doc.from_date,
+				to_date: frm.doc.to_date,
+				selected_accounts: frm.doc.payment_accounts,
+				cursor: frm.journal_entry_cursor
+			},
+			callback: function(r) {
+				if (r.message) {
+					let journal_entry_records = r.message.journal_entry_records || [];
+					frm.journal_entry_skipped_count += r.message.skipped_count || 0;
+					frm.journal_entry_cursor = r.message.has_more ? r.message.next_cursor : null;
+
+					// Remove placeholder rows before adding entries
+					if (frm.doc.payment_entries) {
+						frm.doc.payment_entries.forEach((row, idx) => {
+							if (row._placeholder) {
+								frm.get_field('payment_entries').grid.grid_rows[idx].remove();
 							}
+						});
+					}
 
-							frm.refresh_field('payment_entries');
+					if (is_first_page) {
+						frm.clear_table('payment_entries');
+					}
 
-							// Set total journal entries unreconciled
-							frm.set_value('total_journal_entries', total_unreconciled);
+					journal_entry_records.forEach(function(record) {
+						let row = frm.add_child('payment_entries');
+						row.posting_date = record.posting_date;
+						row.journal_entry = record.journal_entry;
+						row.debit = record.debit;
+						row.credit = record.credit;
+						row.balance = record.balance;
+						row.remarks = record.remarks || '';
+						row.allocated_amount = record.allocated_amount || 0;
+						row.unallocated_amount = record.unallocated_amount || record.debit || 0;
+					});
 
-							frm.trigger('refresh');
-							
-							let message = __('Loaded {0} unreconciled entries', [journal_entry_records.length]);
-							if (skipped_count > 0) {
-								message += '. ' + __('Skipped {0} already fully allocated', [skipped_count]);
-							}
-							frappe.show_alert({
-								message: message,
-								indicator: 'green'
-							}, 5);
-						}
+					if (!frm.doc.payment_entries || frm.doc.payment_entries.length === 0) {
+						// If no records, add placeholder to keep table visible
+						let placeholder = frm.add_child('payment_entries');
+						placeholder.journal_entry = '';
+						placeholder._placeholder = true;
 					}
-				});
+
+					frm.refresh_field('payment_entries');
+
+					// Set total journal entries unreconciled over all loaded pages
+					let total_unreconciled = (frm.doc.payment_entries || []).reduce((sum, row) =>
+						sum + (row._placeholder ? 0 : (row.unallocated_amount || 0)), 0);
+					frm.set_value('total_journal_entries', total_unreconciled);
+
+					frm.trigger('refresh');
+
+					let loaded_count = (frm.doc.payment_entries || []).filter(row => !row._placeholder).length;
+					let message = __('Loaded {0} unreconciled entries', [loaded_count]);
+					if (frm.journal_entry_skipped_count > 0) {
+						message += '. ' + __('Skipped {0} already fully allocated', [frm.journal_entry_skipped_count]);
+					}
+					if (frm.journal_entry_cursor) {
+						message += '. ' + __('More entries available');
+					}
+					frappe.show_alert({
+						message: message,
+						indicator: 'green'
+					}, 5);
+				}
 			}
 		});
 	},
@@ -488,6 +524,10 @@ frappe.ui.form.on("Zakaah Payments", {
 			<strong>Do you want to proceed with the allocation?</strong>
 		</div>`;
 		
+		// One key per confirmed allocation, a retried request with the same
+		// key returns the first result instead of allocating again
+		let idempotency_key = frappe.utils.get_random(20);
+
 		// Confirm allocation
 		frappe.confirm(
 			message,
@@ -501,8 +541,10 @@ frappe.ui.form.on("Zakaah Payments", {
 					method: 'techstation_zakaah.zakaah_management.doctype.zakaah_payments.zakaah_payments.allocate_payments',
 					args: {
 						calculation_run_items: selected_runs,
-						journal_entries: selected_entries
+						journal_entries: selected_entries,
+						idempotency_key: idempotency_key
 					},
+					freeze: true,
 					callback: function(r) {
 						if (r.message && r.message.success) {
 							frappe.show_alert({
@@ -523,9 +565,24 @@ frappe.ui.form.on("Zakaah Payments", {
 	},
 	
 	load_allocation_history(frm) {
+		// Start again from the newest allocation
+		frm.allocation_history_cursor = null;
+		frm.events.fetch_allocation_history(frm);
+	},
+
+	fetch_allocation_history(frm) {
+		let is_first_page = !frm.allocation_history_cursor;
+
 		frappe.call({
 			method: 'techstation_zakaah.zakaah_management.doctype.zakaah_payments.zakaah_payments.get_allocation_history',
+			args: {
+				company: frm.doc.company,
+				cursor: frm.allocation_history_cursor
+			},
 			callback: function(r) {
+				let records = (r.message && r.message.records) || [];
+				frm.allocation_history_cursor = r.message && r.message.has_more ? r.message.next_cursor : null;
+
 				// Remove placeholder rows before clearing
 				if (frm.doc.allocation_history) {
 					frm.doc.allocation_history.forEach((row, idx) => {
@@ -535,10 +592,14 @@ frappe.ui.form.on("Zakaah Payments", {
 					});
 				}
 				
-				frm.clear_table('allocation_history');
+				if (is_first_page) {
+					frm.clear_table('allocation_history');
+				} else {
+					frm.doc.allocation_history = (frm.doc.allocation_history || []).filter(row => !row._placeholder);
+				}
 				
-				if (r.message && r.message.length > 0) {
-					r.message.forEach(function(record) {
+				if (records.length > 0) {
+					records.forEach(function(record) {
 						let row = frm.add_child('allocation_history');
 						row.journal_entry = record.journal_entry;
 						row.zakaah_calculation_run = record.zakaah_calculation_run;
@@ -546,7 +607,7 @@ frappe.ui.form.on("Zakaah Payments", {
 						row.unallocated_amount = record.unallocated_amount;
 						row.allocation_date = record.allocation_date;
 					});
-				} else {
+				} else if (!(frm.doc.allocation_history || []).length) {
 					// If no records, add placeholder to keep table visible
 					let placeholder = frm.add_child('allocation_history');
 					placeholder.journal_entry = '';
@@ -555,6 +616,15 @@ frappe.ui.form.on("Zakaah Payments", {
 				
 				frm.refresh_field('allocation_history');
 				frm.trigger('hide_select_columns');
+
+				// Show or drop the "Load More History" button for the new cursor
+				if (frm.allocation_history_cursor) {
+					frm.add_custom_button(__("Load More History"), function() {
+						frm.events.fetch_allocation_history(frm);
+					}, __("Actions"));
+				} else {
+					frm.remove_custom_button(__("Load More History"), __("Actions"));
+				}
 			}
 		});
 	},
@@ -3,75 +3,108 @@ from __future__ import unicode_literals
 from frappe.model.document import Document
 import frappe
 from frappe import _
-from frappe.utils import now
+from frappe.utils import cint, flt, now
+from techstation_zakaah.zakaah_management.doctype.zakaah_journal_entry_allocation.zakaah_journal_entry_allocation import (
+	lock_allocated_amounts,
+	update_journal_entry_allocations
+)
+from techstation_zakaah.zakaah_management.doctype.zakaah_year_summary.zakaah_year_summary import refresh_year_summaries
+from techstation_zakaah.zakaah_management import logger as zakaah_log
+from techstation_zakaah.zakaah_management.instrumentation import instrument
+
+# Journal entries returned per import_journal_entries call
+IMPORT_PAGE_SIZE = 500
+MAX_IMPORT_PAGE_SIZE = 2000
+
+# Allocation history records returned per get_allocation_history call
+HISTORY_PAGE_SIZE = 500
+MAX_HISTORY_PAGE_SIZE = 2000
+
+# Child tables loaded from Allocation History and GL data by the form. They
+# can hold thousands of rows, so they are never written with the document.
+TRANSIENT_TABLES = ("payment_entries", "allocation_history")
+
+# Outstanding amount and status of a run `zcr` from the allocations joined as
+# `alloc`, shared by every query that writes or checks them
+RUN_OUTSTANDING_SQL = "GREATEST(0, COALESCE(zcr.total_zakaah, 0) - COALESCE(alloc.paid, 0))"
+RUN_STATUS_SQL = """CASE
+	WHEN COALESCE(zcr.total_zakaah, 0) - COALESCE(alloc.paid, 0) <= 0 THEN 'Paid'
+	WHEN COALESCE(alloc.paid, 0) > 0 THEN 'Partially Paid'
+	ELSE 'Calculated'
+END"""
 
 class ZakaahPayments(Document):
 	def validate(self):
-		# Debug: Log what we have before cleanup
-		frappe.log_error(
-			f"Before cleanup:\n"
-			f"Calculation runs: {len(self.calculation_runs) if self.calculation_runs else 0}\n"
-			f"Payment entries: {len(self.payment_entries) if self.payment_entries else 0}\n"
-			f"Allocation history: {len(self.allocation_history) if self.allocation_history else 0}",
-			"Zakaah Payments Validate Debug"
-		)
-
 		# Remove placeholder rows before validation
 		self.remove_placeholder_rows()
-
-		# Debug: Log what we have after cleanup
-		frappe.log_error(
-			f"After cleanup:\n"
-			f"Calculation runs: {len(self.calculation_runs) if self.calculation_runs else 0}\n"
-			f"Payment entries: {len(self.payment_entries) if self.payment_entries else 0}\n"
-			f"Allocation history: {len(self.allocation_history) if self.allocation_history else 0}",
-			"Zakaah Payments Validate Debug"
-		)
+		zakaah_log.debug("Zakaah Payments Validate", name=self.name, **self.get_row_counts())
 
 		# Auto-calculate reconciliation status
 		self.update_reconciliation_status()
 
+		# Keep the transient tables out of the save, restored in on_update
+		self.flags.transient_rows = {table: self.get(table) or [] for table in TRANSIENT_TABLES}
+		for table in TRANSIENT_TABLES:
+			self.set(table, [])
+
+	def on_update(self):
+		for table, rows in (self.flags.pop("transient_rows", None) or {}).items():
+			self.set(table, rows)
+
+	def get_payment_accounts(self):
+		"""Get the payment accounts the form loaded its journal entries from.
+
+		The form sends them with the document; the company's configured
+		payment accounts, where the form reads them from, are used otherwise.
+		"""
+		import json
+
+		accounts = self.get("payment_accounts")
+		if isinstance(accounts, str):
+			accounts = json.loads(accounts)
+		return accounts or get_payment_account_names([self.company])
+
+	def get_row_counts(self):
+		return {
+			"calculation_runs": len(self.calculation_runs or []),
+			"payment_entries": len(self.payment_entries or []),
+			"allocation_history": len(self.allocation_history or [])
+		}
+
 	def remove_placeholder_rows(self):
-		"""Remove placeholder rows that have empty journal_entry or zakaah_calculation_run"""
-		# Remove empty payment entries (placeholder rows)
-		if self.payment_entries:
-			valid_entries = []
-			for row in self.payment_entries:
-				if row.journal_entry and str(row.journal_entry).strip():
-					valid_entries.append(row)
-			self.payment_entries = valid_entries
-
-		# Remove empty calculation runs (placeholder rows)
+		"""Remove placeholder rows that have an empty zakaah_calculation_run
+
+		payment_entries and allocation_history are not saved, so only
+		calculation_runs needs cleaning.
+		"""
 		if self.calculation_runs:
-			valid_runs = []
-			for row in self.calculation_runs:
-				if row.zakaah_calculation_run and str(row.zakaah_calculation_run).strip():
-					valid_runs.append(row)
-			self.calculation_runs = valid_runs
-
-		# Remove empty allocation history (placeholder rows)
-		if self.allocation_history:
-			valid_history = []
-			for row in self.allocation_history:
-				if row.journal_entry and str(row.journal_entry).strip():
-					valid_history.append(row)
-			self.allocation_history = valid_history
+			self.calculation_runs = [
+				row for row in self.calculation_runs
+				if row.zakaah_calculation_run and str(row.zakaah_calculation_run).strip()
+			]
 	
 	def update_reconciliation_status(self):
-		"""Update reconciliation status based on allocation"""
-		if not self.calculation_runs or len(self.calculation_runs) == 0:
+		"""Update reconciliation status from SQL aggregates of the runs and journal entries
+
+		The cost does not depend on how many rows the form has loaded: the
+		outstanding amount is summed from the listed runs and the journal
+		amount from the unreconciled journal entries on the payment accounts
+		the form imports from.
+		"""
+		run_names = [row.zakaah_calculation_run for row in self.calculation_runs or []]
+		if not run_names:
 			self.reconciliation_status = "Open"
 			self.total_unreconciled = 0
 			self.total_reconciled = 0
 			return
 		
-		total_unreconciled = sum([
-			(row.outstanding_zakaah or 0) for row in self.calculation_runs
-		])
+		total_unreconciled = flt(frappe.db.sql("""
+			SELECT SUM(outstanding_zakaah)
+			FROM `tabZakaah Calculation Run`
+			WHERE name IN %(runs)s
+		""", {"runs": run_names})[0][0])
 		
-		total_all_journal_amount = sum([
-			(row.debit or 0) for row in self.payment_entries
-		])
+		total_all_journal_amount = get_unreconciled_journal_total(self.company, self.get_payment_accounts())
 		
 		total_reconciled = max(0, total_all_journal_amount - total_unreconciled)
 		
@@ -86,249 +119,281 @@ class ZakaahPayments(Document):
 			self.reconciliation_status = "Open"
 
 
+def get_unreconciled_journal_total(company, accounts):
+	"""Sum the debit of the journal entries the form imports from accounts that are not fully allocated.
+
+	Reads the same journal entries as import_journal_entries, older entries
+	that still have unallocated amounts included, so the total matches the
+	entries the form lists over all of its pages.
+	"""
+	if not (company and accounts):
+		return 0.0
+
+	return flt(frappe.db.sql(f"""
+		SELECT SUM(entries.debit)
+		FROM (
+			SELECT
+				SUM(gle.debit) AS debit,
+				SUM(gle.debit) - COALESCE(alloc.total_allocated, 0) AS unallocated_amount
+			{get_journal_entry_source()}
+			GROUP BY je.name, alloc.total_allocated
+			HAVING unallocated_amount > 0
+		) entries
+	""", {"company": company, "accounts": tuple(accounts)})[0][0])
+
+
+def get_journal_entry_source(cursor=None):
+	"""Get the FROM and WHERE clauses of the journal entries the form imports.
+
+	Shared by import_journal_entries and get_unreconciled_journal_total:
+	submitted journal entries of %(company)s with GL debits to %(accounts)s,
+	their allocation summary joined as alloc. With cursor, only entries after
+	%(cursor_date)s and %(cursor_name)s are read.
+	"""
+	conditions = ""
+	if cursor:
+		# Keyset pagination: continue after the last row of the previous page
+		conditions = """
+			AND (je.posting_date > %(cursor_date)s
+				OR (je.posting_date = %(cursor_date)s AND je.name > %(cursor_name)s))
+		"""
+
+	return f"""
+		FROM `tabJournal Entry` je
+		INNER JOIN `tabGL Entry` gle ON gle.voucher_no = je.name
+		LEFT JOIN `tabZakaah Journal Entry Allocation` alloc ON alloc.name = je.name
+		WHERE je.company = %(company)s
+		AND gle.account IN %(accounts)s
+		AND je.docstatus = 1
+		AND gle.is_cancelled = 0
+		{conditions}
+	"""
+
+
 @frappe.whitelist()
+@instrument
 def get_calculation_runs(company=None, show_unreconciled_only=True):
 	"""Get Zakaah Calculation Runs
 	By default: only years with outstanding > 0 (like Payment Reconciliation)
+
+	Paid and outstanding amounts are recalculated from allocation history in
+	the same query. This is a read: runs whose stored amounts have drifted
+	are corrected by a background job instead of being written here.
 	"""
 	try:
 		if not frappe.db.exists("DocType", "Zakaah Calculation Run"):
 			return []
 		
-		# Base filters
-		filters = {}
+		conditions = ""
+		having = ""
 		if company:
-			filters["company"] = company
+			conditions += " AND zcr.company = %(company)s"
 		if show_unreconciled_only:
 			# Use >= 1 to exclude rounding errors (e.g., 0.001750)
-			filters["outstanding_zakaah"] = [">=", 1]
-		
-		# Get calculation runs
-		runs = frappe.db.get_all(
-			"Zakaah Calculation Run",
-			filters=filters,
-			fields=[
-				"name", 
-				"fiscal_year",
-				"total_zakaah", 
-				"paid_zakaah", 
-				"outstanding_zakaah", 
-				"status"
-			],
-			order_by="fiscal_year asc"
-		)
+			having = "HAVING outstanding_zakaah >= 1"
 		
-		# Update outstanding amounts (recalculate from allocation history)
+		# Get calculation runs with outstanding amounts recalculated from allocation history
+		runs = frappe.db.sql(f"""
+			SELECT
+				zcr.name,
+				zcr.fiscal_year,
+				zcr.total_zakaah,
+				COALESCE(SUM(zah.allocated_amount), 0) AS paid_zakaah,
+				GREATEST(0, COALESCE(zcr.total_zakaah, 0) - COALESCE(SUM(zah.allocated_amount), 0)) AS outstanding_zakaah,
+				zcr.status,
+				zcr.paid_zakaah AS stored_paid_zakaah,
+				zcr.outstanding_zakaah AS stored_outstanding_zakaah
+			FROM `tabZakaah Calculation Run` zcr
+			LEFT JOIN `tabZakaah Allocation History` zah
+				ON zah.zakaah_calculation_run = zcr.name
+				AND zah.docstatus != 2
+			WHERE 1=1 {conditions}
+			GROUP BY zcr.name, zcr.fiscal_year, zcr.total_zakaah, zcr.status,
+				zcr.paid_zakaah, zcr.outstanding_zakaah
+			{having}
+			ORDER BY zcr.fiscal_year ASC
+		""", {"company": company}, as_dict=True)
+
+		drifted = False
 		for run in runs:
-			paid_amount = get_total_allocated_for_run(run.name)
-			outstanding = (run.total_zakaah or 0) - paid_amount
-
-			# Update if different
-			if outstanding != (run.outstanding_zakaah or 0):
-				frappe.db.set_value(
-					"Zakaah Calculation Run",
-					run.name,
-					{
-						"paid_zakaah": paid_amount,
-						"outstanding_zakaah": outstanding
-					},
-					update_modified=False
-				)
-
-				run.paid_zakaah = paid_amount
-				run.outstanding_zakaah = outstanding
-
-		# Filter out runs with 0 outstanding after recalculation (if show_unreconciled_only)
-		# Use >= 1 to exclude rounding errors (e.g., 0.001750)
-		if show_unreconciled_only:
-			runs = [run for run in runs if (run.outstanding_zakaah or 0) >= 1]
+			stored_paid = run.pop("stored_paid_zakaah")
+			stored_outstanding = run.pop("stored_outstanding_zakaah")
+			if flt(stored_paid) != flt(run.paid_zakaah) or flt(stored_outstanding) != flt(run.outstanding_zakaah):
+				drifted = True
+
+		if drifted:
+			frappe.enqueue(
+				"techstation_zakaah.zakaah_management.doctype.zakaah_payments.zakaah_payments.reconcile_calculation_runs",
+				queue="short",
+				job_id=f"zakaah_reconcile_calculation_runs::{company or ''}",
+				deduplicate=True,
+				company=company
+			)
 
 		return runs
 		
-	except Exception as e:
-		frappe.log_error(f"Error getting calculation runs: {str(e)}", "Get Calculation Runs")
+	except Exception:
+		frappe.log_error(title="Get Calculation Runs", message=frappe.get_traceback())
 		return []
 
 
+def reconcile_calculation_runs(company=None):
+	"""Recalculate the runs whose paid, outstanding or status drifted from allocation history.
+
+	Only runs with allocations or a payment status are checked, drafts and
+	runs below nisab keep their status until they are allocated to.
+	"""
+	conditions = ""
+	if company:
+		conditions += " AND zcr.company = %(company)s"
+
+	drifted = frappe.db.sql_list(f"""
+		SELECT zcr.name
+		FROM `tabZakaah Calculation Run` zcr
+		LEFT JOIN (
+			SELECT zakaah_calculation_run, SUM(allocated_amount) AS paid
+			FROM `tabZakaah Allocation History`
+			WHERE docstatus != 2
+			GROUP BY zakaah_calculation_run
+		) alloc ON alloc.zakaah_calculation_run = zcr.name
+		WHERE (alloc.paid IS NOT NULL OR zcr.status IN ('Calculated', 'Partially Paid', 'Paid'))
+		AND (
+			COALESCE(zcr.paid_zakaah, 0) != COALESCE(alloc.paid, 0)
+			OR COALESCE(zcr.outstanding_zakaah, 0) != {RUN_OUTSTANDING_SQL}
+			OR COALESCE(zcr.status, '') != {RUN_STATUS_SQL}
+		) {conditions}
+	""", {"company": company})
+
+	update_calculation_run_totals(drifted)
+	refresh_year_summaries(company=company)
+
+
 @frappe.whitelist()
-def import_journal_entries(company, from_date, to_date, selected_accounts):
+@instrument
+def import_journal_entries(company, from_date, to_date, selected_accounts, cursor=None, page_size=None):
 	"""
 	Import ONLY UNRECONCILED journal entries
 	Exactly like Payment Reconciliation module
+
+	Entries are returned one page at a time ordered by (posting_date, name).
+	Pass the returned next_cursor back as cursor to get the following page;
+	has_more is False on the last page.
 	"""
 	try:
+		import json
+
 		# Parse selected_accounts if it's a JSON string
 		if isinstance(selected_accounts, str):
-			import json
 			selected_accounts = json.loads(selected_accounts)
+		if isinstance(cursor, str):
+			cursor = json.loads(cursor) if cursor else None
 
 		if not selected_accounts or len(selected_accounts) == 0:
 			return {
 				"journal_entry_records": [],
-				"skipped_count": 0
+				"skipped_count": 0,
+				"next_cursor": None,
+				"has_more": False
 			}
-		
-		# 1. Get ALL journal entries from selected accounts
-		# IMPORTANT: Get debit from GL Entry (not Journal Entry Account)
-		# This aligns with Payment Accounts rule (Debit from GL Entry)
 
-		# Debug: Log parameters before query
-		frappe.log_error(
-			f"SQL Query Parameters:\n"
-			f"Company: {company}\n"
-			f"From Date: {from_date}\n"
-			f"To Date: {to_date}\n"
-			f"Selected Accounts (raw): {selected_accounts}\n"
-			f"Accounts type: {type(selected_accounts)}\n"
-			f"Accounts tuple: {tuple(selected_accounts) if isinstance(selected_accounts, list) else (selected_accounts,)}",
-			"Import Journal Entries SQL Debug"
-		)
+		page_size = min(cint(page_size) or IMPORT_PAGE_SIZE, MAX_IMPORT_PAGE_SIZE)
 
-		# Query 1: Get journal entries within date range
-		entries_in_range = frappe.db.sql("""
+		# One pass over the selected accounts returns both the entries in the
+		# date range and any older entries that still have unallocated amounts.
+		# IMPORTANT: Get debit from GL Entry (not Journal Entry Account)
+		# This aligns with Payment Accounts rule (Debit from GL Entry)
+		entries = frappe.db.sql(f"""
 			SELECT
 				je.name as journal_entry,
 				je.posting_date,
 				je.user_remark as remarks,
 				SUM(gle.debit) as debit,
-				SUM(gle.credit) as credit
-			FROM `tabJournal Entry` je
-			INNER JOIN `tabGL Entry` gle ON gle.voucher_no = je.name
-			WHERE je.company = %(company)s
-			AND je.posting_date BETWEEN %(from_date)s AND %(to_date)s
-			AND gle.account IN %(accounts)s
-			AND je.docstatus = 1
-			AND gle.is_cancelled = 0
-			GROUP BY je.name, je.posting_date, je.user_remark
+				SUM(gle.credit) as credit,
+				COALESCE(alloc.total_allocated, 0) as allocated_amount,
+				SUM(gle.debit) - COALESCE(alloc.total_allocated, 0) as unallocated_amount
+			{get_journal_entry_source(cursor)}
+			GROUP BY je.name, je.posting_date, je.user_remark, alloc.total_allocated
+			HAVING unallocated_amount > 0
+				OR je.posting_date BETWEEN %(from_date)s AND %(to_date)s
 			ORDER BY je.posting_date, je.name
+			LIMIT %(limit)s
 		""", {
 			'company': company,
 			'from_date': from_date,
 			'to_date': to_date,
-			'accounts': tuple(selected_accounts) if isinstance(selected_accounts, list) else (selected_accounts,)
+			'accounts': tuple(selected_accounts) if isinstance(selected_accounts, list) else (selected_accounts,),
+			'cursor_date': cursor.get("posting_date") if cursor else None,
+			'cursor_name': cursor.get("journal_entry") if cursor else None,
+			'limit': page_size + 1
 		}, as_dict=True)
 
-		# Query 2: Get ALL journal entries with CURRENT unallocated amounts (regardless of date)
-		# This ensures we show journal entries that still have unallocated amounts from previous periods
-		# FIXED: Calculate current unallocated by comparing total debit vs sum of allocations
-		entries_with_unallocated = frappe.db.sql("""
-			SELECT
-				je.name as journal_entry,
-				je.posting_date,
-				je.user_remark as remarks,
-				SUM(gle.debit) as debit,
-				SUM(gle.credit) as credit,
-				COALESCE(alloc.total_allocated, 0) as already_allocated,
-				SUM(gle.debit) - COALESCE(alloc.total_allocated, 0) as current_unallocated
-			FROM `tabJournal Entry` je
-			INNER JOIN `tabGL Entry` gle ON gle.voucher_no = je.name
-			LEFT JOIN (
-				SELECT journal_entry, SUM(allocated_amount) as total_allocated
-				FROM `tabZakaah Allocation History`
-				WHERE docstatus = 1
-				GROUP BY journal_entry
-			) alloc ON alloc.journal_entry = je.name
-			WHERE je.company = %(company)s
-			AND gle.account IN %(accounts)s
-			AND je.docstatus = 1
-			AND gle.is_cancelled = 0
-			GROUP BY je.name, je.posting_date, je.user_remark
-			HAVING current_unallocated > 0
-			ORDER BY je.posting_date, je.name
-		""", {
-			'company': company,
-			'accounts': tuple(selected_accounts) if isinstance(selected_accounts, list) else (selected_accounts,)
-		}, as_dict=True)
+		has_more = len(entries) > page_size
+		entries = entries[:page_size]
 
-		# Combine both result sets and remove duplicates
-		all_entries_dict = {}
-		for entry in entries_in_range:
-			all_entries_dict[entry.journal_entry] = entry
-		for entry in entries_with_unallocated:
-			if entry.journal_entry not in all_entries_dict:
-				all_entries_dict[entry.journal_entry] = entry
-
-		# Convert back to list and sort by posting date
-		all_entries = sorted(all_entries_dict.values(), key=lambda x: (x.posting_date, x.journal_entry))
-		
-		# 2. Get already allocated amounts from Allocation History
-		already_allocated = frappe.db.sql("""
-			SELECT 
-				journal_entry,
-				SUM(allocated_amount) as total_allocated
-			FROM `tabZakaah Allocation History`
-			WHERE docstatus != 2
-			GROUP BY journal_entry
-		""", as_dict=True)
-		
-		# Create dictionary for quick lookup
-		allocated_dict = {
-			row.journal_entry: row.total_allocated 
-			for row in already_allocated
-		}
-		
-		# 3. Filter: Only unreconciled (unallocated > 0)
+		# Only unreconciled (unallocated > 0) entries are returned, fully
+		# allocated entries in the date range are only counted
 		journal_entry_records = []
 		skipped_count = 0
-		
-		for entry in all_entries:
-			entry_name = entry.journal_entry
+
+		for entry in entries:
 			debit_amount = entry.debit or 0
-			
-			# Get total allocated for this JE
-			total_allocated = allocated_dict.get(entry_name, 0)
-			
-			# Calculate unallocated amount
-			unallocated = debit_amount - total_allocated
-			
-			# Only add if there's unallocated amount
-			if unallocated > 0:
+			if entry.unallocated_amount > 0:
 				journal_entry_records.append({
-					"journal_entry": entry_name,
+					"journal_entry": entry.journal_entry,
 					"posting_date": str(entry.posting_date),
 					"debit": debit_amount,
 					"credit": entry.credit or 0,
 					"balance": debit_amount,
 					"remarks": entry.remarks or "",
-					"allocated_amount": total_allocated,
-					"unallocated_amount": unallocated
+					"allocated_amount": entry.allocated_amount,
+					"unallocated_amount": entry.unallocated_amount
 				})
 			else:
 				skipped_count += 1
-		
-		# Debug: Log what we're returning
-		debug_msg = f"Journal Entries Found: {len(journal_entry_records)}\n"
-		debug_msg += f"All Entries: {len(all_entries)}\n"
-		debug_msg += f"Skipped: {skipped_count}\n"
-		debug_msg += f"Accounts: {selected_accounts}\n"
-		debug_msg += f"Date Range: {from_date} to {to_date}\n\n"
-
-		if len(all_entries) > 0:
-			debug_msg += "Sample entries from SQL query:\n"
-			for entry in all_entries[:3]:
-				total_allocated = allocated_dict.get(entry.journal_entry, 0)
-				unallocated = (entry.debit or 0) - total_allocated
-				debug_msg += f"  - {entry.journal_entry}: debit={entry.debit}, allocated={total_allocated}, unallocated={unallocated}\n"
-
-		frappe.log_error(debug_msg, "Import Journal Entries Debug")
+
+		next_cursor = None
+		if has_more:
+			next_cursor = {
+				"posting_date": str(entries[-1].posting_date),
+				"journal_entry": entries[-1].journal_entry
+			}
 
 		# Return result without showing message (let JS handle it)
 		return {
 			"journal_entry_records": journal_entry_records,
-			"skipped_count": skipped_count
+			"skipped_count": skipped_count,
+			"next_cursor": next_cursor,
+			"has_more": has_more
 		}
 		
-	except Exception as e:
-		frappe.log_error(f"Error importing journal entries: {str(e)}", "Import Journal Entries")
-		return {"journal_entry_records": []}
+	except Exception:
+		frappe.log_error(title="Import Journal Entries", message=frappe.get_traceback())
+		return {"journal_entry_records": [], "next_cursor": None, "has_more": False}
 
 
 @frappe.whitelist()
-def allocate_payments(calculation_run_items, journal_entries):
+@instrument
+def allocate_payments(calculation_run_items, journal_entries, idempotency_key=None):
 	"""
 	Allocate journal entries to Zakaah Calculation Runs
 	Updates outstanding amounts after allocation
+
+	The allocation plan is computed in memory and written with a bulk insert.
+
+	The runs and journal entries involved are locked for the transaction, so
+	concurrent allocations of the same rows run one after the other while
+	allocations of other rows are not blocked. A retry sending the same
+	idempotency_key gets the allocations of the first attempt back instead
+	of allocating again.
+
+	The user must be able to submit Allocation History and read every run
+	and journal entry involved. Rows are written without loading documents,
+	so ZakaahAllocationHistory.validate_references does not run; the locks
+	only return runs and submitted journal entries that exist, which is
+	what it checks.
 	"""
+	frappe.has_permission("Zakaah Allocation History", "submit", throw=True)
+
 	try:
 		# Parse parameters if they're JSON strings
 		import json
@@ -340,216 +405,325 @@ def allocate_payments(calculation_run_items, journal_entries):
 		if not frappe.db.exists("DocType", "Zakaah Allocation History"):
 			return {"success": False, "message": "Zakaah Allocation History doctype not found"}
 
-		allocated_records = []
-		allocation_summary = []
-
-		# Get already allocated amounts from database
-		already_allocated = frappe.db.sql("""
-			SELECT
-				journal_entry,
-				SUM(allocated_amount) as total_allocated
-			FROM `tabZakaah Allocation History`
-			WHERE docstatus != 2
-			GROUP BY journal_entry
-		""", as_dict=True)
-
-		# Create dictionary for quick lookup
-		allocated_dict = {
-			row.journal_entry: row.total_allocated
-			for row in already_allocated
-		}
+		run_names = list(dict.fromkeys(
+			run_item.get("zakaah_calculation_run")
+			for run_item in calculation_run_items
+			if run_item.get("zakaah_calculation_run")
+		))
+		journal_entry_names = list(dict.fromkeys(
+			journal_entry.get("journal_entry")
+			for journal_entry in journal_entries
+			if journal_entry.get("journal_entry")
+		))
+
+		if not run_names or not journal_entry_names:
+			return {"success": True, "allocated_records": [], "summary": []}
+
+		check_read_permission("Zakaah Calculation Run", run_names)
+		check_read_permission("Journal Entry", journal_entry_names)
+
+		# Always runs first, then journal entries, each in name order, so two
+		# allocations of overlapping rows wait on each other instead of deadlocking
+		runs = lock_calculation_runs(run_names)
+		allocated_dict = lock_allocated_amounts(journal_entry_names)
+
+		if idempotency_key:
+			allocated_records = get_allocations_for_key(idempotency_key)
+			if allocated_records:
+				frappe.db.rollback()
+				return {
+					"success": True,
+					"allocated_records": allocated_records,
+					"summary": [],
+					"duplicate": True
+				}
+
+		allocated_records, allocation_summary = allocate_payments_in_bulk(
+			run_names, journal_entries, runs, allocated_dict, idempotency_key
+		)
 
-		# Process each journal entry
-		for journal_entry in journal_entries:
-			journal_entry_name = journal_entry.get("journal_entry")
-			unallocated_amount = journal_entry.get("unallocated_amount") or 0
-			original_debit = journal_entry.get("debit") or 0
-			
-			# Track how much is being allocated in this session
-			remaining_to_allocate = unallocated_amount
-			
-			for run_item in calculation_run_items:
-				run_name = run_item.get("zakaah_calculation_run")
-				if not run_name:
-					continue
-
-				# CRITICAL: Get CURRENT outstanding from database (not from stale run_item)
-				# This prevents over-allocation if user clicks Allocate multiple times
-				current_data = frappe.db.get_value(
-					"Zakaah Calculation Run",
-					run_name,
-					["total_zakaah", "paid_zakaah", "outstanding_zakaah"],
-					as_dict=True
-				)
-
-				if not current_data:
-					continue
-
-				current_outstanding = current_data.outstanding_zakaah or 0
-				total_zakaah = current_data.total_zakaah or 0
-				current_paid = current_data.paid_zakaah or 0
-
-				# Skip if already fully paid
-				if current_outstanding <= 0:
-					continue
-
-				if remaining_to_allocate <= 0:
-					break
-
-				# Calculate allocation amount (minimum of remaining to allocate and current outstanding)
-				allocation_amount = min(remaining_to_allocate, current_outstanding)
-
-				# VALIDATION: Ensure allocation won't exceed total zakaah
-				new_paid = current_paid + allocation_amount
-				if new_paid > total_zakaah:
-					# Adjust allocation to not exceed total
-					allocation_amount = max(0, total_zakaah - current_paid)
-					frappe.log_error(
-						f"Prevented over-allocation for {run_name}\n"
-						f"Total Zakaah: {total_zakaah}\n"
-						f"Current Paid: {current_paid}\n"
-						f"Attempted: {allocation_amount + (new_paid - total_zakaah)}\n"
-						f"Adjusted to: {allocation_amount}",
-						"Allocation Over-limit Prevention"
-					)
-
-				if allocation_amount > 0:
-					# Calculate remaining unallocated after this allocation
-					# Include BOTH: allocations from this session AND previous allocations from database
-					current_session_allocated = sum([
-						r.get("allocated_amount", 0)
-						for r in allocated_records
-						if r.get("journal_entry") == journal_entry_name
-					])
-
-					# Get total allocated from database (including previous sessions)
-					previous_allocated = allocated_dict.get(journal_entry_name, 0)
-
-					# Total allocated = previous + current session + this allocation
-					total_allocated = previous_allocated + current_session_allocated + allocation_amount
-					new_unallocated = original_debit - total_allocated
-					
-					# Create allocation history record
-					allocation_doc = frappe.get_doc({
-						"doctype": "Zakaah Allocation History",
-						"journal_entry": journal_entry_name,
-						"zakaah_calculation_run": run_name,
-						"allocated_amount": allocation_amount,
-						"unallocated_amount": new_unallocated,
-						"allocation_date": now(),
-						"allocated_by": frappe.session.user
-					})
-					allocation_doc.insert()
-					allocation_doc.submit()
-
-					allocated_records.append({
-						"journal_entry": journal_entry_name,
-						"zakaah_calculation_run": run_name,
-						"allocated_amount": allocation_amount
-					})
-					
-					remaining_to_allocate -= allocation_amount
-			
-			if remaining_to_allocate > 0:
-				allocation_summary.append({
-					"journal_entry": journal_entry_name,
-					"still_unallocated": remaining_to_allocate
-				})
-		
 		# Update outstanding amounts in Calculation Runs
-		for run_item in calculation_run_items:
-			run_name = run_item.get("zakaah_calculation_run")
-			if run_name:
-				total_zakaah = frappe.db.get_value("Zakaah Calculation Run", run_name, "total_zakaah")
-				
-				# Recalculate paid amount
-				paid_amount = get_total_allocated_for_run(run_name)
-				outstanding = max(0, (total_zakaah or 0) - paid_amount)
-				
-				# Determine status
-				if outstanding == 0:
-					status = "Paid"
-				elif paid_amount > 0:
-					status = "Partially Paid"
-				else:
-					status = "Calculated"
-				
-				# Update Calculation Run
-				frappe.db.set_value("Zakaah Calculation Run", run_name, {
-					"paid_zakaah": paid_amount,
-					"outstanding_zakaah": outstanding,
-					"status": status
-				}, update_modified=False)
-		
+		update_calculation_run_totals(run_names)
+		refresh_year_summaries(run_names)
+
 		frappe.db.commit()
-		
+
 		return {
 			"success": True,
 			"allocated_records": allocated_records,
 			"summary": allocation_summary
 		}
-		
+
+	except frappe.PermissionError:
+		raise
+
 	except Exception as e:
-		frappe.log_error(f"Error allocating payments: {str(e)}", "Allocate Payments")
+		frappe.log_error(title="Allocate Payments", message=frappe.get_traceback())
 		frappe.db.rollback()
 		return {"success": False, "message": str(e)}
 
 
+def check_read_permission(doctype, names):
+	"""Throw unless the user can read every document in names, checked in one query"""
+	permitted = set(frappe.get_list(
+		doctype,
+		filters={"name": ("in", names)},
+		pluck="name",
+		limit_page_length=0
+	))
+	not_permitted = [name for name in names if name not in permitted]
+	if not_permitted:
+		frappe.throw(
+			_("You are not permitted to allocate {0} {1}").format(_(doctype), ", ".join(not_permitted)),
+			frappe.PermissionError
+		)
+
+
+def lock_calculation_runs(run_names):
+	"""Lock the given runs in name order and get their current amounts"""
+	return {
+		row.name: row
+		for row in frappe.db.sql("""
+			SELECT name, total_zakaah, paid_zakaah, outstanding_zakaah
+			FROM `tabZakaah Calculation Run`
+			WHERE name IN %(runs)s
+			ORDER BY name
+			FOR UPDATE
+		""", {"runs": sorted(run_names)}, as_dict=True)
+	}
+
+
+def get_allocations_for_key(idempotency_key):
+	"""Get the allocations already made with idempotency_key.
+
+	Read with a lock, which always sees the latest committed rows, so a retry
+	that waited on the first attempt's locks finds its allocations.
+	"""
+	return frappe.db.sql("""
+		SELECT journal_entry, zakaah_calculation_run, allocated_amount, unallocated_amount
+		FROM `tabZakaah Allocation History`
+		WHERE idempotency_key = %s
+		AND docstatus = 1
+		ORDER BY creation, name
+		FOR UPDATE
+	""", idempotency_key, as_dict=True)
+
+
+def allocate_payments_in_bulk(run_names, journal_entries, runs, allocated_dict, idempotency_key=None):
+	"""Allocate journal entries FIFO across runs from one snapshot of the amounts.
+
+	runs and allocated_dict are the amounts read under lock by
+	allocate_payments. The whole plan is computed in memory and the
+	Allocation History rows are written with a single bulk insert. Applies
+	the same limits as ZakaahAllocationHistory.check_over_allocation and the
+	per-document mode.
+	"""
+	# Only submitted journal entries that still exist were locked
+	if not allocated_dict:
+		return [], []
+
+	# Journal entry amounts, same basis as check_over_allocation
+	je_totals = dict(frappe.db.sql("""
+		SELECT jea.parent, SUM(jea.debit)
+		FROM `tabJournal Entry Account` jea
+		INNER JOIN `tabJournal Entry` je ON je.name = jea.parent
+		WHERE jea.parent IN %(journal_entries)s
+		AND je.docstatus = 1
+		GROUP BY jea.parent
+	""", {"journal_entries": list(allocated_dict)}))
+
+	precision = frappe.get_precision("Zakaah Allocation History", "allocated_amount") or 2
+	allocated_records = []
+	allocation_summary = []
+
+	for journal_entry in journal_entries:
+		journal_entry_name = journal_entry.get("journal_entry")
+		if not journal_entry_name:
+			continue
+
+		original_debit = flt(journal_entry.get("debit"))
+		total_allocated = flt(allocated_dict.get(journal_entry_name))
+
+		# Never allocate beyond the journal entry amount or the debit the
+		# unallocated amount is reported against
+		remaining_to_allocate = min(
+			flt(journal_entry.get("unallocated_amount")),
+			flt(je_totals.get(journal_entry_name)) - total_allocated,
+			original_debit - total_allocated
+		)
+
+		for run_name in run_names:
+			run = runs.get(run_name)
+			if not run:
+				continue
+
+			current_outstanding = flt(run.outstanding_zakaah)
+
+			# Skip if already fully paid
+			if current_outstanding <= 0:
+				continue
+
+			if remaining_to_allocate <= 0:
+				break
+
+			# Ensure allocation won't exceed total zakaah
+			allocation_amount = flt(min(
+				remaining_to_allocate,
+				current_outstanding,
+				flt(run.total_zakaah) - flt(run.paid_zakaah)
+			), precision)
+
+			if allocation_amount <= 0:
+				continue
+
+			total_allocated += allocation_amount
+			run.paid_zakaah = flt(run.paid_zakaah) + allocation_amount
+			run.outstanding_zakaah = current_outstanding - allocation_amount
+			remaining_to_allocate -= allocation_amount
+
+			allocated_records.append({
+				"journal_entry": journal_entry_name,
+				"zakaah_calculation_run": run_name,
+				"allocated_amount": allocation_amount,
+				"unallocated_amount": flt(original_debit - total_allocated, precision)
+			})
+
+		if remaining_to_allocate > 0:
+			allocation_summary.append({
+				"journal_entry": journal_entry_name,
+				"still_unallocated": remaining_to_allocate
+			})
+
+	insert_allocation_history(allocated_records, idempotency_key)
+	update_journal_entry_allocations([record["journal_entry"] for record in allocated_records])
+
+	return allocated_records, allocation_summary
+
+
+def insert_allocation_history(allocated_records, idempotency_key=None):
+	"""Bulk insert submitted Zakaah Allocation History rows"""
+	if not allocated_records:
+		return
+
+	timestamp = now()
+	user = frappe.session.user
+	fields = [
+		"name", "creation", "modified", "owner", "modified_by", "docstatus",
+		"journal_entry", "zakaah_calculation_run", "allocated_amount",
+		"unallocated_amount", "allocation_date", "allocated_by", "idempotency_key"
+	]
+	values = []
+	for record in allocated_records:
+		record["name"] = frappe.generate_hash(length=10)
+		values.append((
+			record["name"], timestamp, timestamp, user, user, 1,
+			record["journal_entry"], record["zakaah_calculation_run"], record["allocated_amount"],
+			record["unallocated_amount"], timestamp, user, idempotency_key
+		))
+
+	frappe.db.bulk_insert("Zakaah Allocation History", fields, values)
+
+
+def update_calculation_run_totals(run_names):
+	"""Recalculate paid, outstanding and status of runs from allocation history in one UPDATE"""
+	run_names = list(set(run for run in run_names or [] if run))
+	if not run_names:
+		return
+
+	frappe.db.sql(f"""
+		UPDATE `tabZakaah Calculation Run` zcr
+		LEFT JOIN (
+			SELECT zakaah_calculation_run, SUM(allocated_amount) AS paid
+			FROM `tabZakaah Allocation History`
+			WHERE zakaah_calculation_run IN %(runs)s
+			AND docstatus != 2
+			GROUP BY zakaah_calculation_run
+		) alloc ON alloc.zakaah_calculation_run = zcr.name
+		SET
+			zcr.paid_zakaah = COALESCE(alloc.paid, 0),
+			zcr.outstanding_zakaah = {RUN_OUTSTANDING_SQL},
+			zcr.status = {RUN_STATUS_SQL}
+		WHERE zcr.name IN %(runs)s
+	""", {"runs": run_names})
+
+
 @frappe.whitelist()
-def get_allocation_history(calculation_run=None, journal_entry=None):
-	"""Get allocation history records with CURRENT unallocated amounts (not historical snapshots)"""
+@instrument
+def get_allocation_history(calculation_run=None, journal_entry=None, company=None, cursor=None, page_size=None):
+	"""Get allocation history records with CURRENT unallocated amounts (not historical snapshots)
+
+	Records are returned one page at a time, newest first. Pass the returned
+	next_cursor back as cursor to get the following page; has_more is False
+	on the last page. With a company, only allocations to its runs are listed.
+	"""
 	try:
-		filters = {"docstatus": ["!=", 2]}
+		import json
+		if isinstance(cursor, str):
+			cursor = json.loads(cursor) if cursor else None
 
-		if calculation_run:
-			filters["zakaah_calculation_run"] = calculation_run
+		page_size = min(cint(page_size) or HISTORY_PAGE_SIZE, MAX_HISTORY_PAGE_SIZE)
 
+		conditions = ""
+		if calculation_run:
+			conditions += " AND zah.zakaah_calculation_run = %(calculation_run)s"
 		if journal_entry:
-			filters["journal_entry"] = journal_entry
-
-		history = frappe.db.get_all(
-			"Zakaah Allocation History",
-			filters=filters,
-			fields=[
-				"name",
-				"journal_entry",
-				"zakaah_calculation_run",
-				"allocated_amount",
-				"unallocated_amount",  # Historical value - will be replaced with current
-				"allocation_date",
-				"allocated_by"
-			],
-			order_by="allocation_date desc, name desc"
-		)
+			conditions += " AND zah.journal_entry = %(journal_entry)s"
+		if company:
+			conditions += " AND zcr.company = %(company)s"
+		if cursor:
+			# Keyset pagination: continue after the last row of the previous page
+			conditions += """
+				AND (zah.allocation_date < %(cursor_date)s
+					OR (zah.allocation_date = %(cursor_date)s AND zah.name < %(cursor_name)s))
+			"""
+
+		history = frappe.db.sql(f"""
+			SELECT
+				zah.name,
+				zah.journal_entry,
+				zah.zakaah_calculation_run,
+				zah.allocated_amount,
+				zah.allocation_date,
+				zah.allocated_by,
+				zcr.company
+			FROM `tabZakaah Allocation History` zah
+			LEFT JOIN `tabZakaah Calculation Run` zcr ON zcr.name = zah.zakaah_calculation_run
+			WHERE zah.docstatus != 2
+			{conditions}
+			ORDER BY zah.allocation_date DESC, zah.name DESC
+			LIMIT %(limit)s
+		""", {
+			"calculation_run": calculation_run,
+			"journal_entry": journal_entry,
+			"company": company,
+			"cursor_date": cursor.get("allocation_date") if cursor else None,
+			"cursor_name": cursor.get("name") if cursor else None,
+			"limit": page_size + 1
+		}, as_dict=True)
 
-		# FIXED: Recalculate CURRENT unallocated amount for each journal entry
-		# Get current unallocated amounts for all journal entries
-		# IMPORTANT: Only count debits from Zakaa Liability account (payment account)
-		je_unallocated = {}
-		if history:
-			unique_jes = list(set([h["journal_entry"] for h in history]))
+		has_more = len(history) > page_size
+		history = history[:page_size]
 
-			# Get the Zakaa Liability payment account (the account used for zakaah payments)
-			# This is typically "2205001 - Zakaa Liability - AP" or similar
-			# We'll query GL Entry filtered by the payment account to get accurate amounts
+		# Recalculate CURRENT unallocated amount for the journal entries of
+		# this page, counting only debits to the configured payment accounts
+		je_unallocated = {}
+		accounts = get_payment_account_names(set(record.company for record in history if record.company))
+		if history and accounts:
 			current_unallocated = frappe.db.sql("""
 				SELECT
 					gle.voucher_no as journal_entry,
-					SUM(gle.debit) as total_debit,
-					COALESCE(alloc.total_allocated, 0) as total_allocated,
 					SUM(gle.debit) - COALESCE(alloc.total_allocated, 0) as current_unallocated
 				FROM `tabGL Entry` gle
-				LEFT JOIN (
-					SELECT journal_entry, SUM(allocated_amount) as total_allocated
-					FROM `tabZakaah Allocation History`
-					WHERE docstatus = 1
-					GROUP BY journal_entry
-				) alloc ON alloc.journal_entry = gle.voucher_no
-				WHERE gle.voucher_no IN %(je_list)s
-				AND gle.account LIKE '%%Zakaa Liability%%'
+				LEFT JOIN `tabZakaah Journal Entry Allocation` alloc ON alloc.name = gle.voucher_no
+				WHERE gle.voucher_type = 'Journal Entry'
+				AND gle.voucher_no IN %(je_list)s
+				AND gle.account IN %(accounts)s
 				AND gle.is_cancelled = 0
-				GROUP BY gle.voucher_no
-			""", {"je_list": unique_jes}, as_dict=True)
+				GROUP BY gle.voucher_no, alloc.total_allocated
+			""", {
+				"je_list": list(set(record.journal_entry for record in history)),
+				"accounts": accounts
+			}, as_dict=True)
 
 			# Build lookup dict
 			for row in current_unallocated:
@@ -557,14 +731,36 @@ def get_allocation_history(calculation_run=None, journal_entry=None):
 
 		# Replace historical unallocated_amount with current value
 		for record in history:
-			je_name = record["journal_entry"]
-			record["unallocated_amount"] = je_unallocated.get(je_name, 0)
+			record.pop("company")
+			record["unallocated_amount"] = je_unallocated.get(record["journal_entry"], 0)
+
+		next_cursor = None
+		if has_more:
+			next_cursor = {
+				"allocation_date": str(history[-1].allocation_date),
+				"name": history[-1].name
+			}
 
-		return history
+		return {
+			"records": history,
+			"next_cursor": next_cursor,
+			"has_more": has_more
+		}
 
-	except Exception as e:
-		frappe.log_error(f"Error getting allocation history: {str(e)}", "Get Allocation History")
-		return []
+	except Exception:
+		frappe.log_error(title="Get Allocation History", message=frappe.get_traceback())
+		return {"records": [], "next_cursor": None, "has_more": False}
+
+
+def get_payment_account_names(companies):
+	"""Get the configured payment accounts of the given companies, from the configuration cache"""
+	from techstation_zakaah.zakaah_management.config import get_payment_accounts
+
+	return list(dict.fromkeys(
+		row["account"]
+		for company in sorted(companies)
+		for row in get_payment_accounts(company)
+	))
 
 
 def get_total_allocated_for_run(calculation_run_name):
@@ -578,50 +774,24 @@ def get_total_allocated_for_run(calculation_run_name):
 		""", calculation_run_name, as_dict=True)
 		
 		return (result[0].total or 0) if result and result[0] else 0
-	except Exception as e:
-		frappe.log_error(f"Error getting total allocated: {str(e)}", "Get Total Allocated")
+	except Exception:
+		frappe.log_error(title="Get Total Allocated", message=frappe.get_traceback())
 		return 0
 
 
 @frappe.whitelist()
+@instrument
 def get_payment_accounts_from_settings(company):
 	"""Get payment accounts from ALL Zakaah Assets Configurations for the company"""
 	try:
-		# Get payment accounts from Zakaah Assets Configuration
-		if not frappe.db.exists("DocType", "Zakaah Assets Configuration"):
-			return []
+		from techstation_zakaah.zakaah_management.config import get_payment_accounts
 
 		if not company:
 			return []
 
-		# Find ALL assets configurations for this company (all fiscal years)
-		config_names = frappe.db.get_all(
-			"Zakaah Assets Configuration",
-			filters={"company": company},
-			pluck="name"
-		)
-
-		if not config_names:
-			return []
-
-		# Collect all unique payment accounts from all fiscal years
-		accounts_dict = {}  # Use dict to avoid duplicates
-
-		for config_name in config_names:
-			config_doc = frappe.get_doc("Zakaah Assets Configuration", config_name)
-
-			if config_doc and hasattr(config_doc, 'payment_accounts') and config_doc.payment_accounts:
-				for row in config_doc.payment_accounts:
-					if row.account and row.account not in accounts_dict:
-						accounts_dict[row.account] = {
-							"account": row.account,
-							"account_name": row.account_name or frappe.db.get_value("Account", row.account, "account_name")
-						}
-
-		# Return list of accounts
-		return list(accounts_dict.values())
+		# Unique payment accounts of all fiscal years, from the configuration cache
+		return get_payment_accounts(company)
 		
-	except Exception as e:
-		frappe.log_error(f"Error getting payment accounts: {str(e)}", "Get Payment Accounts")
+	except Exception:
+		frappe.log_error(title="Get Payment Accounts", message=frappe.get_traceback())
 		return []
-
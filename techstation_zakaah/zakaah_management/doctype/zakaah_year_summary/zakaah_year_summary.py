@@ -0,0 +1,142 @@
+from __future__ import unicode_literals
+from frappe.model.document import Document
+import frappe
+from frappe.utils import now
+
+class ZakaahYearSummary(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_unique(
+		"Zakaah Year Summary",
+		["company", "fiscal_year"],
+		constraint_name="unique_company_fiscal_year"
+	)
+
+
+def refresh_year_summaries(calculation_runs=None, company=None):
+	"""Rebuild the summary rows of the companies and fiscal years of the given runs.
+
+	Zakaah amounts are summed over the submitted runs of each company and
+	fiscal year; assets, gold and nisab figures are those of the latest
+	submitted run. Drafts are left out, they are trials or recalculations
+	that would count the year's zakaah twice. Without runs, every summary of
+	company (or of all companies) is rebuilt, which the scheduler does daily.
+	Runs inside the caller's transaction.
+	"""
+	values = {"timestamp": now(), "user": frappe.session.user, "company": company}
+	conditions = ""
+	if company:
+		conditions += " AND {alias}.company = %(company)s"
+
+	if calculation_runs is not None:
+		calculation_runs = list(set(run for run in calculation_runs if run))
+		if not calculation_runs:
+			return
+
+		pairs = frappe.db.sql("""
+			SELECT DISTINCT company, fiscal_year
+			FROM `tabZakaah Calculation Run`
+			WHERE name IN %(runs)s
+		""", {"runs": calculation_runs})
+		if not pairs:
+			return
+
+		# Rebuilds a few more pairs than needed at most, never fewer
+		values["companies"] = list(set(pair[0] for pair in pairs))
+		values["fiscal_years"] = list(set(pair[1] for pair in pairs))
+		conditions += " AND {alias}.company IN %(companies)s AND {alias}.fiscal_year IN %(fiscal_years)s"
+
+	run_conditions = conditions.format(alias="zcr")
+	summary_conditions = conditions.format(alias="`tabZakaah Year Summary`")
+
+	frappe.db.sql(f"""
+		INSERT INTO `tabZakaah Year Summary`
+			(name, company, fiscal_year, calculation_run, run_count, to_date,
+			gold_price_per_gram_24k, nisab_value, total_assets, assets_in_gold_grams, nisab_met,
+			total_zakaah, paid_zakaah, outstanding_zakaah, status,
+			allocation_count, last_allocation_date,
+			creation, modified, owner, modified_by, docstatus)
+		SELECT
+			CONCAT(runs.fiscal_year, ' - ', runs.company),
+			runs.company,
+			runs.fiscal_year,
+			latest.name,
+			runs.run_count,
+			latest.to_date,
+			latest.gold_price_per_gram_24k,
+			latest.nisab_value,
+			latest.total_assets,
+			latest.assets_in_gold_grams,
+			COALESCE(latest.nisab_met, 0),
+			runs.total_zakaah,
+			runs.paid_zakaah,
+			runs.outstanding_zakaah,
+			CASE
+				WHEN runs.total_zakaah > 0 AND runs.outstanding_zakaah <= 0 THEN 'Paid'
+				WHEN runs.paid_zakaah > 0 THEN 'Partially Paid'
+				WHEN runs.total_zakaah > 0 THEN 'Due'
+				ELSE 'Not Due'
+			END,
+			COALESCE(alloc.allocation_count, 0),
+			alloc.last_allocation_date,
+			%(timestamp)s, %(timestamp)s, %(user)s, %(user)s, 0
+		FROM (
+			SELECT
+				zcr.company,
+				zcr.fiscal_year,
+				COUNT(*) AS run_count,
+				SUM(COALESCE(zcr.total_zakaah, 0)) AS total_zakaah,
+				SUM(COALESCE(zcr.paid_zakaah, 0)) AS paid_zakaah,
+				SUM(COALESCE(zcr.outstanding_zakaah, 0)) AS outstanding_zakaah,
+				SUBSTRING_INDEX(
+					GROUP_CONCAT(zcr.name ORDER BY zcr.to_date DESC, zcr.creation DESC),
+					',', 1
+				) AS latest_run
+			FROM `tabZakaah Calculation Run` zcr
+			WHERE zcr.docstatus = 1 {run_conditions}
+			GROUP BY zcr.company, zcr.fiscal_year
+		) runs
+		INNER JOIN `tabZakaah Calculation Run` latest ON latest.name = runs.latest_run
+		LEFT JOIN (
+			SELECT
+				zcr.company,
+				zcr.fiscal_year,
+				COUNT(*) AS allocation_count,
+				MAX(zah.allocation_date) AS last_allocation_date
+			FROM `tabZakaah Allocation History` zah
+			INNER JOIN `tabZakaah Calculation Run` zcr ON zcr.name = zah.zakaah_calculation_run
+			WHERE zah.docstatus = 1 AND zcr.docstatus = 1 {run_conditions}
+			GROUP BY zcr.company, zcr.fiscal_year
+		) alloc ON alloc.company = runs.company AND alloc.fiscal_year = runs.fiscal_year
+		ON DUPLICATE KEY UPDATE
+			calculation_run = VALUES(calculation_run),
+			run_count = VALUES(run_count),
+			to_date = VALUES(to_date),
+			gold_price_per_gram_24k = VALUES(gold_price_per_gram_24k),
+			nisab_value = VALUES(nisab_value),
+			total_assets = VALUES(total_assets),
+			assets_in_gold_grams = VALUES(assets_in_gold_grams),
+			nisab_met = VALUES(nisab_met),
+			total_zakaah = VALUES(total_zakaah),
+			paid_zakaah = VALUES(paid_zakaah),
+			outstanding_zakaah = VALUES(outstanding_zakaah),
+			status = VALUES(status),
+			allocation_count = VALUES(allocation_count),
+			last_allocation_date = VALUES(last_allocation_date),
+			modified = VALUES(modified),
+			modified_by = VALUES(modified_by)
+	""", values)
+
+	# Drop summaries of companies and fiscal years left without submitted runs
+	frappe.db.sql(f"""
+		DELETE FROM `tabZakaah Year Summary`
+		WHERE NOT EXISTS (
+			SELECT 1 FROM `tabZakaah Calculation Run` zcr
+			WHERE zcr.company = `tabZakaah Year Summary`.company
+			AND zcr.fiscal_year = `tabZakaah Year Summary`.fiscal_year
+			AND zcr.docstatus = 1
+		) {summary_conditions}
+	""", values)
+
@@ -0,0 +1,51 @@
+import frappe
+from frappe import _
+from frappe.utils import flt, formatdate, getdate
+
+
+def get_exchange_rates(from_currencies, to_currency, date):
+	"""Get the rate converting each of from_currencies to to_currency on date.
+
+	Every pair is read from Currency Exchange in one query, taking the latest
+	rate on or before date and using the inverse of a to_currency record when
+	there is no direct one. Rates are never fetched from an external service,
+	so calculations in background jobs make no HTTP calls.
+
+	Returns a dict of currency -> rate, including to_currency itself at 1.
+	Throws, naming every currency without a record, rather than valuing them
+	at par.
+	"""
+	date = getdate(date)
+	currencies = sorted(set(c for c in from_currencies or [] if c and c != to_currency))
+	rates = {to_currency: 1.0}
+	if not currencies:
+		return rates
+
+	# Direct records sort before inverse ones, then the latest date first
+	rows = frappe.db.sql("""
+		SELECT from_currency, to_currency, exchange_rate
+		FROM `tabCurrency Exchange`
+		WHERE date <= %(date)s
+			AND exchange_rate > 0
+			AND (
+				(from_currency IN %(currencies)s AND to_currency = %(to_currency)s)
+				OR (from_currency = %(to_currency)s AND to_currency IN %(currencies)s)
+			)
+		ORDER BY from_currency = %(to_currency)s, date DESC, modified DESC
+	""", {"currencies": currencies, "to_currency": to_currency, "date": date}, as_dict=True)
+
+	for row in rows:
+		if row.from_currency == to_currency:
+			rates.setdefault(row.to_currency, 1 / flt(row.exchange_rate))
+		else:
+			rates.setdefault(row.from_currency, flt(row.exchange_rate))
+
+	missing = [currency for currency in currencies if currency not in rates]
+	if missing:
+		frappe.throw(
+			_("No exchange rate from {0} to {1} on or before {2}. Please add a Currency Exchange record.").format(
+				", ".join(missing), to_currency, formatdate(date)),
+			title=_("Missing Exchange Rate")
+		)
+
+	return rates
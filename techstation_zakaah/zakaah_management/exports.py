@@ -0,0 +1,321 @@
+"""Streaming exports of zakaah audit data.
+
+Exports run as background jobs that read rows through an unbuffered cursor
+and write them straight to a private file, CSV or XLSX, so memory stays flat
+whatever the number of rows. The finished file is recorded as a File without
+being read back, and the requesting user gets a zakaah_export realtime event
+with its URL.
+"""
+
+import csv
+import hashlib
+import os
+
+import frappe
+from frappe import _
+
+from techstation_zakaah.zakaah_management.instrumentation import instrument
+
+EXPORT_FORMATS = ("CSV", "XLSX")
+
+# Rows per sheet of an XLSX export, the rest continue on a new sheet
+MAX_XLSX_ROWS = 1_000_000
+
+# Bytes read at a time when hashing the finished file
+HASH_CHUNK_SIZE = 1024 * 1024
+
+DOCSTATUS_LABEL = "CASE {0}.docstatus WHEN 0 THEN 'Draft' WHEN 1 THEN 'Submitted' ELSE 'Cancelled' END"
+
+DATASETS = {
+	"Allocation History": frappe._dict(
+		doctype="Zakaah Allocation History",
+		columns=(
+			"Allocation",
+			"Journal Entry",
+			"Calculation Run",
+			"Company",
+			"Fiscal Year",
+			"Allocated Amount",
+			"Unallocated Amount",
+			"Allocation Date",
+			"Allocated By",
+			"Status",
+		),
+		query=f"""
+			SELECT
+				zah.name,
+				zah.journal_entry,
+				zah.zakaah_calculation_run,
+				zcr.company,
+				zcr.fiscal_year,
+				zah.allocated_amount,
+				zah.unallocated_amount,
+				zah.allocation_date,
+				zah.allocated_by,
+				{DOCSTATUS_LABEL.format("zah")}
+			FROM `tabZakaah Allocation History` zah
+			LEFT JOIN `tabZakaah Calculation Run` zcr ON zcr.name = zah.zakaah_calculation_run
+			WHERE 1=1 {{conditions}}
+			ORDER BY zah.allocation_date, zah.name
+		""",
+		company_field="zcr.company",
+		fiscal_year_field="zcr.fiscal_year",
+	),
+	"Calculation Run Items": frappe._dict(
+		doctype="Zakaah Calculation Run",
+		columns=(
+			"Calculation Run",
+			"Company",
+			"Fiscal Year",
+			"To Date",
+			"Run Status",
+			"Asset Category",
+			"Account",
+			"Account Name",
+			"Balance",
+			"Currency",
+			"Exchange Rate",
+			"Sub Total (Company Currency)",
+		),
+		query=f"""
+			SELECT
+				zcr.name,
+				zcr.company,
+				zcr.fiscal_year,
+				zcr.to_date,
+				{DOCSTATUS_LABEL.format("zcr")},
+				item.asset_category,
+				item.account,
+				item.account_name,
+				item.balance,
+				item.currency,
+				item.exchange_rate,
+				item.sub_total
+			FROM `tabZakaah Calculation Run Item` item
+			INNER JOIN `tabZakaah Calculation Run` zcr
+				ON zcr.name = item.parent AND item.parenttype = 'Zakaah Calculation Run'
+			WHERE 1=1 {{conditions}}
+			ORDER BY zcr.company, zcr.fiscal_year, zcr.name, item.idx
+		""",
+		company_field="zcr.company",
+		fiscal_year_field="zcr.fiscal_year",
+	),
+	"Payment Entries": frappe._dict(
+		doctype="Zakaah Journal Entry Allocation",
+		columns=(
+			"Journal Entry",
+			"Company",
+			"Posting Date",
+			"Total Debit",
+			"Total Allocated",
+			"Unallocated Amount",
+		),
+		query="""
+			SELECT
+				jea.journal_entry,
+				je.company,
+				je.posting_date,
+				jea.total_debit,
+				jea.total_allocated,
+				jea.unallocated_amount
+			FROM `tabZakaah Journal Entry Allocation` jea
+			LEFT JOIN `tabJournal Entry` je ON je.name = jea.journal_entry
+			WHERE 1=1 {conditions}
+			ORDER BY je.posting_date, jea.journal_entry
+		""",
+		company_field="je.company",
+		# Journal entries have no fiscal year, they are filtered on its dates
+		date_field="je.posting_date",
+	),
+}
+
+
+@frappe.whitelist()
+@instrument
+def enqueue_export(dataset, file_format="CSV", company=None, fiscal_year=None):
+	"""Queue the export of dataset for company and fiscal_year, all of them when not given.
+
+	Users restricted to some companies by User Permissions must pick one of
+	them. The file is written by a background job; the calling user gets a
+	zakaah_export realtime event with export_id and either file_url or error.
+	"""
+	definition = get_dataset(dataset)
+	if file_format not in EXPORT_FORMATS:
+		frappe.throw(_("Export format must be one of {0}").format(", ".join(EXPORT_FORMATS)))
+
+	frappe.has_permission(definition.doctype, "export", throw=True)
+	validate_export_company(definition, company)
+
+	export_id = frappe.generate_hash(length=10)
+	frappe.enqueue(
+		"techstation_zakaah.zakaah_management.exports.run_export_job",
+		queue="long",
+		timeout=3600,
+		job_id=f"zakaah_export::{export_id}",
+		export_id=export_id,
+		dataset=dataset,
+		file_format=file_format,
+		company=company,
+		fiscal_year=fiscal_year,
+		user=frappe.session.user,
+	)
+
+	return {"export_id": export_id}
+
+
+def validate_export_company(definition, company):
+	"""Apply the user's Company User Permissions, the export queries read every company otherwise"""
+	from frappe.permissions import get_user_permissions
+
+	permitted = [
+		permission.get("doc")
+		for permission in get_user_permissions().get("Company", [])
+		if not permission.get("applicable_for") or permission.get("applicable_for") == definition.doctype
+	]
+	if not permitted:
+		return
+
+	if not company:
+		frappe.throw(_("Please select a Company to export, you can only export {0}").format(", ".join(permitted)))
+
+	if company not in permitted:
+		frappe.throw(
+			_("You are not permitted to export data of Company {0}").format(company), frappe.PermissionError
+		)
+
+
+def get_dataset(dataset):
+	if dataset not in DATASETS:
+		frappe.throw(_("Unknown export {0}").format(dataset))
+	return DATASETS[dataset]
+
+
+def run_export_job(export_id, dataset, file_format, company=None, fiscal_year=None, user=None):
+	result = {"export_id": export_id, "dataset": dataset, "file_url": None, "rows": 0, "error": None}
+	path = None
+
+	try:
+		file_name = get_file_name(dataset, file_format, company, fiscal_year, export_id)
+		path = frappe.get_site_path("private", "files", file_name)
+
+		result["rows"] = write_export(path, dataset, file_format, company, fiscal_year)
+		result["file_url"] = save_export_file(path, file_name, file_format).file_url
+	except Exception as e:
+		frappe.db.rollback()
+		frappe.log_error(title="Zakaah Export", message=f"Dataset: {dataset}\n\n{frappe.get_traceback()}")
+		if path and os.path.exists(path):
+			os.remove(path)
+		result["error"] = str(e)
+
+	# Published once the File is committed, so the link works when it arrives
+	frappe.publish_realtime("zakaah_export", result, user=user, after_commit=not result["error"])
+	return result
+
+
+def get_file_name(dataset, file_format, company, fiscal_year, export_id):
+	parts = [dataset, company or "All Companies", fiscal_year or "All Years", export_id]
+	name = frappe.scrub(" ".join(parts))
+	return f"{name}.{file_format.lower()}"
+
+
+def write_export(path, dataset, file_format, company=None, fiscal_year=None):
+	"""Write every row of dataset to path, returning the number of rows written"""
+	definition = get_dataset(dataset)
+	query, values = get_export_query(definition, company, fiscal_year)
+	writer = write_csv if file_format == "CSV" else write_xlsx
+	header = [_(column) for column in definition.columns]
+
+	# No other query may run on the connection until the rows are consumed
+	with frappe.db.unbuffered_cursor():
+		rows = frappe.db.sql(query, values, as_iterator=True)
+		return writer(path, header, rows)
+
+
+def get_export_query(definition, company=None, fiscal_year=None):
+	conditions = ""
+	values = {}
+
+	if company:
+		conditions += f" AND {definition.company_field} = %(company)s"
+		values["company"] = company
+
+	if fiscal_year:
+		if definition.fiscal_year_field:
+			conditions += f" AND {definition.fiscal_year_field} = %(fiscal_year)s"
+			values["fiscal_year"] = fiscal_year
+		else:
+			from_date, to_date = frappe.get_cached_value(
+				"Fiscal Year", fiscal_year, ["year_start_date", "year_end_date"]
+			) or (None, None)
+			if not from_date:
+				frappe.throw(_("Fiscal Year {0} does not exist").format(fiscal_year))
+			conditions += f" AND {definition.date_field} BETWEEN %(from_date)s AND %(to_date)s"
+			values.update(from_date=from_date, to_date=to_date)
+
+	return definition.query.format(conditions=conditions), values
+
+
+def write_csv(path, header, rows):
+	count = 0
+	with open(path, "w", newline="", encoding="utf-8") as f:
+		writer = csv.writer(f)
+		writer.writerow(header)
+		for row in rows:
+			writer.writerow(row)
+			count += 1
+	return count
+
+
+def write_xlsx(path, header, rows):
+	from openpyxl import Workbook
+
+	# Write-only workbooks stream rows to disk instead of keeping cells in memory
+	workbook = Workbook(write_only=True)
+	sheet = None
+	count = 0
+
+	for row in rows:
+		if count % MAX_XLSX_ROWS == 0:
+			sheet = workbook.create_sheet(f"Sheet {count // MAX_XLSX_ROWS + 1}")
+			sheet.append(header)
+		sheet.append(row)
+		count += 1
+
+	if sheet is None:
+		workbook.create_sheet("Sheet 1").append(header)
+
+	workbook.save(path)
+	return count
+
+
+def save_export_file(path, file_name, file_format):
+	"""Record a finished export already on disk as a private File.
+
+	File.insert reads the whole file back in before_insert to save and hash
+	it, so the row is written directly with the size and content hash
+	computed from the file in chunks.
+	"""
+	file_doc = frappe.get_doc(
+		{
+			"doctype": "File",
+			"name": frappe.generate_hash(length=10),
+			"file_name": file_name,
+			"file_url": f"/private/files/{file_name}",
+			"file_type": file_format,
+			"is_private": 1,
+			"folder": "Home",
+			"file_size": os.path.getsize(path),
+			"content_hash": get_file_hash(path),
+			"owner": frappe.session.user,
+		}
+	)
+	file_doc.db_insert()
+	return file_doc
+
+
+def get_file_hash(path):
+	content_hash = hashlib.md5()
+	with open(path, "rb") as f:
+		for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+			content_hash.update(chunk)
+	return content_hash.hexdigest()
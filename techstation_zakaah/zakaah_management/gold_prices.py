@@ -0,0 +1,131 @@
+import csv
+import io
+from bisect import bisect_left, bisect_right
+
+import frappe
+from frappe import _
+from frappe.utils import flt, getdate, now
+
+from techstation_zakaah.zakaah_management.instrumentation import instrument
+
+GOLD_PRICE_CACHE_KEY = "zakaah_gold_price_series"
+
+
+def get_gold_price_series():
+	"""Get every Gold Price as two parallel lists sorted by date: (dates, prices).
+
+	The series is loaded with one query, kept in the redis cache until a Gold
+	Price changes and memoised for the rest of the request by frappe.cache, so
+	lookups over many runs do not go back to the database.
+	"""
+	return frappe.cache.get_value(GOLD_PRICE_CACHE_KEY, generator=_load_gold_price_series)
+
+
+def _load_gold_price_series():
+	rows = frappe.db.sql("""
+		SELECT price_date, price_per_gram_24k
+		FROM `tabGold Price`
+		WHERE price_date IS NOT NULL
+		ORDER BY price_date
+	""")
+	return [getdate(row[0]) for row in rows], [flt(row[1]) for row in rows]
+
+
+def get_gold_price(date, exact=False):
+	"""Get (price_date, price) of the latest Gold Price on or before date.
+
+	With exact, only a price for date itself is returned. Returns (None, None)
+	when there is no matching price.
+	"""
+	dates, prices = get_gold_price_series()
+	date = getdate(date)
+
+	index = bisect_right(dates, date) - 1
+	if index < 0 or (exact and dates[index] != date):
+		return None, None
+
+	return dates[index], prices[index]
+
+
+def get_gold_prices_between(from_date, to_date):
+	"""Get [(price_date, price)] for every Gold Price between from_date and to_date, inclusive"""
+	dates, prices = get_gold_price_series()
+	start = bisect_left(dates, getdate(from_date))
+	end = bisect_right(dates, getdate(to_date))
+	return list(zip(dates[start:end], prices[start:end], strict=True))
+
+
+def clear_gold_price_cache():
+	frappe.cache.delete_value(GOLD_PRICE_CACHE_KEY)
+
+
+@frappe.whitelist()
+@instrument
+def import_gold_prices(file_url=None, content=None):
+	"""Import daily gold prices from a CSV file in a single transaction.
+
+	The CSV needs price_date and price_per_gram_24k columns, source is
+	optional. Dates that already have a Gold Price are updated. Either pass
+	the file_url of an uploaded File or the CSV text as content.
+	"""
+	frappe.has_permission("Gold Price", "create", throw=True)
+
+	if file_url:
+		content = frappe.get_doc("File", {"file_url": file_url}).get_content()
+	if isinstance(content, bytes):
+		content = content.decode("utf-8-sig")
+	if not content:
+		frappe.throw(_("Please attach a CSV file with gold prices"))
+
+	prices = {}
+	for line, row in enumerate(csv.DictReader(io.StringIO(content)), start=2):
+		try:
+			price_date = getdate(row["price_date"])
+			price = flt(row["price_per_gram_24k"])
+		except (KeyError, TypeError, ValueError):
+			price_date = None
+
+		if not price_date:
+			frappe.throw(_("Row {0}: price_date and price_per_gram_24k are required").format(line))
+
+		if price <= 0:
+			frappe.throw(_("Row {0}: Gold price must be greater than zero").format(line))
+
+		# A later row for the same date wins
+		prices[price_date] = (price, (row.get("source") or "").strip() or "CSV Import")
+
+	if not prices:
+		return {"imported": 0}
+
+	timestamp = now()
+	user = frappe.session.user
+	values = [
+		(frappe.generate_hash(length=10), timestamp, timestamp, user, user, price_date, "EGP", price, source)
+		for price_date, (price, source) in sorted(prices.items())
+	]
+
+	try:
+		for start in range(0, len(values), 1000):
+			chunk = values[start : start + 1000]
+			frappe.db.sql(
+				"""
+				INSERT INTO `tabGold Price`
+					(name, creation, modified, owner, modified_by,
+					price_date, currency, price_per_gram_24k, source)
+				VALUES {}
+				ON DUPLICATE KEY UPDATE
+					price_per_gram_24k = VALUES(price_per_gram_24k),
+					source = VALUES(source),
+					modified = VALUES(modified),
+					modified_by = VALUES(modified_by)
+			""".format(", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s)"] * len(chunk))),
+				[value for row in chunk for value in row],
+			)
+		frappe.db.commit()
+	except Exception:
+		frappe.db.rollback()
+		raise
+	finally:
+		clear_gold_price_cache()
+
+	return {"imported": len(values)}
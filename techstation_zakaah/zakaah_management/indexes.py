@@ -0,0 +1,39 @@
+import frappe
+
+# Composite indexes matching the filters used by the zakaah queries, as
+# (doctype, fields). Index names follow frappe.db.add_index's default.
+ZAKAAH_INDEXES = [
+	# Allocated amount per journal entry / per run (allocation history, summary rebuild)
+	("Zakaah Allocation History", ["journal_entry", "docstatus"]),
+	("Zakaah Allocation History", ["zakaah_calculation_run", "docstatus", "allocated_amount"]),
+	# Allocation history pages, newest first (keyset on allocation_date, name)
+	("Zakaah Allocation History", ["allocation_date", "name"]),
+	# Gold price lookups by date, covering the price
+	("Gold Price", ["price_date", "price_per_gram_24k"]),
+	# Unreconciled runs of a company
+	("Zakaah Calculation Run", ["company", "outstanding_zakaah"]),
+	# Configuration resolution
+	("Zakaah Assets Configuration", ["company", "fiscal_year"]),
+	# Payment account debits per journal entry
+	("GL Entry", ["voucher_no", "account", "is_cancelled"]),
+	# Balance snapshot validity, entries modified since a snapshot's watermark
+	("GL Entry", ["company", "modified", "posting_date"]),
+]
+
+
+def get_index_name(fields):
+	return "_".join(fields) + "_index"
+
+
+def add_zakaah_indexes():
+	"""Create the zakaah composite indexes that are missing"""
+	for doctype, fields in ZAKAAH_INDEXES:
+		frappe.db.add_index(doctype, fields, index_name=get_index_name(fields))
+
+
+def drop_zakaah_indexes():
+	"""Drop the zakaah composite indexes, used to compare query plans"""
+	for doctype, fields in ZAKAAH_INDEXES:
+		index_name = get_index_name(fields)
+		if frappe.db.has_index(f"tab{doctype}", index_name):
+			frappe.db.sql_ddl(f"ALTER TABLE `tab{doctype}` DROP INDEX `{index_name}`")
@@ -0,0 +1,100 @@
+import functools
+import json
+import random
+import time
+
+import frappe
+
+PERFORMANCE_SAMPLES_KEY = "zakaah_performance_samples"
+
+# Most recent samples kept in the redis ring buffer
+MAX_SAMPLES = 5000
+
+
+def instrument(fn):
+	"""Record wall time, DB time, query count and rows returned for sampled calls of fn.
+
+	Sampling is set per site with zakaah_performance_sample_rate in
+	site_config.json, from 0 (off, the default) to 1 (every call). Samples go
+	to a redis ring buffer read by the Zakaah Performance report. Calls made
+	while another instrumented call is recording count towards the outer call.
+	"""
+	endpoint = f"{fn.__module__}.{fn.__qualname__}"
+
+	@functools.wraps(fn)
+	def wrapper(*args, **kwargs):
+		sample_rate = frappe.conf.get("zakaah_performance_sample_rate")
+		if not sample_rate or frappe.flags.in_zakaah_instrumentation or random.random() >= sample_rate:
+			return fn(*args, **kwargs)
+
+		frappe.flags.in_zakaah_instrumentation = True
+		stats = QueryStats()
+		failed = True
+		start = time.perf_counter()
+		try:
+			with stats:
+				result = fn(*args, **kwargs)
+			failed = False
+			return result
+		finally:
+			frappe.flags.in_zakaah_instrumentation = False
+			record_sample(
+				{
+					"endpoint": endpoint,
+					"timestamp": time.time(),
+					"wall_ms": round((time.perf_counter() - start) * 1000, 3),
+					"db_ms": round(stats.db_time * 1000, 3),
+					"queries": stats.queries,
+					"rows": stats.rows,
+					"failed": failed,
+				}
+			)
+
+	return wrapper
+
+
+class QueryStats:
+	"""Count frappe.db.sql calls, their time and rows returned while active"""
+
+	def __init__(self):
+		self.queries = 0
+		self.rows = 0
+		self.db_time = 0.0
+
+	def __enter__(self):
+		self.sql = frappe.db.sql
+
+		def sql(*args, **kwargs):
+			start = time.perf_counter()
+			try:
+				result = self.sql(*args, **kwargs)
+			finally:
+				self.queries += 1
+				self.db_time += time.perf_counter() - start
+			if isinstance(result, list | tuple):
+				self.rows += len(result)
+			return result
+
+		frappe.db.sql = sql
+		return self
+
+	def __exit__(self, *exc):
+		frappe.db.sql = self.sql
+
+
+def record_sample(sample):
+	try:
+		frappe.cache.lpush(PERFORMANCE_SAMPLES_KEY, json.dumps(sample))
+		frappe.cache.ltrim(PERFORMANCE_SAMPLES_KEY, 0, MAX_SAMPLES - 1)
+	except Exception:
+		# Instrumentation must never fail the call it measures
+		pass
+
+
+def get_samples():
+	"""Get the recorded samples, newest first"""
+	return [json.loads(sample) for sample in frappe.cache.lrange(PERFORMANCE_SAMPLES_KEY, 0, -1) or []]
+
+
+def clear_samples():
+	frappe.cache.delete_value(PERFORMANCE_SAMPLES_KEY)
@@ -0,0 +1,118 @@
+"""Structured, buffered logging for the zakaah module.
+
+Records are kept in memory for the request or background job and written
+to the techstation_zakaah log file (logs/techstation_zakaah.log) once it
+ends, so logging never adds inserts to the user's transaction. Error Log is
+reserved for real exceptions.
+
+Site config:
+	zakaah_log_level: DEBUG, INFO, WARNING (default) or ERROR
+	zakaah_log_sample_rate: share of DEBUG and INFO records kept, 0 to 1 (default 1)
+	zakaah_log_retention_days: age after which zakaah Error Logs are pruned (default 30)
+"""
+
+import json
+import logging
+import random
+
+import frappe
+from frappe.utils import add_days, cint, flt, now_datetime
+
+LEVELS = {
+	"DEBUG": logging.DEBUG,
+	"INFO": logging.INFO,
+	"WARNING": logging.WARNING,
+	"ERROR": logging.ERROR,
+}
+
+# Records buffered before a flush is forced, for long scripts without a request
+MAX_BUFFERED_RECORDS = 100
+
+# Error Log titles written by this app, including the debug titles of older versions
+ERROR_LOG_TITLES = (
+	"Zakaah Payments Validate Debug",
+	"Import Journal Entries SQL Debug",
+	"Import Journal Entries Debug",
+	"Import Journal Entries",
+	"Get Calculation Runs",
+	"Allocate Payments",
+	"Allocation Over-limit Prevention",
+	"Get Allocation History",
+	"Get Total Allocated",
+	"Get Payment Accounts",
+	"Allocation History Update Error",
+	"Payment Account Debit - Date Range Mismatch",
+	"Payment Account Debit Error",
+	"Balance Calculation",
+	"Load Payment Accounts Error",
+	"Load Journal Entries Error",
+	"Journal Entries Error",
+	"Account Balance",
+	"Zakaah Config",
+	"Zakaah Gold Price",
+	"Zakaah Calculation Job Error",
+	"Zakaah Calculation Queue Error",
+	"Zakaah Batch Calculation",
+	"Zakaah Export",
+)
+
+
+def debug(title, **context):
+	log("DEBUG", title, **context)
+
+
+def info(title, **context):
+	log("INFO", title, **context)
+
+
+def warning(title, **context):
+	log("WARNING", title, **context)
+
+
+def log(level, title, **context):
+	"""Buffer a record if level is enabled for the site, DEBUG and INFO records are sampled"""
+	if LEVELS[level] < get_level():
+		return
+
+	if LEVELS[level] < logging.WARNING:
+		sample_rate = flt(frappe.conf.get("zakaah_log_sample_rate", 1))
+		if sample_rate < 1 and random.random() >= sample_rate:
+			return
+
+	buffer = frappe.flags.setdefault("zakaah_log_buffer", [])
+	buffer.append((LEVELS[level], {"time": str(now_datetime()), "level": level, "title": title, **context}))
+
+	if len(buffer) >= MAX_BUFFERED_RECORDS:
+		flush()
+
+
+def get_level():
+	return LEVELS.get(str(frappe.conf.get("zakaah_log_level") or "WARNING").upper(), logging.WARNING)
+
+
+def flush(*args, **kwargs):
+	"""Write buffered records to the log file; runs after every request and background job"""
+	buffer = frappe.flags.pop("zakaah_log_buffer", None)
+	if not buffer:
+		return
+
+	logger = frappe.logger("techstation_zakaah", allow_site=True)
+	for level, record in buffer:
+		logger.log(level, json.dumps(record, default=str))
+
+
+def prune_error_logs():
+	"""Delete zakaah Error Logs older than the retention period, run daily.
+
+	Logs written as log_error(message, title) by older versions have the
+	title stored as their error text instead, so both columns are matched.
+	"""
+	days = cint(frappe.conf.get("zakaah_log_retention_days")) or 30
+	frappe.db.sql(
+		"""
+		DELETE FROM `tabError Log`
+		WHERE creation < %(before)s
+		AND (method IN %(titles)s OR error IN %(titles)s)
+	""",
+		{"titles": ERROR_LOG_TITLES, "before": add_days(now_datetime(), -days)},
+	)
@@ -0,0 +1,28 @@
+frappe.query_reports["Zakaah Performance"] = {
+    filters: [
+        {
+            fieldname: "endpoint",
+            label: __("Endpoint"),
+            fieldtype: "Data"
+        },
+        {
+            fieldname: "hours",
+            label: __("Last Hours"),
+            fieldtype: "Int",
+            description: __("Only samples from the last number of hours, all samples if empty")
+        }
+    ],
+
+    onload(report) {
+        report.page.add_inner_button(__("Clear Samples"), function() {
+            frappe.confirm(__("Delete all recorded performance samples?"), function() {
+                frappe.call({
+                    method: "techstation_zakaah.zakaah_management.report.zakaah_performance.zakaah_performance.clear_performance_samples",
+                    callback: function() {
+                        report.refresh();
+                    }
+                });
+            });
+        });
+    }
+};
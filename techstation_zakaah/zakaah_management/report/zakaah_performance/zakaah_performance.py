@@ -0,0 +1,76 @@
+import time
+
+import frappe
+from frappe import _
+
+from techstation_zakaah.zakaah_management.instrumentation import clear_samples, get_samples
+
+
+def execute(filters=None):
+	filters = frappe._dict(filters or {})
+	samples = get_samples()
+
+	if filters.endpoint:
+		samples = [s for s in samples if filters.endpoint in s["endpoint"]]
+	if filters.hours:
+		since = time.time() - int(filters.hours) * 3600
+		samples = [s for s in samples if s["timestamp"] >= since]
+
+	by_endpoint = {}
+	for sample in samples:
+		by_endpoint.setdefault(sample["endpoint"], []).append(sample)
+
+	data = [get_endpoint_row(endpoint, rows) for endpoint, rows in sorted(by_endpoint.items())]
+	data.sort(key=lambda row: row["p95_ms"], reverse=True)
+
+	message = None
+	if not frappe.conf.get("zakaah_performance_sample_rate"):
+		message = _("Sampling is off. Set zakaah_performance_sample_rate in site config to record samples.")
+
+	return get_columns(), data, message
+
+
+def get_endpoint_row(endpoint, samples):
+	wall = sorted(s["wall_ms"] for s in samples)
+	count = len(samples)
+	return {
+		"endpoint": endpoint,
+		"calls": count,
+		"failed": sum(1 for s in samples if s["failed"]),
+		"p50_ms": percentile(wall, 50),
+		"p95_ms": percentile(wall, 95),
+		"p99_ms": percentile(wall, 99),
+		"max_ms": wall[-1],
+		"avg_db_ms": sum(s["db_ms"] for s in samples) / count,
+		"avg_queries": sum(s["queries"] for s in samples) / count,
+		"max_queries": max(s["queries"] for s in samples),
+		"avg_rows": sum(s["rows"] for s in samples) / count,
+	}
+
+
+def percentile(values, pct):
+	"""Nearest-rank percentile of sorted values"""
+	rank = max(1, -(-len(values) * pct // 100))
+	return values[int(rank) - 1]
+
+
+def get_columns():
+	return [
+		{"label": _("Endpoint"), "fieldname": "endpoint", "fieldtype": "Data", "width": 420},
+		{"label": _("Calls"), "fieldname": "calls", "fieldtype": "Int", "width": 80},
+		{"label": _("Failed"), "fieldname": "failed", "fieldtype": "Int", "width": 80},
+		{"label": _("p50 (ms)"), "fieldname": "p50_ms", "fieldtype": "Float", "width": 100},
+		{"label": _("p95 (ms)"), "fieldname": "p95_ms", "fieldtype": "Float", "width": 100},
+		{"label": _("p99 (ms)"), "fieldname": "p99_ms", "fieldtype": "Float", "width": 100},
+		{"label": _("Max (ms)"), "fieldname": "max_ms", "fieldtype": "Float", "width": 100},
+		{"label": _("Avg DB (ms)"), "fieldname": "avg_db_ms", "fieldtype": "Float", "width": 110},
+		{"label": _("Avg Queries"), "fieldname": "avg_queries", "fieldtype": "Float", "width": 110},
+		{"label": _("Max Queries"), "fieldname": "max_queries", "fieldtype": "Int", "width": 110},
+		{"label": _("Avg Rows"), "fieldname": "avg_rows", "fieldtype": "Float", "width": 100},
+	]
+
+
+@frappe.whitelist()
+def clear_performance_samples():
+	frappe.only_for("System Manager")
+	clear_samples()
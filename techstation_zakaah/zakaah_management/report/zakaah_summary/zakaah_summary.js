@@ -0,0 +1,121 @@
+frappe.query_reports["Zakaah Summary"] = {
+    filters: [
+        {
+            fieldname: "company",
+            label: __("Company"),
+            fieldtype: "Link",
+            options: "Company"
+        },
+        {
+            fieldname: "fiscal_year",
+            label: __("Fiscal Year"),
+            fieldtype: "Link",
+            options: "Fiscal Year"
+        },
+        {
+            fieldname: "status",
+            label: __("Status"),
+            fieldtype: "Select",
+            options: "\nNot Due\nDue\nPartially Paid\nPaid"
+        }
+    ],
+
+    onload(report) {
+        report.page.add_inner_button(__("Refresh Summaries"), function() {
+            frappe.call({
+                method: "techstation_zakaah.zakaah_management.report.zakaah_summary.zakaah_summary.refresh_summaries",
+                freeze: true,
+                callback: function() {
+                    report.refresh();
+                }
+            });
+        });
+
+        report.page.add_inner_button(__("Export Audit Data"), function() {
+            show_export_dialog(report);
+        });
+    }
+};
+
+function show_export_dialog(report) {
+    let dialog = new frappe.ui.Dialog({
+        title: __("Export Audit Data"),
+        fields: [
+            {
+                fieldname: "dataset",
+                label: __("Data"),
+                fieldtype: "Select",
+                options: ["Allocation History", "Calculation Run Items", "Payment Entries"],
+                default: "Allocation History",
+                reqd: 1
+            },
+            {
+                fieldname: "file_format",
+                label: __("Format"),
+                fieldtype: "Select",
+                options: ["CSV", "XLSX"],
+                default: "CSV",
+                reqd: 1
+            },
+            {
+                fieldname: "company",
+                label: __("Company"),
+                fieldtype: "Link",
+                options: "Company",
+                default: report.get_filter_value("company"),
+                description: __("Leave empty to export every company")
+            },
+            {
+                fieldname: "fiscal_year",
+                label: __("Fiscal Year"),
+                fieldtype: "Link",
+                options: "Fiscal Year",
+                default: report.get_filter_value("fiscal_year"),
+                description: __("Leave empty to export every year")
+            }
+        ],
+        primary_action_label: __("Export"),
+        primary_action(values) {
+            frappe.call({
+                method: "techstation_zakaah.zakaah_management.exports.enqueue_export",
+                args: values,
+                callback: function(r) {
+                    if (!r.message) return;
+                    dialog.hide();
+                    watch_export(r.message.export_id);
+                    frappe.show_alert({
+                        message: __("Export queued, you will be notified when the file is ready"),
+                        indicator: "blue"
+                    }, 5);
+                }
+            });
+        }
+    });
+    dialog.show();
+}
+
+function watch_export(export_id) {
+    let handler = function(data) {
+        if (data.export_id !== export_id) return;
+        frappe.realtime.off("zakaah_export", handler);
+
+        if (data.error) {
+            frappe.msgprint({
+                title: __("Export Failed"),
+                message: data.error,
+                indicator: "red"
+            });
+            return;
+        }
+
+        frappe.msgprint({
+            title: __("Export Ready"),
+            message: __("{0} rows exported. {1}", [
+                format_number(data.rows, null, 0),
+                `<a href="${encodeURI(data.file_url)}" target="_blank">${__("Download")}</a>`
+            ]),
+            indicator: "green"
+        });
+    };
+    frappe.realtime.on("zakaah_export", handler);
+}
@@ -0,0 +1,99 @@
+import frappe
+from frappe import _
+from frappe.utils import flt
+
+from techstation_zakaah.zakaah_management.doctype.zakaah_year_summary.zakaah_year_summary import (
+	refresh_year_summaries,
+)
+
+
+def execute(filters=None):
+	"""Zakaah per company and fiscal year, read from the precomputed Zakaah Year Summary"""
+	filters = frappe._dict(filters or {})
+
+	conditions = {}
+	for field in ("company", "fiscal_year", "status"):
+		if filters.get(field):
+			conditions[field] = filters.get(field)
+
+	data = frappe.get_all(
+		"Zakaah Year Summary",
+		filters=conditions,
+		fields=[column["fieldname"] for column in get_columns()],
+		order_by="fiscal_year desc, company asc",
+	)
+
+	return get_columns(), data, None, get_chart(data), get_report_summary(data)
+
+
+def get_columns():
+	return [
+		{"label": _("Company"), "fieldname": "company", "fieldtype": "Link", "options": "Company", "width": 180},
+		{"label": _("Fiscal Year"), "fieldname": "fiscal_year", "fieldtype": "Link", "options": "Fiscal Year", "width": 110},
+		{
+			"label": _("Latest Submitted Run"),
+			"fieldname": "calculation_run",
+			"fieldtype": "Link",
+			"options": "Zakaah Calculation Run",
+			"width": 160,
+		},
+		{"label": _("Submitted Runs"), "fieldname": "run_count", "fieldtype": "Int", "width": 70},
+		{"label": _("Total Assets"), "fieldname": "total_assets", "fieldtype": "Currency", "width": 140},
+		{"label": _("Gold Price / g"), "fieldname": "gold_price_per_gram_24k", "fieldtype": "Currency", "width": 120},
+		{"label": _("Assets in Gold (g)"), "fieldname": "assets_in_gold_grams", "fieldtype": "Float", "width": 130},
+		{"label": _("Nisab Met"), "fieldname": "nisab_met", "fieldtype": "Check", "width": 90},
+		{"label": _("Total Zakaah"), "fieldname": "total_zakaah", "fieldtype": "Currency", "width": 130},
+		{"label": _("Paid"), "fieldname": "paid_zakaah", "fieldtype": "Currency", "width": 130},
+		{"label": _("Outstanding"), "fieldname": "outstanding_zakaah", "fieldtype": "Currency", "width": 130},
+		{"label": _("Status"), "fieldname": "status", "fieldtype": "Data", "width": 110},
+		{"label": _("Allocations"), "fieldname": "allocation_count", "fieldtype": "Int", "width": 100},
+		{"label": _("Last Allocation"), "fieldname": "last_allocation_date", "fieldtype": "Datetime", "width": 160},
+	]
+
+
+def get_chart(data):
+	if not data:
+		return None
+
+	by_year = {}
+	for row in data:
+		totals = by_year.setdefault(row.fiscal_year, [0, 0])
+		totals[0] += flt(row.paid_zakaah)
+		totals[1] += flt(row.outstanding_zakaah)
+
+	years = sorted(by_year)
+	return {
+		"data": {
+			"labels": years,
+			"datasets": [
+				{"name": _("Paid"), "values": [by_year[year][0] for year in years]},
+				{"name": _("Outstanding"), "values": [by_year[year][1] for year in years]},
+			],
+		},
+		"type": "bar",
+		"barOptions": {"stacked": 1},
+		"fieldtype": "Currency",
+	}
+
+
+def get_report_summary(data):
+	total = sum(flt(row.total_zakaah) for row in data)
+	paid = sum(flt(row.paid_zakaah) for row in data)
+	outstanding = sum(flt(row.outstanding_zakaah) for row in data)
+	return [
+		{"value": total, "label": _("Total Zakaah"), "datatype": "Currency", "indicator": "Blue"},
+		{"value": paid, "label": _("Paid"), "datatype": "Currency", "indicator": "Green"},
+		{
+			"value": outstanding,
+			"label": _("Outstanding"),
+			"datatype": "Currency",
+			"indicator": "Red" if outstanding > 0 else "Green",
+		},
+	]
+
+
+@frappe.whitelist()
+def refresh_summaries():
+	"""Rebuild every summary now instead of waiting for the daily job"""
+	frappe.only_for(("System Manager", "Zakaah Manager"))
+	refresh_year_summaries()
@@ -0,0 +1,134 @@
+from itertools import product
+
+import frappe
+from frappe import _
+from frappe.utils import cint, flt
+
+from techstation_zakaah.zakaah_management.instrumentation import instrument
+from techstation_zakaah.zakaah_management.utils import parse_list
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+# Nisab is 85 grams of 24k gold per owner
+NISAB_GRAMS_PER_OWNER = 85
+ZAKAAH_RATE = 0.025
+
+# Largest number of scenarios one evaluate_run_scenarios call may produce
+MAX_SCENARIOS = 100000
+
+
+def evaluate_nisab_and_zakaah(total_assets, gold_prices, owners_counts, rate=ZAKAAH_RATE):
+	"""Evaluate nisab and zakaah for many scenarios at once.
+
+	Arguments are scalars or equal-length sequences; scalars and one-element
+	sequences apply to every scenario. Gold prices must be greater than zero.
+
+	Returns a dict of lists: nisab_value, assets_in_gold_grams, meets_nisab
+	and zakaah_amount. NumPy is used when it is installed, otherwise the same
+	arithmetic runs in pure Python.
+	"""
+	if np is not None:
+		assets, prices, owners = np.broadcast_arrays(
+			np.asarray(total_assets, dtype=float),
+			np.asarray(gold_prices, dtype=float),
+			np.asarray(owners_counts, dtype=float),
+		)
+		if (prices <= 0).any():
+			frappe.throw(_("Gold price must be greater than zero"))
+
+		nisab_grams = owners * NISAB_GRAMS_PER_OWNER
+		grams = assets / prices
+		meets_nisab = grams >= nisab_grams
+		return {
+			"nisab_value": np.atleast_1d(nisab_grams * prices).tolist(),
+			"assets_in_gold_grams": np.atleast_1d(grams).tolist(),
+			"meets_nisab": np.atleast_1d(meets_nisab).tolist(),
+			"zakaah_amount": np.atleast_1d(np.where(meets_nisab, assets * rate, 0.0)).tolist(),
+		}
+
+	assets, prices, owners = broadcast(total_assets, gold_prices, owners_counts)
+	if any(price <= 0 for price in prices):
+		frappe.throw(_("Gold price must be greater than zero"))
+
+	result = {"nisab_value": [], "assets_in_gold_grams": [], "meets_nisab": [], "zakaah_amount": []}
+	for asset, price, owner in zip(assets, prices, owners, strict=True):
+		nisab_grams = owner * NISAB_GRAMS_PER_OWNER
+		grams = asset / price
+		meets_nisab = grams >= nisab_grams
+		result["nisab_value"].append(nisab_grams * price)
+		result["assets_in_gold_grams"].append(grams)
+		result["meets_nisab"].append(meets_nisab)
+		result["zakaah_amount"].append(asset * rate if meets_nisab else 0.0)
+
+	return result
+
+
+def broadcast(*values):
+	"""Pure Python broadcasting of scalars and equal-length sequences to lists of floats"""
+	values = [[flt(v) for v in value] if isinstance(value, list | tuple) else [flt(value)] for value in values]
+	length = max(len(value) for value in values)
+
+	for value in values:
+		if len(value) not in (1, length):
+			frappe.throw(_("All scenario inputs must have the same length"))
+
+	return [value * length if len(value) == 1 else value for value in values]
+
+
+@frappe.whitelist()
+@instrument
+def evaluate_run_scenarios(run, owners_counts=None, gold_price_dates=None, gold_prices=None, asset_adjustments=None):
+	"""Evaluate what-if scenarios on the stored balances of a Zakaah Calculation Run.
+
+	Every combination of owners count, gold price and asset adjustment is
+	evaluated. Gold prices come from gold_prices and from the Gold Price on
+	or before each of gold_price_dates; the run's own values are used for
+	any input that is not given. Asset adjustments are added to the run's
+	total assets. The ledger is not read.
+
+	Returns the run's total assets and one list per column, a row per scenario.
+	"""
+	from techstation_zakaah.zakaah_management.gold_prices import get_gold_price
+
+	doc = frappe.get_doc("Zakaah Calculation Run", run)
+	doc.check_permission("read")
+
+	owners_counts = [cint(v) for v in parse_list(owners_counts)] or [doc.owners_count or 1]
+	asset_adjustments = [flt(v) for v in parse_list(asset_adjustments)] or [0.0]
+
+	prices = [(None, flt(price)) for price in parse_list(gold_prices)]
+	for date in parse_list(gold_price_dates):
+		price_date, price = get_gold_price(date)
+		if not price:
+			frappe.throw(_("No gold price found on or before {0}").format(date))
+		prices.append((str(price_date), price))
+	if not prices:
+		prices = [(str(doc.gold_price_date) if doc.gold_price_date else None, flt(doc.gold_price_per_gram_24k))]
+
+	count = len(owners_counts) * len(prices) * len(asset_adjustments)
+	if count > MAX_SCENARIOS:
+		frappe.throw(_("{0} scenarios requested, at most {1} are allowed").format(count, MAX_SCENARIOS))
+
+	total_assets = flt(doc.total_assets)
+	scenarios = {
+		"owners_count": [],
+		"gold_price_date": [],
+		"gold_price": [],
+		"asset_adjustment": [],
+		"total_assets": [],
+	}
+	for owners_count, (price_date, price), adjustment in product(owners_counts, prices, asset_adjustments):
+		scenarios["owners_count"].append(owners_count)
+		scenarios["gold_price_date"].append(price_date)
+		scenarios["gold_price"].append(price)
+		scenarios["asset_adjustment"].append(adjustment)
+		scenarios["total_assets"].append(total_assets + adjustment)
+
+	scenarios.update(
+		evaluate_nisab_and_zakaah(scenarios["total_assets"], scenarios["gold_price"], scenarios["owners_count"])
+	)
+
+	return {"run": doc.name, "total_assets": total_assets, "scenarios": scenarios}
@@ -0,0 +1,19 @@
+import json
+
+
+def parse_list(value):
+	"""Parse a list argument sent as a list, a JSON array string or a comma separated string.
+
+	Strings are stripped and empty items dropped; a single non-list value
+	becomes a list of one.
+	"""
+	if isinstance(value, str):
+		value = value.strip()
+		value = json.loads(value) if value.startswith("[") else value.split(",")
+	if value is None:
+		return []
+	if not isinstance(value, list | tuple):
+		value = [value]
+
+	values = [v.strip() if isinstance(v, str) else v for v in value]
+	return [v for v in values if v not in (None, "")]